@@ -1,6 +1,9 @@
-import featuremonkey
-import inspect
+import types
 from functools import wraps
+from . import timing, trace
+#featuremonkey and inspect are imported on demand: tasks like "ape cd" are
+#invoked interactively and help is answered from the task index, both
+#should not pay for them (see ``ape.test.imports``)
 
 __version__ = '0.4.0'
 __author__ = 'Hendrik Speidel <hendrik@schnapptack.de>'
@@ -20,6 +23,8 @@ class InvalidAccess(Exception): pass
 
 class InvalidTask(Exception): pass
 
+class CyclicRequirement(Exception): pass
+
 def _get_invalid_accessor(func_name):
 
     def invalid_accessor(*args, **kws):
@@ -29,11 +34,23 @@ def _get_invalid_accessor(func_name):
             )
         )
 
+    #decorators applied on top of ``register`` need the name of the task
+    invalid_accessor.task_name = func_name
     return invalid_accessor
 
+def unwrap(func):
+    '''
+    helper to get the task function wrapped by ``Tasks.get_task``:
+    wrappers refer to the function they wrap by ``__wrapped__``
+    '''
+    while hasattr(func, '__wrapped__'):
+        func = func.__wrapped__
+    return func
+
 def get_signature(name, func):
     '''helper to generate a readable signature for a function'''
-    args, varargs, keywords, defaults = inspect.getargspec(func)
+    import inspect
+    args, varargs, keywords, defaults = inspect.getargspec(unwrap(func))
     defaults = defaults or []
     posargslen = len(args) - len(defaults)
     if varargs is None and keywords is None:
@@ -52,6 +69,23 @@ def get_signature(name, func):
     else:
         raise InvalidTask('ape tasks may not use **kwargs')
 
+def get_task_spec(func):
+    '''
+    helper to describe how command line arguments are bound to a task:
+    returns a dict containing the names of the arguments (``args``),
+    the ``defaults`` of the trailing keyword arguments and whether the
+    task accepts varargs only (``proxy``)
+    '''
+    import inspect
+    args, varargs, keywords, defaults = inspect.getargspec(unwrap(func))
+    defaults = list(defaults or [])
+    if varargs is None and keywords is None:
+        return dict(args=args, defaults=defaults, proxy=False)
+    elif not args and varargs and not keywords and not defaults:
+        return dict(args=[], defaults=[], proxy=True)
+    else:
+        raise InvalidTask('ape tasks may not use **kwargs')
+
 
 class Tasks(object):
     '''
@@ -63,33 +97,141 @@ class Tasks(object):
         from . import _tasks
         self._tasks = _tasks
         self._helper_names = set()
+        #task name -> names of the tasks it requires
+        self._requirements = dict()
+        #task name -> options of incremental tasks (see ``ape.incremental``)
+        self._incremental = dict()
+        #task name -> memoization scope of helpers (see ``ape.memo``)
+        self._memoized = dict()
+        #names registered since the last superimposition
+        self._pending_names = []
+        #(module name, names introduced or refined) in composition order
+        self._composition = []
+        self._loader = None
 
-    def register(self, func):
+    def register(self, func=None, requires=None):
         '''register a task - 
         typically used as a decorator to the task function.
         
         If a task by that name already exists,
         a TaskAlreadyRegistered exception is raised.
+
+        ``requires`` names tasks that are executed before the task when it is
+        invoked from the command line (see ``ape.dag``), e.g.::
+
+            @tasks.register(requires=['build', 'migrate'])
+            def deploy():
+                ...
         '''
+        if func is None:
+            return lambda func: self.register(func, requires=requires)
         if hasattr(self._tasks, func.__name__):
             raise TaskAlreadyRegistered(func.__name__)
         setattr(self._tasks, func.__name__, func)
+        self._pending_names.append(func.__name__)
+        if requires:
+            self.require(func.__name__, *requires)
         return _get_invalid_accessor(func.__name__)
 
-    def register_helper(self, func):
+    def register_helper(self, func=None, requires=None, memoize=None):
         '''a helper is a task that is not directly exposed to
         the command line
+
+        ``memoize`` caches the results of the helper (and of its refinements)
+        per arguments, see ``ape.memo`` for the available scopes, e.g.::
+
+            @tasks.register_helper(memoize='invocation')
+            def get_containers():
+                ...
         '''
+        if func is None:
+            return lambda func: self.register_helper(func, requires=requires, memoize=memoize)
+        if memoize is not None:
+            from .memo import check_scope
+            check_scope(memoize)
+            self._memoized[func.__name__] = memoize
         self._helper_names.add(func.__name__)
-        return self.register(func)
+        return self.register(func, requires=requires)
+
+    def require(self, name, *requirements):
+        '''
+        add requirements to the task identified by name -
+        e.g. in a feature refining the task
+        '''
+        #the requiring module touches the task (see ``get_composition``)
+        self._pending_names.append(name)
+        names = self._requirements.setdefault(name, [])
+        for requirement in requirements:
+            if requirement not in names:
+                names.append(requirement)
+
+    def get_requirements(self, name):
+        '''return the names of the tasks required by task name'''
+        return list(self._requirements.get(name, []))
+
+    def incremental(self, inputs, outputs=(), content=False):
+        '''
+        decorator to make a task incremental: it is skipped if
+        neither the files matching ``inputs`` nor those matching ``outputs``
+        changed since it last succeeded with the same arguments, e.g.::
+
+            @tasks.register
+            @tasks.incremental(inputs=['assets/*.scss'], outputs=['static/css'])
+            def build_css():
+                ...
+
+        Patterns are relative to ``PRODUCT_DIR``. Files are compared by
+        mtime and size; with ``content`` set by the hash of their content.
+        Refinements of the task are skipped as well (see ``ape.incremental``).
+        The decorator may be placed above ``register`` as well.
+        '''
+        def decorator(func):
+            self._incremental[getattr(func, 'task_name', func.__name__)] = dict(
+                inputs=list(inputs),
+                outputs=list(outputs),
+                content=content,
+            )
+            return func
+        return decorator
+
+    def is_helper(self, name):
+        '''check if the task identified by name is a helper'''
+        return name in self._helper_names
+
+    def get_composition(self):
+        '''
+        return the superimposed task modules as list of
+        (module name, names introduced or refined by the module) tuples
+        '''
+        return list(self._composition)
+
+    def get_modules(self, name):
+        '''
+        return the names of the superimposed task modules that introduced
+        or refined the task identified by name, in composition order
+        '''
+        return [module_name for module_name, names in self._composition if name in names]
+
+    def set_loader(self, loader):
+        '''
+        install a loader for lazy composition.
+
+        ``loader(name)`` is called before task ``name`` is looked up and must
+        superimpose all task modules needed to compose it.
+        ``loader(None)`` must superimpose everything.
+        '''
+        self._loader = loader
 
-    def get_tasks(self):
+    def get_tasks(self, include_helpers=False):
         '''
         return tasks as list of (name, function) tuples
         '''
+        import inspect
+        if self._loader is not None:
+            self._loader(None)
         def predicate(item):
-            return (inspect.isfunction(item) and 
-                item.__name__ not in self._helper_names
+            return (inspect.isfunction(item) and
+                (include_helpers or item.__name__ not in self._helper_names)
             )
         return inspect.getmembers(self._tasks, predicate)
 
@@ -97,38 +239,30 @@ class Tasks(object):
         '''get task identified by name or raise TaskNotFound if there
         is no such task
         '''
+        if self._loader is not None:
+            self._loader(name)
         if not include_helpers and name in self._helper_names:
             raise TaskNotFound(name)
         try:
-            return getattr(self._tasks, name)
+            task = getattr(self._tasks, name)
         except AttributeError:
             raise TaskNotFound(name)
+        if name in self._incremental:
+            from .incremental import make_incremental
+            task = make_incremental(name, task, **self._incremental[name])
+        if name in self._memoized:
+            from .memo import make_memoized
+            task = make_memoized(name, task, self._memoized[name])
+        if trace.is_enabled() and isinstance(task, types.FunctionType):
+            task = trace.wrap_task(name, task, self.get_modules(name))
+        if timing.is_enabled() and isinstance(task, types.FunctionType):
+            task = timing.wrap_task(name, task, self.get_modules(name))
+        return task
 
     def help(self, taskname=None):
         '''list tasks or provide help for specific task'''
-        if not taskname:
-            print inspect.getdoc(self._tasks)
-            print
-            print 'Available tasks:'
-            print
-            for task in self.get_tasks():
-                print '  ' + get_signature(*task)
-                help_msg = inspect.getdoc(task[1]) or ''
-                help_msg = help_msg.split('\n')[0]
-                print '    ' + help_msg
-                print
-        else:
-            try:
-                task = self.get_task(taskname)
-                print SHORT_HEADER
-                print get_signature(task.__name__, task)
-                print
-                print inspect.getdoc(task)
-                print
-                print 'defined in: ' + inspect.getfile(task)
-                print
-            except TaskNotFound:
-                print 'Task "%s" not found! Use "ape help" to get usage information.' % taskname
+        from .index import TaskIndex
+        TaskIndex.from_registry(self).help(taskname)
 
     def __getattr__(self, name):
         '''simple proxy to tasks module
@@ -139,7 +273,15 @@ class Tasks(object):
 
     def superimpose(self, module):
         '''superimpose a task module on registered tasks'''
+        names = self._pending_names
+        self._pending_names = []
+        for attrname in dir(module):
+            if attrname.startswith(('introduce_', 'refine_', 'child_')):
+                names.append(attrname.split('_', 1)[1])
+        import featuremonkey
         featuremonkey.compose(module, self._tasks)
-        self._tasks.FEATURE_SELECTION.append(module.__name__)
+        if module.__name__ not in self._tasks.FEATURE_SELECTION:
+            self._tasks.FEATURE_SELECTION.append(module.__name__)
+        self._composition.append((module.__name__, names))
 
 tasks = Tasks()
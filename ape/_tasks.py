@@ -27,7 +27,7 @@ def explain_feature(featurename):
     import os
     import featuremonkey
     import importlib
-    import subprocess
+    from ape import gitinfo
 
     def guess_version(feature_module):
         if hasattr(feature_module, '__version__'):
@@ -36,28 +36,6 @@ def explain_feature(featurename):
             return feature_module.get_version()
         return 'unable to determine version: please add __version__ or get_version() to this feature module!'
 
-    def git_rev(module):
-        stdout, stderr = subprocess.Popen(
-            ["git", "rev-parse", "HEAD"],
-            cwd=os.path.dirname(module.__file__),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        ).communicate()
-        if 'Not a git repo' in stderr:
-            return '-'
-        else:
-            return stdout.strip()
-
-    def git_changes(module):
-        stdout = subprocess.Popen(
-            ["git", "diff", "--name-only"],
-            cwd=os.path.dirname(module.__file__),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        ).communicate()[0]
-        return stdout.strip() or '-'
-        
-        
     if featurename in featuremonkey.get_features_from_equation_file(os.environ['PRODUCT_EQUATION_FILENAME']): 
         print
         print featurename
@@ -68,6 +46,7 @@ def explain_feature(featurename):
             feature_module = importlib.import_module(featurename)
         except ImportError:
             print 'Error: unable to import feature "%s"' % featurename
+            return
 
         print 'Location: %s' % os.path.dirname(feature_module.__file__)
         print
@@ -77,9 +56,10 @@ def explain_feature(featurename):
         else:
             print 'Version: %s' % str(guess_version(feature_module))
             print
-            print 'git: %s' % git_rev(feature_module)
+            rev, changes = gitinfo.describe(os.path.dirname(feature_module.__file__))
+            print 'git: %s' % rev
             print
-            print 'git changed: %s' % '\n\t\t'.join(git_changes(feature_module).split('\n'))    
+            print 'git changed: %s' % '\n\t\t'.join(changes.split('\n'))
     else:
         print 'No feature named ' + featurename
    
@@ -91,12 +71,25 @@ def explain_features():
 
     if the feature is located inside a git repository, this will also print the git-rev and modified files
     '''
-    from ape import tasks
+    from ape import tasks, gitinfo
     import featuremonkey
+    import importlib
     import os
-    
+
     featurenames = featuremonkey.get_features_from_equation_file(os.environ['PRODUCT_EQUATION_FILENAME'])
 
+    #probe each git repository once - concurrently
+    locations = []
+    for featurename in featurenames:
+        if '.features.' in featurename:
+            #subfeatures share the repository of their parent
+            continue
+        try:
+            locations.append(os.path.dirname(importlib.import_module(featurename).__file__))
+        except ImportError:
+            pass
+    gitinfo.prefetch(locations)
+
     for featurename in featurenames:
         tasks.explain_feature(featurename)
 
@@ -0,0 +1,237 @@
+'''
+run tasks on many products in one go::
+
+    python -m ape.batch <manifest> [--jobs N]
+
+every line of the manifest ("-" to read it from stdin) contains a poi,
+a task and its arguments, e.g.::
+
+    herbert:website deploy --force 1
+
+Every distinct product is activated and composed exactly once: for each of them
+an ape daemon (see ``ape.daemon``) is started inside the activated product
+environment. Jobs are then sent to the daemons with bounded concurrency;
+their output is streamed prefixed with the job.
+'''
+import os
+import sys
+import time
+import shlex
+import threading
+import subprocess
+from multiprocessing.pool import ThreadPool
+from ape import client
+
+#activates the product given in APE_BATCH_POI, enters its directory like aperun
+#and serves its tasks
+ACTIVATE_AND_SERVE = '''
+set --
+source "${APE_GLOBAL_DIR}/activape" > /dev/null || exit 1
+ape zap "${APE_BATCH_POI}" > /dev/null || exit 1
+[ -n "${PRODUCT_EQUATION_FILENAME}" ] || exit 1
+exec python -m ape.daemon --timeout %(timeout)d
+'''
+
+SERVING_PREFIXES = ('serving ape at ', 'ape is already served at ')
+
+#set by activape and "ape switch" - see deactivape
+ACTIVATION_VARIABLES = (
+    'APE_ACTIVE',
+    'APE_USE_DAEMON',
+    'APE_ENVIRONMENT',
+    'APE_CONTAINER_VENV',
+    'PRODUCT_EQUATION_FILENAME',
+    'PRODUCT_CONTEXT_FILENAME',
+    'PRODUCT_DIR',
+    'CONTAINER_DIR',
+    'PRODUCT_NAME',
+    'CONTAINER_NAME',
+)
+
+
+class Job(object):
+    '''a task invocation listed in the batch manifest'''
+
+    def __init__(self, number, poi, argv):
+        self.number = number
+        self.poi = poi
+        self.argv = argv
+
+    def __str__(self):
+        return '%d %s %s' % (self.number, self.poi, self.argv[0])
+
+
+def parse_manifest(lines):
+    '''
+    parse manifest lines of the form ``<poi> <task> [args...]``
+    into ``Job`` objects. Empty lines and comments (#) are ignored.
+    '''
+    jobs = []
+    for line in lines:
+        parts = shlex.split(line, comments=True)
+        if not parts:
+            continue
+        if len(parts) < 2:
+            raise ValueError('invalid manifest line (expected <poi> <task> [args...]): ' + line.strip())
+        jobs.append(Job(len(jobs) + 1, parts[0], parts[1:]))
+    return jobs
+
+
+class ProductServer(object):
+    '''an ape daemon serving a single product for the batch'''
+
+    def __init__(self, poi):
+        self.poi = poi
+        self.process = None
+        self.path = None
+
+    def start(self, timeout=300):
+        '''activate the product and start its daemon'''
+        env = dict(os.environ)
+        #start from a deactivated environment
+        for name in ACTIVATION_VARIABLES:
+            env.pop(name, None)
+        if 'APE_OLDPYTHONPATH' in env:
+            env['PYTHONPATH'] = env['APE_OLDPYTHONPATH']
+        env['APE_BATCH_POI'] = self.poi
+        self.process = subprocess.Popen(
+            ['bash', '-c', ACTIVATE_AND_SERVE % dict(timeout=timeout)],
+            env=env,
+            stdout=subprocess.PIPE,
+            close_fds=True,
+        )
+
+    def wait(self):
+        '''wait for the daemon to listen, returns False if it failed to start'''
+        line = self.process.stdout.readline().strip()
+        for prefix in SERVING_PREFIXES:
+            if line.startswith(prefix):
+                self.path = line[len(prefix):]
+                return True
+        self.stop()
+        return False
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+
+
+class PrefixedOutput(object):
+    '''file-like object that writes complete lines prefixed with the job'''
+
+    def __init__(self, prefix, lock, out):
+        self.prefix = prefix
+        self.lock = lock
+        self.out = out
+        self.pending = ''
+
+    def write(self, data):
+        lines = (self.pending + data).split('\n')
+        self.pending = lines.pop()
+        if lines:
+            self._emit(lines)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.pending:
+            self._emit([self.pending])
+            self.pending = ''
+
+    def _emit(self, lines):
+        with self.lock:
+            for line in lines:
+                self.out.write('[%s] %s\n' % (self.prefix, line))
+            self.out.flush()
+
+
+def run_job(job, server, lock, out, retries=10):
+    '''
+    run job on server, returns the exit status of the task
+    '''
+    output = PrefixedOutput(str(job), lock, out)
+    status = None
+    if server.path:
+        for attempt in range(retries):
+            status = client.request(
+                server.path, ['ape'] + job.argv, output,
+                forward_environment=False
+            )
+            if status is not None:
+                break
+            #the daemon restarts after feature sources changed
+            time.sleep(0.5)
+    output.close()
+    if status is None:
+        output.write('unable to reach ape daemon for %s\n' % job.poi)
+        output.close()
+        status = 1
+    output.write('exit status %d\n' % status)
+    output.close()
+    return status
+
+
+def run_batch(jobs, concurrency=4, out=None):
+    '''
+    run ``jobs`` (see ``parse_manifest``) with at most ``concurrency``
+    tasks running at the same time.
+
+    returns a list of (job, exit status) tuples
+    '''
+    out = out or sys.stdout
+    lock = threading.Lock()
+    servers = dict()
+    try:
+        for job in jobs:
+            if job.poi not in servers:
+                servers[job.poi] = ProductServer(job.poi)
+                servers[job.poi].start()
+        for poi, server in sorted(servers.items()):
+            if not server.wait():
+                out.write('unable to activate %s\n' % poi)
+
+        pool = ThreadPool(max(1, concurrency))
+        try:
+            statuses = pool.map(
+                lambda job: run_job(job, servers[job.poi], lock, out),
+                jobs
+            )
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        for server in servers.values():
+            server.stop()
+    return zip(jobs, statuses)
+
+
+def main(args):
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m ape.batch')
+    parser.add_argument('manifest', help='the manifest file, - to read it from stdin')
+    parser.add_argument('--jobs', type=int, default=4, help='tasks running concurrently')
+    args = parser.parse_args(args)
+    if args.manifest == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(args.manifest) as f:
+            lines = f.readlines()
+    try:
+        jobs = parse_manifest(lines)
+    except ValueError as e:
+        print e
+        return 1
+
+    results = run_batch(jobs, concurrency=args.jobs)
+    failed = [job for job, status in results if status != 0]
+    print
+    print '%d jobs, %d failed' % (len(results), len(failed))
+    for job in failed:
+        print '  failed: ' + str(job)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
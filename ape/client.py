@@ -0,0 +1,188 @@
+'''
+client for the ape daemon (``python -m ape.daemon``)
+
+Forwards the command line to the ape daemon serving the current product
+and streams back its output. If no daemon is serving the product, ape is
+executed directly. The ``ape`` shell function uses this client if
+``APE_USE_DAEMON`` is set (``APE_USE_DAEMON=auto`` also starts a daemon
+in the background if none is running).
+
+This module is executed for every ape invocation so keep it light:
+only the standard library may be imported at the module level.
+'''
+import os
+import sys
+import json
+import stat
+import socket
+import struct
+import hashlib
+
+#frames are prefixed with their kind and the length of the payload
+FRAME_HEADER = struct.Struct('!cI')
+
+#request sent by the client
+REQUEST = 'R'
+#output chunk of the task
+OUTPUT = 'O'
+#exit status of the task
+EXIT = 'X'
+#the daemon does not serve the request (e.g. it is stale)
+NOT_SERVED = 'N'
+
+#environment variables that determine the feature selection
+SELECTION_VARIABLES = (
+    'APE_PREPEND_FEATURES',
+    'PRODUCT_EQUATION',
+    'PRODUCT_EQUATION_FILENAME',
+)
+
+
+def send_frame(sock, kind, payload=''):
+    sock.sendall(FRAME_HEADER.pack(kind, len(payload)) + payload)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def recv_frame(sock):
+    '''
+    returns the next frame as (kind, payload) tuple or (None, None) if the
+    connection has been closed
+    '''
+    header = _recv_exactly(sock, FRAME_HEADER.size)
+    if header is None:
+        return None, None
+    kind, size = FRAME_HEADER.unpack(header)
+    payload = _recv_exactly(sock, size)
+    if payload is None:
+        return None, None
+    return kind, payload
+
+
+def get_socket_dir():
+    '''
+    returns the directory of the sockets of the current user: ``serve-<uid>``
+    in the cache directory or in the temporary directory
+    '''
+    from ape.index import get_cache_dir
+    name = 'serve-%d' % os.getuid()
+    cache_dir = get_cache_dir()
+    #unix socket paths are limited to about 100 characters
+    if cache_dir and len(cache_dir) < 64:
+        return os.path.join(cache_dir, name)
+    import tempfile
+    return os.path.join(tempfile.gettempdir(), 'ape-' + name)
+
+
+def is_private(path):
+    '''check that ``path`` is owned by the current user and inaccessible to others'''
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return st.st_uid == os.getuid() and not stat.S_ISLNK(st.st_mode) and not st.st_mode & 0077
+
+
+def get_socket_path(environ=None):
+    '''
+    returns the path of the socket the daemon for the product selected
+    in ``environ`` listens on or None if no product is selected
+    '''
+    environ = os.environ if environ is None else environ
+    selection = '\n'.join([environ.get(name, '') for name in SELECTION_VARIABLES])
+    if not selection.strip():
+        return None
+    key = hashlib.sha1(selection).hexdigest()[:16]
+    return os.path.join(get_socket_dir(), key + '.sock')
+
+
+def request(path, argv, out, forward_environment=True):
+    '''
+    runs ``argv`` on the daemon listening at ``path``,
+    output is written to ``out``.
+
+    If ``forward_environment`` is True, the task is executed with the
+    environment and working directory of the client. Otherwise, the
+    task sees the environment of the daemon.
+
+    The environment is only sent to a daemon of the current user: returns
+    None without connecting if the socket or its directory is not private.
+
+    returns the exit status of the task or None if the request was not served
+    '''
+    if not (is_private(os.path.dirname(path)) and is_private(path)):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        return None
+    started = False
+    try:
+        send_frame(sock, REQUEST, json.dumps(dict(
+            argv=argv,
+            env=dict(os.environ) if forward_environment else None,
+            cwd=os.getcwd() if forward_environment else None,
+        )))
+        while True:
+            kind, payload = recv_frame(sock)
+            if kind == OUTPUT:
+                started = True
+                out.write(payload)
+                out.flush()
+            elif kind == EXIT:
+                return int(payload)
+            elif kind == NOT_SERVED and not started:
+                return None
+            else:
+                break
+    except socket.error:
+        #the connection was refused or reset before the task produced output
+        if not started:
+            return None
+    finally:
+        sock.close()
+    #never run a task twice - even if the daemon died
+    sys.stderr.write('ape: lost connection to daemon at %s\n' % path)
+    return 1
+
+
+def spawn_daemon():
+    '''starts the ape daemon for the current product in the background'''
+    import subprocess
+    devnull = open(os.devnull, 'r+')
+    subprocess.Popen(
+        [sys.executable, '-m', 'ape.daemon'],
+        stdin=devnull,
+        stdout=devnull,
+        stderr=devnull,
+        close_fds=True,
+        preexec_fn=os.setsid,
+    )
+
+
+def main(argv):
+    if not (len(argv) > 1 and argv[1] == 'complete'):
+        path = get_socket_path()
+        if path:
+            status = request(path, ['ape'] + argv[1:], sys.stdout)
+            if status is not None:
+                sys.exit(status)
+            if os.environ.get('APE_USE_DAEMON') == 'auto':
+                spawn_daemon()
+    #not served: run ape directly
+    sys.stdout.flush()
+    os.execv(sys.executable, [sys.executable, '-m', 'ape.main'] + argv[1:])
+
+
+if __name__ == '__main__':
+    main(sys.argv)
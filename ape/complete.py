@@ -0,0 +1,126 @@
+'''
+shell completion for ape - used by the ``ape`` shell function in ``activape``
+
+``ape complete <line>`` prints the candidates completing the last word of
+the command line ``line``, one per line. Task names and parameters are taken
+from the task index (see ``ape.index``), points of interest from the container
+index (see ``ape.container_mode.index``). No feature is imported, outdated
+indexes are used as they are.
+'''
+import os
+
+#parameters that take a point of interest (container:product)
+POI_PARAMETERS = ('poi',)
+#parameters that take a directory of interest (container or container:product)
+DOI_PARAMETERS = ('doi',)
+
+
+def get_pois(with_containers=False):
+    '''
+    returns the pois of the ape root as "container:product" strings;
+    with ``with_containers`` the container names are included.
+    '''
+    from ape.container_mode import index as container_index
+    root = os.environ.get('APE_ROOT_DIR')
+    if not root or not os.path.isdir(root):
+        return []
+    containers = container_index.get(root)
+    pois = []
+    for container_name in sorted(containers.get_containers()):
+        if with_containers:
+            pois.append(container_name)
+        for product_name in sorted(containers.get_products(container_name)):
+            pois.append('%s:%s' % (container_name, product_name))
+    return pois
+
+
+def get_parameter_candidates(name):
+    '''returns the candidates for the value of the task parameter ``name``'''
+    if name in POI_PARAMETERS:
+        return get_pois()
+    if name in DOI_PARAMETERS:
+        return get_pois(with_containers=True)
+    return []
+
+
+def get_argument_candidates(spec, words):
+    '''
+    returns the candidates for the argument following ``words``
+    of a task described by ``spec`` (see ``ape.get_task_spec``)
+    and whether the current word needs to be completed as option
+    as a tuple (candidates, options).
+    '''
+    if spec is None or spec['proxy']:
+        return [], []
+    names = spec['args']
+    posargslen = len(names) - len(spec['defaults'])
+    optional = names[posargslen:]
+    given = set()
+    positional = 0
+    expects_value = None
+    for word in words:
+        if expects_value:
+            expects_value = None
+        elif word.startswith('--'):
+            name = word[2:].partition('=')[0]
+            given.add(name)
+            if '=' not in word:
+                expects_value = name
+        else:
+            positional += 1
+    options = ['--' + name for name in optional if name not in given]
+    if expects_value:
+        return get_parameter_candidates(expects_value), []
+    if positional < posargslen:
+        return get_parameter_candidates(names[positional]), options
+    return [], options
+
+
+def get_candidates(task_index, words, current):
+    '''
+    returns the candidates completing ``current`` given the
+    preceding ``words`` of the command line (without "ape")
+    '''
+    task_names = [
+        name for name in sorted(task_index.tasks)
+        if task_index.has_task(name, include_helpers=False)
+    ]
+    if not words:
+        candidates = task_names
+    elif words[0] == 'help':
+        candidates = task_names if len(words) == 1 else []
+    elif task_index.has_task(words[0], include_helpers=False):
+        candidates, options = get_argument_candidates(task_index.get_spec(words[0]), words[1:])
+        if current.startswith('-'):
+            candidates = options
+    else:
+        candidates = []
+    return [candidate for candidate in candidates if candidate.startswith(current)]
+
+
+def complete(line, features):
+    '''
+    returns the candidates completing the last word of ``line``.
+
+    Bash splits words at colons: candidates are returned relative to
+    the last colon of the current word.
+    '''
+    from ape import index
+    words = line.split()
+    current = '' if not words or line[-1:].isspace() else words.pop()
+    if words and os.path.basename(words[0]) == 'ape':
+        words = words[1:]
+    task_index = index.load(features)
+    if task_index is None:
+        return []
+    candidates = get_candidates(task_index, words, current)
+    if ':' in current:
+        prefix = current.rsplit(':', 1)[0] + ':'
+        candidates = [candidate[len(prefix):] for candidate in candidates]
+    return candidates
+
+
+def main(args, features):
+    '''print the candidates for the command line given in ``args``'''
+    for candidate in complete(' '.join(args), features):
+        print candidate
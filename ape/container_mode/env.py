@@ -0,0 +1,126 @@
+'''
+generated shell environments of products - used by ``update_ape_env`` in ``activape``
+
+Switching to a product applies a snapshot of its environment: the virtualenv
+to activate (``_lib/venv`` of the container or the global one), the
+``PYTHONPATH`` (the global one as set up by ``activape`` and the ``initenv``
+of the ape root, the paths in ``_lib/paths.json`` except the first, the
+products and features of the container - without duplicates) and the product
+directories. The ``initenv`` of the product or container is sourced afterwards.
+
+``python -m ape.container_mode.env <container> <product>`` prints the snapshot
+as bash source defining ``_APE_ENV_*`` variables and stores it in the cache
+directory (``env/<container>/<product>.sh``). The shell function sources the
+stored file as long as it is newer than ``_lib/paths.json`` and the container
+virtualenv and was generated for the same global environment.
+'''
+import os
+import sys
+import json
+import pipes
+
+#bump this (and the check in update_ape_env) whenever the generated variables change
+ENV_VERSION = 1
+
+
+def get_env_filename(container_name, product_name):
+    '''returns the file the environment of the product is stored in or None'''
+    from ape.index import get_cache_dir
+    cache_dir = get_cache_dir()
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, 'env', container_name, product_name + '.sh')
+
+
+def get_extra_pypath(container_dir):
+    '''returns the paths in ``_lib/paths.json`` except the first (the virtualenv)'''
+    paths_file = os.path.join(container_dir, '_lib', 'paths.json')
+    try:
+        with open(paths_file) as f:
+            return json.load(f)[1:]
+    except (IOError, OSError, ValueError):
+        return []
+
+
+def unique_paths(paths):
+    '''returns ``paths`` without empty entries and duplicates, keeping the first occurrence'''
+    seen = set()
+    result = []
+    for path in paths:
+        if not path:
+            continue
+        key = os.path.normpath(path)
+        if key not in seen:
+            seen.add(key)
+            result.append(path)
+    return result
+
+
+def get_environment(root, container_name, product_name, global_pythonpath, virtualenv):
+    '''returns the generated variables of the product as (name, value) tuples'''
+    container_dir = os.path.join(root, container_name)
+    product_dir = os.path.join(container_dir, 'products', product_name)
+    container_venv = os.path.join(container_dir, '_lib', 'venv')
+    if not os.path.isfile(os.path.join(container_venv, 'bin', 'activate')):
+        container_venv = ''
+    pythonpath = unique_paths(
+        global_pythonpath.split(os.pathsep)
+        + get_extra_pypath(container_dir)
+        + [os.path.join(container_dir, 'products'), os.path.join(container_dir, 'features')]
+    )
+    return [
+        ('_APE_ENV_VERSION', str(ENV_VERSION)),
+        ('_APE_ENV_GLOBAL_PYTHONPATH', global_pythonpath),
+        ('_APE_ENV_VIRTUALENV', virtualenv),
+        ('_APE_ENV_VENV', container_venv or virtualenv),
+        ('_APE_ENV_CONTAINER_VENV', container_venv),
+        ('_APE_ENV_CONTAINER_DIR', container_dir),
+        ('_APE_ENV_PRODUCT_DIR', product_dir),
+        ('_APE_ENV_PYTHONPATH', os.pathsep.join(pythonpath)),
+    ]
+
+
+def render(environment):
+    '''returns bash source assigning the variables of ``environment``'''
+    lines = ['#generated by ape - do not edit']
+    for name, value in environment:
+        lines.append('%s=%s' % (name, pipes.quote(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def store(source, filename):
+    '''store the environment atomically - failures are ignored'''
+    env_dir = os.path.dirname(filename)
+    try:
+        if not os.path.isdir(env_dir):
+            os.makedirs(env_dir)
+        import tempfile
+        fd, tmpname = tempfile.mkstemp(dir=env_dir, prefix='.env-')
+        with os.fdopen(fd, 'w') as f:
+            f.write(source)
+        os.rename(tmpname, filename)
+    except (IOError, OSError):
+        pass
+
+
+def main(args):
+    if len(args) != 2:
+        sys.stderr.write('usage: python -m ape.container_mode.env <container> <product>\n')
+        return 1
+    container_name, product_name = args
+    source = render(get_environment(
+        os.environ['APE_ROOT_DIR'],
+        container_name,
+        product_name,
+        os.environ.get('APE_GLOBAL_PYTHONPATH', ''),
+        os.environ.get('APE_VIRTUALENV', ''),
+    ))
+    filename = get_env_filename(container_name, product_name)
+    if filename:
+        store(source, filename)
+    sys.stdout.write(source)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,376 @@
+'''
+index of the containers and products inside ``APE_ROOT_DIR``
+
+The index is built in a single pass over the ape root and persisted in the
+cache directory (see ``ape.index.get_cache_dir``). It is validated using the
+mtimes of the directories it was built from: adding or removing containers
+or products changes the mtime of the parent directory.
+
+Whenever the index is built, a lookup table of its pois is written next to
+it (``pois.sh``, see ``get_shell_table``). The ``ape`` shell function sources
+it to answer ``cd``, ``switch``, ``teleport`` and ``zap`` without starting
+python; pois missing from the table are passed on to python, which rebuilds
+the outdated index and therefore the table. The table is only used for
+feature selections whose task index shows that none of the tasks it replaces
+is refined (``fastpath.sh``, see ``update_fast_path``).
+'''
+import os
+import json
+import stat
+import time
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+#bump this whenever the format of the stored index changes
+INDEX_VERSION = 2
+
+#tasks answered by the lookup table of pois - and the helpers they use
+FAST_PATH_TASKS = ('cd', 'switch', 'teleport', 'zap', 'get_container_dir', 'get_product_dir')
+
+#directories modified this close to building the index are re-scanned,
+#as changes within the mtime granularity cannot be detected
+RACY_SECONDS = 2
+
+
+def list_dirs(path):
+    '''
+    returns a list of (name, mtime) tuples for the directories inside ``path``
+    '''
+    dirs = []
+    if scandir is not None:
+        for entry in scandir(path):
+            try:
+                if entry.is_dir():
+                    dirs.append((entry.name, entry.stat().st_mtime))
+            except OSError:
+                continue
+    else:
+        for name in os.listdir(path):
+            try:
+                st = os.stat(os.path.join(path, name))
+            except OSError:
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                dirs.append((name, st.st_mtime))
+    return dirs
+
+
+def _is_product(name):
+    return not name.startswith('.') and not name.startswith('_')
+
+
+def _is_shell_safe(name):
+    return not [c for c in name if c in "'\\\n:"]
+
+
+def _get_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class ContainerIndex(object):
+    '''
+    containers and their products
+
+    ``entries`` maps every directory in the ape root to its mtime,
+    ``containers`` maps container names to dicts with the ``mtime`` of
+    the products directory and the list of ``products``. ``order`` lists
+    the container names in the order of the directory listing.
+
+    Containers are expected at ``<root>/<name>/products`` - the default
+    of ``get_container_dir`` and ``get_product_dir``.
+    '''
+
+    def __init__(self, root, root_mtime, entries, containers, built_at, order):
+        self.root = root
+        self.root_mtime = root_mtime
+        self.entries = entries
+        self.containers = containers
+        self.built_at = built_at
+        self.order = order
+
+    @classmethod
+    def build(cls, root):
+        '''scan ``root`` for containers and products'''
+        built_at = time.time()
+        root_mtime = _get_mtime(root)
+        entries = dict()
+        containers = dict()
+        order = []
+        for name, mtime in list_dirs(root):
+            entries[name] = mtime
+            products_dir = os.path.join(root, name, 'products')
+            products_mtime = _get_mtime(products_dir)
+            if products_mtime is None or not os.path.isdir(products_dir):
+                continue
+            containers[name] = dict(
+                mtime=products_mtime,
+                products=filter(_is_product, os.listdir(products_dir)),
+            )
+            order.append(name)
+        return cls(root, root_mtime, entries, containers, built_at, order)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['root'], data['root_mtime'], data['entries'], data['containers'], data['built_at'],
+            data['order'])
+
+    def to_dict(self):
+        return dict(
+            version=INDEX_VERSION,
+            root=self.root,
+            root_mtime=self.root_mtime,
+            entries=self.entries,
+            containers=self.containers,
+            built_at=self.built_at,
+            order=self.order,
+        )
+
+    def is_valid(self):
+        '''check if the index still reflects the directory structure'''
+        limit = self.built_at - RACY_SECONDS
+
+        def unchanged(path, mtime):
+            return mtime is not None and mtime < limit and _get_mtime(path) == mtime
+
+        if not unchanged(self.root, self.root_mtime):
+            return False
+        for name, mtime in self.entries.items():
+            if not unchanged(os.path.join(self.root, name), mtime):
+                return False
+        for name, container in self.containers.items():
+            if not unchanged(os.path.join(self.root, name, 'products'), container['mtime']):
+                return False
+        return True
+
+    def get_containers(self):
+        return list(self.order)
+
+    def get_products(self, container_name):
+        return list(self.containers[container_name]['products'])
+
+    def has_container(self, container_name):
+        return container_name in self.containers
+
+    def get_shell_table(self):
+        '''
+        returns bash source defining ``_ape_lookup_poi <poi>``, which sets
+        ``_APE_POI_DIR`` to the directory of a container or product and
+        fails for unknown pois. Names that would need escaping are left out.
+        '''
+        lines = [
+            '#generated by ape from the container index - do not edit',
+            '_ape_lookup_poi() {',
+            '    case "$1" in',
+        ]
+        if _is_shell_safe(self.root):
+            for container_name in self.get_containers():
+                if not _is_shell_safe(container_name):
+                    continue
+                container_dir = self.root + '/' + container_name
+                lines.append("        '%s') _APE_POI_DIR='%s' ;;" % (container_name, container_dir))
+                for product_name in self.get_products(container_name):
+                    if _is_shell_safe(product_name):
+                        lines.append("        '%s:%s') _APE_POI_DIR='%s/products/%s' ;;" % (
+                            container_name, product_name, container_dir, product_name
+                        ))
+        lines.extend([
+            '        *) return 1 ;;',
+            '    esac',
+            '}',
+        ])
+        return '\n'.join(lines) + '\n'
+
+
+#indexes loaded by this process: root -> ContainerIndex
+_loaded = dict()
+
+
+def get(root):
+    '''returns the index of ``root``, it is loaded once per process'''
+    if root not in _loaded:
+        _loaded[root] = load(root)
+    return _loaded[root]
+
+
+def get_index_filename():
+    from ape.index import get_cache_dir
+    cache_dir = get_cache_dir()
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, 'containers.json')
+
+
+def get_shell_table_filename(filename):
+    '''returns the shell lookup table stored with the index ``filename``'''
+    return os.path.join(os.path.dirname(filename), 'pois.sh')
+
+
+def load(root):
+    '''
+    returns the stored index of ``root`` if it is still valid, otherwise
+    a freshly built one (which is stored for subsequent calls)
+    '''
+    filename = get_index_filename()
+    if filename:
+        try:
+            with open(filename) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            data = None
+        if data and data.get('version') == INDEX_VERSION and data.get('root') == root:
+            container_index = ContainerIndex.from_dict(data)
+            if container_index.is_valid():
+                if not os.path.exists(get_shell_table_filename(filename)):
+                    store(container_index, filename)
+                return container_index
+
+    container_index = ContainerIndex.build(root)
+    if filename:
+        store(container_index, filename)
+    return container_index
+
+
+def refresh(root):
+    '''rebuild and store the index of ``root``, e.g. after installing a container'''
+    container_index = ContainerIndex.build(root)
+    filename = get_index_filename()
+    if filename:
+        store(container_index, filename)
+    _loaded[root] = container_index
+    return container_index
+
+
+def _write(filename, prefix, write, mtime=None):
+    import tempfile
+    fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(filename), prefix=prefix)
+    with os.fdopen(fd, 'w') as f:
+        write(f)
+    if mtime is not None:
+        os.utime(tmpname, (mtime, mtime))
+    os.rename(tmpname, filename)
+
+
+def store(container_index, filename):
+    '''store the index and its shell lookup table atomically - failures are ignored'''
+    cache_dir = os.path.dirname(filename)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        _write(filename, '.containers-', lambda f: json.dump(container_index.to_dict(), f))
+        _write(get_shell_table_filename(filename), '.pois-',
+            lambda f: f.write(container_index.get_shell_table()))
+    except (IOError, OSError):
+        pass
+
+
+def get_selection():
+    '''returns the feature selection of the environment as the ``ape`` shell function sees it'''
+    from ape.client import SELECTION_VARIABLES
+    return '|'.join([os.environ.get(name, '') for name in SELECTION_VARIABLES])
+
+
+def is_fast_path_safe(task_index):
+    '''check if ``task_index`` shows container mode with none of the ``FAST_PATH_TASKS`` refined'''
+    features = [feature for feature, names in task_index.features]
+    if 'ape.container_mode' not in features:
+        return False
+    for feature, names in task_index.features:
+        if feature != 'ape.container_mode' and set(names).intersection(FAST_PATH_TASKS):
+            return False
+    return True
+
+
+def get_fast_path_files(task_index):
+    '''
+    returns a dict mapping the files the decision of ``is_fast_path_safe`` depends
+    on - the equation file and the modules in the fingerprint of ``task_index`` -
+    to their mtimes
+    '''
+    files = dict()
+    for entry in task_index.fingerprint or []:
+        if entry[2] is not None:
+            files[entry[2]] = entry[3]
+        for module_stat in entry[5]:
+            if module_stat[1] is not None:
+                files[module_stat[0]] = module_stat[1]
+    equation_filename = os.environ.get('PRODUCT_EQUATION_FILENAME')
+    if equation_filename:
+        files[equation_filename] = _get_mtime(equation_filename)
+    return files
+
+
+def get_fast_path_source(selections):
+    '''
+    returns bash source defining ``_ape_fast_selection <fastpath.sh>``, which fails
+    unless the current feature selection is one of ``selections`` (a dict mapping
+    selections as returned by ``get_selection`` to their files, see ``get_fast_path_files``)
+    and none of its files is newer than ``fastpath.sh``
+    '''
+    from ape.client import SELECTION_VARIABLES
+    lines = [
+        '#generated by ape from the task indexes - do not edit',
+        '_ape_fast_selection() {',
+        '    case "$%s" in' % '|$'.join(SELECTION_VARIABLES),
+    ]
+    for selection, files in sorted(selections.items()):
+        if _is_shell_safe(selection) and all(_is_shell_safe(path) for path in files):
+            checks = ["! '%s' -nt \"$1\"" % path for path in sorted(files)]
+            lines.append("        '%s') [[ %s ]] ;;" % (selection, ' && '.join(checks or ['1'])))
+    lines.extend([
+        '        *) return 1 ;;',
+        '    esac',
+        '}',
+    ])
+    return '\n'.join(lines) + '\n'
+
+
+def update_fast_path(task_index):
+    '''
+    record whether the lookup table of pois may answer the tasks of the
+    current feature selection, based on its ``task_index`` - failures are ignored.
+
+    Selections are recorded with the mtimes of their files (see ``get_fast_path_files``);
+    selections whose files changed since are dropped until their index is stored again.
+    ``fastpath.sh`` gets the mtime of the newest file, so the ``ape`` shell function
+    asks python as soon as one of the files is modified.
+    '''
+    filename = get_index_filename()
+    if not filename:
+        return
+    json_filename = os.path.join(os.path.dirname(filename), 'fastpath.json')
+    try:
+        with open(json_filename) as f:
+            recorded = json.load(f)
+    except (IOError, OSError, ValueError):
+        recorded = dict()
+    selections = dict()
+    for selection, record in recorded.items():
+        if isinstance(record, dict) and all(
+                _get_mtime(path) == mtime for path, mtime in record['files'].items()):
+            selections[selection] = record
+    selections[get_selection()] = dict(safe=is_fast_path_safe(task_index), files=get_fast_path_files(task_index))
+    if selections == recorded:
+        return
+    safe_selections = dict([
+        (selection, record['files']) for selection, record in selections.items() if record['safe']
+    ])
+    mtimes = [mtime for files in safe_selections.values() for mtime in files.values() if mtime is not None]
+    #rounded up to the resolution of utime - never older than the files
+    mtime = max(mtimes) + 0.000001 if mtimes else 0
+    try:
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        _write(json_filename, '.fastpath-', lambda f: json.dump(selections, f))
+        _write(os.path.join(os.path.dirname(filename), 'fastpath.sh'), '.fastpath-',
+            lambda f: f.write(get_fast_path_source(safe_selections)), mtime)
+    except (IOError, OSError):
+        pass
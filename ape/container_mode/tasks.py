@@ -1,7 +1,6 @@
 from ape import tasks
 import os
 import sys
-import subprocess
 
 
 class Config(object):
@@ -22,8 +21,33 @@ def get_product_dir(container_name, product_name):
     return tasks.get_container_dir(container_name) + '/products/' + product_name
 
 
+def _has_default_layout():
+    '''
+    check if neither ``get_container_dir`` nor ``get_product_dir`` is refined:
+    the container index assumes their layout
+    '''
+    for name in ('get_container_dir', 'get_product_dir'):
+        #composes the helper in lazy mode
+        tasks.get_task(name)
+        if tasks.get_modules(name) != [__name__]:
+            return False
+    return True
+
+
 @tasks.register_helper
+def get_container_index():
+    '''returns the ``ContainerIndex`` of the ape root or None if the layout of the ape root is refined'''
+    from ape.container_mode import index
+    if not _has_default_layout():
+        return None
+    return index.get(tasks.conf.APE_ROOT)
+
+
+@tasks.register_helper(memoize='invocation')
 def get_containers():
+    container_index = tasks.get_container_index()
+    if container_index is not None:
+        return container_index.get_containers()
     entries = os.listdir(tasks.conf.APE_ROOT)
     containers = []
     for entry in entries:
@@ -32,8 +56,11 @@ def get_containers():
     return containers
 
 
-@tasks.register_helper
+@tasks.register_helper(memoize='invocation')
 def get_products(container_name):
+    container_index = tasks.get_container_index()
+    if container_index is not None and container_index.has_container(container_name):
+        return container_index.get_products(container_name)
     products_dir = tasks.get_container_dir(container_name) + '/products'
     if not os.path.isdir(products_dir):
         return []
@@ -47,25 +74,58 @@ def get_products(container_name):
 
 
 @tasks.register
-def info():
-    '''list information about this productive environment'''
-    print
-    print 'root directory         :', tasks.conf.APE_ROOT
-    print
-    print 'active container       :', os.environ.get('CONTAINER_NAME', '')
-    print
-    print 'active product         :', os.environ.get('PRODUCT_NAME', '')
-    print
-    print 'ape feature selection  :', tasks.FEATURE_SELECTION
-    print
-    print 'containers and products:'
-    print '-' * 30
-    print
-    for container_name in tasks.get_containers():
-        print container_name
-        for product_name in tasks.get_products(container_name):
-            print '    ' + product_name
-    print
+def info(format='text', depth=2, limit=0):
+    '''list information about this productive environment
+
+    format is either "text" or "json".
+    With depth 1 only containers are listed, depth 2 also lists their products.
+    limit is the maximum number of containers to list (0 lists all).
+    '''
+    import json
+
+    depth = int(depth)
+    limit = int(limit)
+    container_names = tasks.get_containers()
+    listed_names = container_names[:limit] if limit else container_names
+    containers = []
+    for container_name in listed_names:
+        container = dict(name=container_name)
+        if depth > 1:
+            container['products'] = tasks.get_products(container_name)
+        containers.append(container)
+
+    if format == 'json':
+        print json.dumps(dict(
+            root=tasks.conf.APE_ROOT,
+            active_container=os.environ.get('CONTAINER_NAME', ''),
+            active_product=os.environ.get('PRODUCT_NAME', ''),
+            feature_selection=tasks.FEATURE_SELECTION,
+            container_count=len(container_names),
+            containers=containers,
+        ), indent=4, sort_keys=True)
+    elif format == 'text':
+        print
+        print 'root directory         :', tasks.conf.APE_ROOT
+        print
+        print 'active container       :', os.environ.get('CONTAINER_NAME', '')
+        print
+        print 'active product         :', os.environ.get('PRODUCT_NAME', '')
+        print
+        print 'ape feature selection  :', tasks.FEATURE_SELECTION
+        print
+        print 'containers and products:'
+        print '-' * 30
+        print
+        for container in containers:
+            print container['name']
+            for product_name in container.get('products', []):
+                print '    ' + product_name
+        if len(listed_names) < len(container_names):
+            print '... and %d more containers' % (len(container_names) - len(listed_names))
+        print
+    else:
+        print 'unknown format: %s - use "text" or "json"' % format
+        sys.exit(1)
 
 
 @tasks.register
@@ -165,13 +225,17 @@ def install_container(container_name):
     install_script = os.path.join(CONTAINER_DIR, 'install.py')
     if os.path.exists(install_script):
         print '... running install.py for %s' % container_name
+        import subprocess
         subprocess.check_call(['python', install_script])
+        #installing may have added products - update the index and the shell lookup table
+        from ape.container_mode import index
+        index.refresh(tasks.conf.APE_ROOT)
     else:
         print 'ERROR: this container does not provide an install.py!'
         return
 
 
-@tasks.register_helper
+@tasks.register_helper(memoize='product')
 def get_extra_pypath(container_name=None):
     from ape.installtools import pypath
     return pypath.get_extra_pypath()
@@ -0,0 +1,286 @@
+'''
+ape daemon - keeps the composed tasks of a product in memory
+
+``python -m ape.daemon`` composes the selected features once and listens on a unix socket
+(see ``ape.client.get_socket_path``). Every request is executed in a process
+forked from the composed parent, so tasks start without paying for interpreter
+startup and composition and cannot affect each other.
+
+The daemon restarts itself as soon as the sources of a selected feature change.
+It stops after being idle for ``--timeout`` seconds (default: an hour, 0 to run forever).
+'''
+import os
+import sys
+import json
+import time
+import errno
+import signal
+import socket
+import traceback
+from ape import index, trace
+from ape.client import (get_socket_path, is_private, send_frame, recv_frame,
+    REQUEST, OUTPUT, EXIT, NOT_SERVED)
+
+
+def get_source_fingerprint(features):
+    '''
+    returns the mtime and size of every loaded module that belongs
+    to one of the ``features`` and of the equation file
+    '''
+    modules = index.get_loaded_modules(features)
+    filenames = set()
+    for feature_filenames in modules.values():
+        filenames.update(feature_filenames)
+    if os.environ.get('PRODUCT_EQUATION_FILENAME'):
+        filenames.add(os.environ['PRODUCT_EQUATION_FILENAME'])
+    stats = dict()
+    for filename in filenames:
+        try:
+            st = os.stat(filename)
+        except OSError:
+            stats[filename] = None
+        else:
+            stats[filename] = (st.st_mtime, st.st_size)
+    return index.get_fingerprint(features), stats
+
+
+def get_exit_status(status):
+    '''converts a status as returned by ``os.waitpid`` to an exit status'''
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def _bind(path):
+    '''
+    returns a listening socket bound to path or None if another
+    daemon is listening on it already
+    '''
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except socket.error:
+            #left over by a daemon that died
+            os.unlink(path)
+        else:
+            return None
+        finally:
+            probe.close()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    #never accessible to others - not even between bind and chmod
+    umask = os.umask(0177)
+    try:
+        listener.bind(path)
+    finally:
+        os.umask(umask)
+    listener.listen(16)
+    return listener
+
+
+def _make_socket_dir(path):
+    '''
+    create the socket directory ``path`` accessible to the current user only,
+    returns False if it exists and is not private
+    '''
+    try:
+        os.makedirs(path, 0700)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+    return is_private(path)
+
+
+def execute(argv, environ, cwd, output_fd):
+    '''
+    execute the task given by argv in the current process
+    with environ and cwd applied (unless they are None).
+    Output is written to ``output_fd``.
+
+    returns the exit status
+    '''
+    from ape import memo
+    from ape.main import dispatch
+    #results memoized for the invocation must not leak into the next one
+    memo.clear()
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(output_fd, 1)
+    os.dup2(output_fd, 2)
+    os.close(devnull)
+    os.close(output_fd)
+    sys.stdout = sys.__stdout__
+    sys.stderr = sys.__stderr__
+
+    if environ is not None:
+        os.environ.clear()
+        for key, value in environ.items():
+            os.environ[_encode(key)] = _encode(value)
+    if cwd is not None:
+        os.chdir(cwd)
+    sys.argv = [_encode(arg) for arg in argv]
+
+    trace_filename = trace.start()
+    status = 0
+    try:
+        dispatch(sys.argv)
+    except SystemExit as e:
+        if e.code is None:
+            status = 0
+        elif isinstance(e.code, int):
+            status = e.code
+        else:
+            print >>sys.stderr, e.code
+            status = 1
+    except Exception:
+        traceback.print_exc()
+        status = 1
+    if trace_filename:
+        trace.finish(trace_filename)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return status
+
+
+def handle(conn):
+    '''
+    handle a single request: execute the task in a child process
+    and stream its output and exit status back to the client
+    '''
+    kind, payload = recv_frame(conn)
+    if kind != REQUEST:
+        return 1
+    req = json.loads(payload)
+
+    read_fd, write_fd = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        conn.close()
+        os.close(read_fd)
+        os._exit(execute(req['argv'], req['env'], req['cwd'], write_fd))
+    os.close(write_fd)
+
+    try:
+        while True:
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            send_frame(conn, OUTPUT, chunk)
+        status = get_exit_status(os.waitpid(pid, 0)[1])
+        send_frame(conn, EXIT, str(status))
+    except socket.error:
+        #client is gone
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+        return 1
+    return 0
+
+
+def _reap():
+    '''collect finished request handlers'''
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except OSError as e:
+            if e.errno == errno.ECHILD:
+                return
+            raise
+        if not pid:
+            return
+
+
+def _terminate(signum, frame):
+    sys.exit(0)
+
+
+def serve(features, timeout=None):
+    '''
+    serve requests for the composed ``features`` until no request
+    arrived for ``timeout`` seconds.
+    '''
+    path = get_socket_path()
+    if not path:
+        print 'Unable to serve: no product selected'
+        return
+    if not _make_socket_dir(os.path.dirname(path)):
+        print 'Unable to serve: %s must be owned by you and private' % os.path.dirname(path)
+        return
+    listener = _bind(path)
+    if listener is None:
+        print 'ape is already served at ' + path
+        return
+    listener.settimeout(1.0)
+    signal.signal(signal.SIGTERM, _terminate)
+    sources = get_source_fingerprint(features)
+    print 'serving ape at ' + path
+    sys.stdout.flush()
+
+    restart = False
+    last_request = time.time()
+    try:
+        while True:
+            _reap()
+            try:
+                conn = listener.accept()[0]
+            except socket.timeout:
+                if timeout and time.time() - last_request > timeout:
+                    break
+                continue
+            last_request = time.time()
+            conn.settimeout(None)
+            if get_source_fingerprint(features) != sources:
+                #read the request first: closing with unread data resets the connection
+                try:
+                    recv_frame(conn)
+                    send_frame(conn, NOT_SERVED, 'feature sources changed')
+                except socket.error:
+                    pass
+                conn.close()
+                restart = True
+                break
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    listener.close()
+                    status = handle(conn)
+                except Exception:
+                    traceback.print_exc()
+                finally:
+                    os._exit(status)
+            conn.close()
+    finally:
+        listener.close()
+        os.unlink(path)
+
+    if restart:
+        #compose the changed features from scratch
+        os.execv(sys.executable, [sys.executable, '-m', 'ape.daemon'] + sys.argv[1:])
+
+
+def main(args):
+    import argparse
+    from ape import tasks
+    from ape.main import get_features, load_features
+    parser = argparse.ArgumentParser(prog='python -m ape.daemon')
+    parser.add_argument('--timeout', type=float, default=3600, help='seconds to serve without requests (0: forever)')
+    timeout = parser.parse_args(args).timeout
+    features = get_features()
+    load_features(features)
+    #make sure everything is composed before forking
+    tasks.get_tasks()
+    serve(features, timeout=timeout)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
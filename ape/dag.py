@@ -0,0 +1,112 @@
+'''
+execution of task requirements - see ``Tasks.register``
+
+Tasks may declare the tasks they require. Before a task is invoked from the
+command line, the graph of its requirements (across all composed features)
+is executed: every task at most once, tasks that do not depend on each other
+concurrently on a thread pool. Required tasks are called without arguments.
+'''
+import sys
+import Queue
+from multiprocessing.pool import ThreadPool
+from ape import CyclicRequirement
+
+#how many tasks run concurrently unless APE_JOBS is set
+DEFAULT_JOBS = 4
+
+
+def get_graph(registry, names):
+    '''
+    returns a dict mapping ``names`` and all tasks they require (transitively)
+    to the names of the tasks they require directly.
+
+    Raises ``TaskNotFound`` for unknown tasks and ``CyclicRequirement``
+    if the requirements contain a cycle.
+    '''
+    graph = dict()
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name in graph:
+            continue
+        #looking up the task composes it (see ``Tasks.set_loader``)
+        registry.get_task(name)
+        graph[name] = registry.get_requirements(name)
+        pending.extend(graph[name])
+    _check_acyclic(graph)
+    return graph
+
+
+def _check_acyclic(graph):
+    visiting = []
+    visited = set()
+
+    def visit(name):
+        if name in visiting:
+            cycle = visiting[visiting.index(name):] + [name]
+            raise CyclicRequirement(' -> '.join(cycle))
+        if name in visited:
+            return
+        visiting.append(name)
+        for requirement in graph[name]:
+            visit(requirement)
+        visiting.pop()
+        visited.add(name)
+
+    for name in sorted(graph):
+        visit(name)
+
+
+def _call(task, name, finished):
+    try:
+        task()
+    except BaseException:
+        finished.put((name, sys.exc_info()))
+    else:
+        finished.put((name, None))
+
+
+def execute(registry, names, jobs=DEFAULT_JOBS):
+    '''
+    execute the tasks given by ``names`` after the tasks they require.
+    At most ``jobs`` tasks run at the same time.
+
+    If a task fails, no further tasks are started and the exception is
+    re-raised once the running tasks have finished.
+    '''
+    graph = get_graph(registry, names)
+    functions = dict([(name, registry.get_task(name)) for name in graph])
+    waiting = dict([(name, set(requirements)) for name, requirements in graph.items()])
+    dependents = dict()
+    for name, requirements in graph.items():
+        for requirement in requirements:
+            dependents.setdefault(requirement, []).append(name)
+
+    finished = Queue.Queue()
+    ready = sorted([name for name, requirements in waiting.items() if not requirements])
+    running = 0
+    failure = None
+    pool = ThreadPool(max(1, jobs))
+    try:
+        while ready or running:
+            for name in ready:
+                del waiting[name]
+                pool.apply_async(_call, (functions[name], name, finished))
+                running += 1
+            ready = []
+            #a timeout keeps the wait interruptible
+            name, exc_info = finished.get(True, 365 * 24 * 3600)
+            running -= 1
+            if exc_info is not None:
+                failure = failure or exc_info
+            if failure is not None:
+                continue
+            for dependent in sorted(dependents.get(name, [])):
+                waiting[dependent].discard(name)
+                if not waiting[dependent]:
+                    ready.append(dependent)
+    finally:
+        pool.close()
+        pool.join()
+    if failure is not None:
+        raise failure[0], failure[1], failure[2]
@@ -0,0 +1,296 @@
+'''
+git metadata of feature locations - used by ``ape explain_features``
+
+Features are grouped by the git repository that contains them: every
+repository is probed once and the result is shared by all of its features.
+
+The checked out revision and the modified files are read from the repository
+directly (HEAD, refs, packed-refs and the index). ``git`` is only run if the
+repository uses something the reader does not support.
+'''
+import os
+import stat
+import struct
+import hashlib
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+#repository directory -> (rev, changes)
+_cache = dict()
+
+#returned for locations outside of any git repository
+NO_REPOSITORY = ('-', '-')
+
+
+def find_repository(path):
+    '''returns the work tree of the git repository containing path or None'''
+    path = os.path.abspath(path)
+    while True:
+        if os.path.exists(os.path.join(path, '.git')):
+            return path
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def get_git_dir(repo_dir):
+    '''
+    returns the git directory of the work tree at ``repo_dir``;
+    follows ``.git`` files as used by worktrees and submodules.
+    '''
+    git_path = os.path.join(repo_dir, '.git')
+    if os.path.isdir(git_path):
+        return git_path
+    with open(git_path) as f:
+        content = f.read().strip()
+    if not content.startswith('gitdir:'):
+        raise ValueError('invalid .git file: ' + git_path)
+    return os.path.normpath(os.path.join(repo_dir, content[len('gitdir:'):].strip()))
+
+
+def get_common_dir(git_dir):
+    '''returns the directory shared refs are stored in'''
+    commondir_file = os.path.join(git_dir, 'commondir')
+    if not os.path.exists(commondir_file):
+        return git_dir
+    with open(commondir_file) as f:
+        return os.path.normpath(os.path.join(git_dir, f.read().strip()))
+
+
+def resolve_ref(git_dir, ref):
+    '''returns the sha1 ``ref`` points to or None if it cannot be resolved'''
+    common_dir = get_common_dir(git_dir)
+    for _ in range(10):
+        for directory in (git_dir, common_dir):
+            ref_file = os.path.join(directory, ref)
+            if os.path.isfile(ref_file):
+                with open(ref_file) as f:
+                    value = f.read().strip()
+                break
+        else:
+            return _read_packed_ref(common_dir, ref)
+        if not value.startswith('ref:'):
+            return value or None
+        #symbolic ref
+        ref = value[len('ref:'):].strip()
+    return None
+
+
+def _read_packed_ref(common_dir, ref):
+    try:
+        with open(os.path.join(common_dir, 'packed-refs')) as f:
+            for line in f:
+                if line.startswith(('#', '^')):
+                    continue
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+    except IOError:
+        pass
+    return None
+
+
+def read_rev(repo_dir):
+    '''returns the revision checked out in ``repo_dir`` or None'''
+    return resolve_ref(get_git_dir(repo_dir), 'HEAD')
+
+
+def _blob_sha1(data):
+    return hashlib.sha1('blob %d\0' % len(data) + data).digest()
+
+
+def _has_filters(repo_dir, git_dir, paths):
+    '''check if the content of ``paths`` may be converted on checkout (eol, filters)'''
+    directories = set()
+    for path in paths:
+        path = os.path.dirname(path)
+        while path not in directories:
+            directories.add(path)
+            path = os.path.dirname(path)
+    for directory in directories:
+        if os.path.exists(os.path.join(repo_dir, directory, '.gitattributes')):
+            return True
+    if os.path.exists(os.path.join(get_common_dir(git_dir), 'info', 'attributes')):
+        return True
+    try:
+        with open(os.path.join(get_common_dir(git_dir), 'config')) as f:
+            config = f.read().lower()
+    except IOError:
+        return False
+    return 'autocrlf' in config or 'eol' in config
+
+
+def _timestamp(seconds):
+    '''
+    returns a time of ``os.stat`` in microseconds - python 2 only provides
+    float timestamps, which are exact to the microsecond but not beyond
+    '''
+    return int(round(seconds * 1000000))
+
+
+def _index_timestamp(seconds, nanoseconds):
+    '''returns a time of the index in microseconds (see ``_timestamp``)'''
+    return seconds * 1000000 + nanoseconds // 1000
+
+
+def _is_modified(repo_dir, path, mode, ctime, mtime, size, sha1, racy_limit):
+    '''
+    compare an index entry to the work tree.
+    returns True, False or None if the content differs (which may be
+    caused by conversions on checkout)
+
+    Like git, the stat data (mtime and ctime) is trusted unless the entry
+    is racy: modified no earlier than the index itself (``racy_limit``).
+    '''
+    try:
+        st = os.lstat(os.path.join(repo_dir, path))
+    except OSError:
+        #deleted
+        return True
+    entry_type = mode & 0170000
+    if entry_type == 0120000:
+        if not stat.S_ISLNK(st.st_mode):
+            return True
+        return _blob_sha1(os.readlink(os.path.join(repo_dir, path))) != sha1
+    if not stat.S_ISREG(st.st_mode):
+        return True
+    if bool(st.st_mode & 0100) != bool(mode & 0100):
+        return True
+    if size and st.st_size & 0xffffffff != size:
+        return None
+    if _timestamp(st.st_mtime) == mtime and _timestamp(st.st_ctime) == ctime and mtime < racy_limit:
+        return False
+    with open(os.path.join(repo_dir, path), 'rb') as f:
+        if _blob_sha1(f.read()) == sha1:
+            return False
+    return None
+
+
+def read_changes(repo_dir):
+    '''
+    returns the files modified in the work tree of ``repo_dir`` compared to
+    the index (like ``git diff --name-only``) or None if the index uses
+    features that are not supported.
+    '''
+    git_dir = get_git_dir(repo_dir)
+    index_file = os.path.join(git_dir, 'index')
+    try:
+        with open(index_file, 'rb') as f:
+            data = f.read()
+        index_mtime = _timestamp(os.stat(index_file).st_mtime)
+    except (IOError, OSError):
+        return None
+    signature, version, count = struct.unpack('!4sII', data[:12])
+    if signature != 'DIRC' or version not in (2, 3):
+        return None
+
+    changes = []
+    content_changes = []
+    pos = 12
+    for _ in range(count):
+        start = pos
+        ctime_s, ctime_ns, mtime_s, mtime_ns = struct.unpack('!IIII', data[pos:pos + 16])
+        ctime = _index_timestamp(ctime_s, ctime_ns)
+        mtime = _index_timestamp(mtime_s, mtime_ns)
+        (mode, size, sha1, flags) = (
+            struct.unpack('!I', data[pos + 24:pos + 28])[0],
+            struct.unpack('!I', data[pos + 36:pos + 40])[0],
+            data[pos + 40:pos + 60],
+            struct.unpack('!H', data[pos + 60:pos + 62])[0],
+        )
+        pos += 62
+        skip_worktree = False
+        if flags & 0x4000:
+            extended_flags = struct.unpack('!H', data[pos:pos + 2])[0]
+            skip_worktree = bool(extended_flags & 0x4000)
+            if extended_flags & 0x2000:
+                #intent-to-add
+                return None
+            pos += 2
+        name_end = data.index('\0', pos)
+        path = data[pos:name_end]
+        pos = start + ((name_end - start + 8) & ~7)
+
+        if (flags >> 12) & 3 or flags & 0x8000:
+            #unmerged or assume-unchanged entries
+            return None
+        if skip_worktree or mode & 0170000 == 0160000:
+            #sparse checkout or submodule
+            continue
+        modified = _is_modified(repo_dir, path, mode, ctime, mtime, size, sha1, index_mtime)
+        if modified:
+            changes.append(path)
+        elif modified is None:
+            content_changes.append(path)
+
+    #extensions that change the meaning of the entries
+    while pos + 8 <= len(data) - 20:
+        extension, extension_size = struct.unpack('!4sI', data[pos:pos + 8])
+        if extension in ('link', 'sdir'):
+            return None
+        pos += 8 + extension_size
+
+    if content_changes:
+        if _has_filters(repo_dir, git_dir, content_changes):
+            #the work tree content may be converted - let git decide
+            return None
+        changes = sorted(changes + content_changes)
+    return changes
+
+
+def _git(repo_dir, *args):
+    return subprocess.Popen(
+        ['git'] + list(args),
+        cwd=repo_dir,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    ).communicate()
+
+
+def probe(repo_dir):
+    '''
+    returns a tuple (rev, changes) for the repository at ``repo_dir``:
+    the revision checked out and the modified files (one per line).
+    Each is "-" if it cannot be determined.
+    '''
+    try:
+        rev = read_rev(repo_dir)
+        changes = read_changes(repo_dir)
+    except (IOError, OSError, ValueError, struct.error):
+        rev = changes = None
+    if rev is None:
+        rev = _git(repo_dir, 'rev-parse', 'HEAD')[0].strip()
+    if changes is None:
+        changes = _git(repo_dir, 'diff', '--name-only')[0].strip()
+    else:
+        changes = '\n'.join(changes)
+    return rev or '-', changes or '-'
+
+
+def describe(path):
+    '''
+    returns the (rev, changes) tuple of the repository containing ``path``.
+    Results are cached per repository.
+    '''
+    repo_dir = find_repository(path)
+    if repo_dir is None:
+        return NO_REPOSITORY
+    if repo_dir not in _cache:
+        _cache[repo_dir] = probe(repo_dir)
+    return _cache[repo_dir]
+
+
+def prefetch(paths, jobs=8):
+    '''probe the repositories containing ``paths`` concurrently'''
+    repos = set([find_repository(path) for path in paths])
+    repos = [repo_dir for repo_dir in repos if repo_dir and repo_dir not in _cache]
+    if not repos:
+        return
+    pool = ThreadPool(min(jobs, len(repos)))
+    try:
+        results = pool.map(probe, repos)
+    finally:
+        pool.close()
+        pool.join()
+    _cache.update(zip(repos, results))
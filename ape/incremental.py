@@ -0,0 +1,157 @@
+'''
+incremental tasks - see ``Tasks.incremental``
+
+An incremental task declares the files it reads (inputs) and writes (outputs).
+After it succeeded, the fingerprints of those files are recorded in the state
+file of the product (``.ape-state.json`` inside ``PRODUCT_DIR``). The next
+invocation with the same arguments is skipped, make-style, if no input and no
+output changed. Set ``APE_FORCE`` to run incremental tasks unconditionally.
+'''
+import os
+import json
+import glob
+import hashlib
+from thread import allocate_lock
+from functools import wraps
+from ape.memo import get_key
+
+STATE_FILENAME = '.ape-state.json'
+
+#bump this whenever the format of the state file changes
+STATE_VERSION = 1
+
+#tasks may run concurrently (see ``ape.dag``)
+_lock = allocate_lock()
+
+
+def get_state_filename():
+    '''returns the state file of the current product or None'''
+    product_dir = os.environ.get('PRODUCT_DIR')
+    if not product_dir or not os.path.isdir(product_dir):
+        return None
+    return os.path.join(product_dir, STATE_FILENAME)
+
+
+def read_state(filename):
+    try:
+        with open(filename) as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return dict()
+    if data.get('version') != STATE_VERSION:
+        return dict()
+    return data.get('tasks', dict())
+
+
+def write_state(filename, key, entry):
+    '''
+    update the entry ``key`` in the state file, the file is
+    replaced atomically; failures are ignored
+    '''
+    with _lock:
+        state = read_state(filename)
+        if entry is None:
+            if key not in state:
+                return
+            del state[key]
+        else:
+            state[key] = entry
+        try:
+            import tempfile
+            fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(filename), prefix='.ape-state-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dict(version=STATE_VERSION, tasks=state), f, indent=1, sort_keys=True)
+            os.rename(tmpname, filename)
+        except (IOError, OSError):
+            pass
+
+
+def _hash_file(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(65536)
+            if not chunk:
+                break
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def expand(base_dir, patterns):
+    '''
+    returns the sorted files matching ``patterns`` (relative to ``base_dir``);
+    directories are expanded to the files they contain, state files are
+    never included. Returns None if a pattern does not match anything.
+    '''
+    files = set()
+    for pattern in patterns:
+        matches = glob.glob(os.path.join(base_dir, pattern))
+        if not matches:
+            return None
+        for match in matches:
+            if os.path.isdir(match):
+                for dirpath, dirnames, filenames in os.walk(match):
+                    files.update([os.path.join(dirpath, name) for name in filenames])
+            else:
+                files.add(match)
+    return sorted([
+        path for path in files
+        if not os.path.basename(path).startswith('.ape-state')
+    ])
+
+
+def get_fingerprint(base_dir, patterns, content=False):
+    '''
+    returns the fingerprint of the files matching ``patterns``: a list of
+    [path, mtime, size] or with ``content`` [path, size, sha1] entries.
+    Returns None if a pattern does not match anything.
+    '''
+    files = expand(base_dir, patterns)
+    if files is None:
+        return None
+    fingerprint = []
+    for path in files:
+        try:
+            st = os.stat(path)
+            if content:
+                entry = [os.path.relpath(path, base_dir), st.st_size, _hash_file(path)]
+            else:
+                entry = [os.path.relpath(path, base_dir), st.st_mtime, st.st_size]
+        except (IOError, OSError):
+            #vanished while fingerprinting
+            return None
+        fingerprint.append(entry)
+    return fingerprint
+
+
+def make_incremental(name, task, inputs, outputs=(), content=False):
+    '''
+    wrap ``task`` so it is skipped if its inputs and outputs
+    did not change since it last succeeded
+    '''
+
+    @wraps(task)
+    def incremental_task(*args, **kws):
+        filename = get_state_filename()
+        if filename is None or os.environ.get('APE_FORCE'):
+            return task(*args, **kws)
+        base_dir = os.path.dirname(filename)
+        key = get_key(name, args, kws)
+        input_fingerprint = get_fingerprint(base_dir, inputs, content)
+        entry = read_state(filename).get(key)
+        if (entry is not None and input_fingerprint is not None
+                and entry['inputs'] == input_fingerprint
+                and entry['outputs'] == get_fingerprint(base_dir, outputs, content)):
+            print 'Task "%s" is up to date - skipped' % name
+            return None
+        #forget the state while the task runs: it may fail halfway
+        write_state(filename, key, None)
+        result = task(*args, **kws)
+        #inputs changed while the task ran are detected by the next run
+        output_fingerprint = get_fingerprint(base_dir, outputs, content)
+        if input_fingerprint is not None and output_fingerprint is not None:
+            write_state(filename, key, dict(inputs=input_fingerprint, outputs=output_fingerprint))
+        return result
+
+    incremental_task.__wrapped__ = task
+    return incremental_task
@@ -0,0 +1,429 @@
+'''
+persistent index of the composed task registry
+
+Composing the tasks modules of all selected features is expensive.
+The index records which tasks exist, where they are defined and
+what their signatures look like, so ``ape help`` and task lookup
+can be answered without importing any feature.
+
+The index is stored per feature selection inside the cache directory and
+is invalidated as soon as one of the modules of a feature changes - its
+``tasks`` module or any other module of the feature loaded while composing.
+Outdated indexes are refreshed by composing only the changed features and
+the features they share task names with (see ``TaskIndex.refresh``).
+'''
+import os
+import sys
+import imp
+import json
+import hashlib
+
+#bump this whenever the format of the stored index changes
+INDEX_VERSION = 4
+
+
+def get_cache_dir():
+    '''
+    returns the directory ape keeps its caches in.
+
+    ``APE_CACHE_DIR`` takes precedence, in container mode ``_ape/cache``
+    is used. Returns None if caching is disabled (``APE_NO_CACHE`` is set
+    or no directory could be determined).
+    '''
+    if os.environ.get('APE_NO_CACHE'):
+        return None
+    cache_dir = os.environ.get('APE_CACHE_DIR')
+    if not cache_dir and os.environ.get('APE_GLOBAL_DIR'):
+        cache_dir = os.path.join(os.environ['APE_GLOBAL_DIR'], 'cache')
+    return cache_dir or None
+
+
+def find_module_file(name):
+    '''
+    locate the source file of the module given by its dotted ``name``
+    without importing it (or any of its parent packages).
+
+    Returns None if the module cannot be found.
+    '''
+    path = None
+    filename = None
+    kind = None
+    for part in name.split('.'):
+        if filename is not None and kind != imp.PKG_DIRECTORY:
+            #modules cannot contain submodules
+            return None
+        try:
+            fileobj, filename, (suffix, mode, kind) = imp.find_module(part, path)
+        except ImportError:
+            return None
+        if fileobj:
+            fileobj.close()
+        path = [filename]
+    if kind == imp.PKG_DIRECTORY:
+        filename = os.path.join(filename, '__init__.py')
+    return os.path.abspath(filename)
+
+
+def _stat(filename):
+    try:
+        st = os.stat(filename)
+    except (TypeError, OSError):
+        return None, None
+    return st.st_mtime, st.st_size
+
+
+def get_fingerprint(features, modules=None):
+    '''
+    returns the fingerprint of the feature selection: the location, mtime and
+    size of the ``tasks`` module of every feature (and of ape itself).
+
+    ``modules`` maps features to the other source files of the feature
+    (see ``get_loaded_modules``), their mtime and size are included as well.
+    '''
+    from ape import __version__
+    modules = modules or dict()
+    entries = [['ape', __version__, os.path.join(os.path.dirname(__file__), '_tasks.py')]]
+    entries += [[feature, None, find_module_file(feature + '.tasks')] for feature in features]
+    fingerprint = []
+    for feature, version, filename in entries:
+        mtime, size = _stat(filename)
+        if mtime is None:
+            filename = None
+        module_stats = [[name] + list(_stat(name)) for name in modules.get(feature, [])]
+        fingerprint.append([feature, version, filename, mtime, size, module_stats])
+    return fingerprint
+
+
+def get_loaded_modules(features):
+    '''
+    returns a dict mapping each of the ``features`` to the sorted source files
+    of its loaded modules - except its ``tasks`` module, which is always fingerprinted.
+    Tasks defined in modules imported by ``tasks`` are covered this way.
+    '''
+    modules = dict([(feature, set()) for feature in features])
+    for name, module in sys.modules.items():
+        filename = getattr(module, '__file__', None)
+        if not filename:
+            continue
+        for feature in features:
+            if name == feature or name.startswith(feature + '.'):
+                if name != feature + '.tasks':
+                    if filename.endswith(('.pyc', '.pyo')):
+                        filename = filename[:-1]
+                    modules[feature].add(os.path.abspath(filename))
+                break
+    return dict([(feature, sorted(filenames)) for feature, filenames in modules.items()])
+
+
+def get_module_files(fingerprint):
+    '''returns the source files included in ``fingerprint`` by feature (see ``get_fingerprint``)'''
+    return dict([
+        (entry[0], [module_stat[0] for module_stat in entry[5]])
+        for entry in fingerprint
+    ])
+
+
+def get_index_filename(features, cache_dir=None):
+    '''returns the filename the index for ``features`` is stored in'''
+    cache_dir = cache_dir or get_cache_dir()
+    if not cache_dir:
+        return None
+    key = hashlib.sha1('\n'.join(features)).hexdigest()
+    return os.path.join(cache_dir, 'tasks-%s.json' % key)
+
+
+def _from_json(value):
+    '''
+    returns ``value`` loaded from json with its unicode strings converted
+    back to (utf-8 encoded) ``str``, as used throughout ape
+    '''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [_from_json(item) for item in value]
+    if isinstance(value, dict):
+        return dict([(_from_json(key), _from_json(item)) for key, item in value.items()])
+    return value
+
+
+def _is_identical(value, other):
+    '''check if ``value`` equals ``other`` including the types of all items'''
+    if type(value) is not type(other):
+        return False
+    if isinstance(value, (list, tuple)):
+        return len(value) == len(other) and all(
+            _is_identical(item, other_item) for item, other_item in zip(value, other)
+        )
+    if isinstance(value, dict):
+        return _is_identical(sorted(value.items()), sorted(other.items()))
+    return value == other
+
+
+def _is_storable(value):
+    '''check if value survives a roundtrip through json (see ``_from_json``) with the same types'''
+    try:
+        return _is_identical(_from_json(json.loads(json.dumps(value))), value)
+    except (TypeError, ValueError):
+        return False
+
+
+class TaskIndex(object):
+    '''
+    snapshot of a composed task registry
+
+    ``tasks`` maps task names to dicts containing the ``signature``, the
+    docstring (``doc``), the defining ``file``, whether the task is a ``helper``
+    and the ``spec`` used to bind command line arguments (see ``ape.get_task_spec``;
+    None if the defaults cannot be stored).
+
+    ``features`` is a list of (feature, names) tuples in composition order,
+    where names are the names the feature`s ``tasks`` module introduces or refines.
+    '''
+
+    def __init__(self, fingerprint, doc, tasks, features=None):
+        self.fingerprint = fingerprint
+        self.doc = doc
+        self.tasks = tasks
+        self.features = features or []
+
+    @classmethod
+    def from_registry(cls, registry, fingerprint=None):
+        '''create the index from the composed ``registry``'''
+        import inspect
+        from ape import get_signature, get_task_spec, InvalidTask
+        tasks = dict()
+        for name, func in registry.get_tasks(include_helpers=True):
+            try:
+                signature = get_signature(name, func)
+                spec = get_task_spec(func)
+            except InvalidTask:
+                #rendered as error when help is requested
+                signature = spec = None
+            if spec is not None and not _is_storable(spec['defaults']):
+                spec = None
+            tasks[name] = dict(
+                signature=signature,
+                spec=spec,
+                doc=inspect.getdoc(func),
+                file=os.path.abspath(inspect.getfile(func)),
+                helper=registry.is_helper(name),
+            )
+        features = []
+        for module_name, names in registry.get_composition():
+            if module_name.endswith('.tasks'):
+                module_name = module_name[:-len('.tasks')]
+            features.append((module_name, sorted(set(names))))
+        return cls(fingerprint, inspect.getdoc(registry._tasks), tasks, features)
+
+    @classmethod
+    def from_dict(cls, data):
+        #docs, files and defaults are printed or passed to the tasks as the str they were stored from
+        data = _from_json(data)
+        return cls(data['fingerprint'], data['doc'], data['tasks'], data['features'])
+
+    def to_dict(self):
+        return dict(
+            version=INDEX_VERSION,
+            fingerprint=self.fingerprint,
+            doc=self.doc,
+            tasks=self.tasks,
+            features=self.features,
+        )
+
+    def has_task(self, name, include_helpers=True):
+        '''check if a task called ``name`` exists'''
+        entry = self.tasks.get(name)
+        if entry is None:
+            return False
+        return include_helpers or not entry['helper']
+
+    def get_required_features(self, *names):
+        '''
+        returns a tuple (features, names):
+        the features that need to be composed so the tasks given by ``names``
+        are complete (in composition order) and all names that are complete afterwards.
+
+        Composing a feature applies all of its introductions and refinements,
+        so the result is closed over every name the selected features touch.
+        '''
+        features_by_name = dict()
+        for feature, feature_names in self.features:
+            for feature_name in feature_names:
+                features_by_name.setdefault(feature_name, []).append(feature)
+        names_by_feature = dict(self.features)
+
+        selected = set()
+        pending = list(names)
+        names = set()
+        while pending:
+            current = pending.pop()
+            if current in names:
+                continue
+            names.add(current)
+            for feature in features_by_name.get(current, []):
+                if feature not in selected:
+                    selected.add(feature)
+                    pending.extend(names_by_feature[feature])
+        return [feature for feature, _ in self.features if feature in selected], names
+
+    def refresh(self, registry, composed, fingerprint=None):
+        '''
+        returns an updated copy of the index: the entries of the ``composed``
+        features (and of the names they introduce or refine) are taken from
+        ``registry``, everything else is kept.
+
+        ``composed`` must be closed as returned by ``get_required_features``.
+        Returns None if the composed features touch names of features that
+        have not been composed (the registry is incomplete for those names).
+        '''
+        partial = TaskIndex.from_registry(registry)
+        composed_names = dict(partial.features)
+        names_by_feature = dict(self.features)
+        names = set()
+        for feature in composed:
+            names.update(names_by_feature.get(feature, []))
+        for feature_names in composed_names.values():
+            names.update(feature_names)
+
+        features = []
+        for entry in fingerprint or self.fingerprint:
+            feature = entry[0]
+            if feature in composed:
+                if feature in composed_names:
+                    features.append((feature, composed_names[feature]))
+                continue
+            feature_names = names_by_feature.get(feature)
+            if feature_names is None:
+                continue
+            if names.intersection(feature_names):
+                return None
+            features.append((feature, feature_names))
+
+        tasks = dict()
+        for name, entry in self.tasks.items():
+            if name not in names:
+                tasks[name] = entry
+        for name, entry in partial.tasks.items():
+            if name in names:
+                tasks[name] = entry
+        return TaskIndex(fingerprint or self.fingerprint, self.doc, tasks, features)
+
+    def get_spec(self, name):
+        '''returns the argument spec of task ``name`` or None if it is not known'''
+        entry = self.tasks.get(name)
+        return entry and entry['spec']
+
+    def is_builtin(self, name):
+        '''check if task ``name`` is ape`s global task and not refined by a feature'''
+        entry = self.tasks.get(name)
+        if entry is None:
+            return False
+        builtin_dir = os.path.dirname(os.path.abspath(__file__))
+        return os.path.dirname(os.path.abspath(entry['file'])) == builtin_dir
+
+    def get_signature(self, name):
+        '''returns the readable signature of task ``name``'''
+        from ape import InvalidTask
+        signature = self.tasks[name]['signature']
+        if signature is None:
+            raise InvalidTask('ape tasks may not use **kwargs')
+        return signature
+
+    def help(self, taskname=None):
+        '''list tasks or provide help for specific task'''
+        from ape import SHORT_HEADER
+        if not taskname:
+            print self.doc
+            print
+            print 'Available tasks:'
+            print
+            for name in sorted(self.tasks):
+                if self.tasks[name]['helper']:
+                    continue
+                print '  ' + self.get_signature(name)
+                help_msg = self.tasks[name]['doc'] or ''
+                help_msg = help_msg.split('\n')[0]
+                print '    ' + help_msg
+                print
+        elif taskname in self.tasks:
+            print SHORT_HEADER
+            print self.get_signature(taskname)
+            print
+            print self.tasks[taskname]['doc']
+            print
+            print 'defined in: ' + self.tasks[taskname]['file']
+            print
+        else:
+            print 'Task "%s" not found! Use "ape help" to get usage information.' % taskname
+
+
+def get_changed_features(old_fingerprint, fingerprint):
+    '''
+    returns the features whose ``tasks`` module differs between the fingerprints
+    or None if they do not describe the same feature selection and ape version.
+    '''
+    if [entry[0] for entry in old_fingerprint] != [entry[0] for entry in fingerprint]:
+        return None
+    if old_fingerprint[0] != fingerprint[0]:
+        return None
+    return [
+        new[0] for old, new in zip(old_fingerprint, fingerprint)
+        if old != new
+    ]
+
+
+def load(features, fingerprint=None):
+    '''
+    load the index for ``features``.
+
+    Returns None if there is no index or if it does not match ``fingerprint``.
+    If ``fingerprint`` is None, outdated indexes are returned as well.
+    '''
+    filename = get_index_filename(features)
+    if not filename:
+        return None
+    try:
+        with open(filename) as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if data.get('version') != INDEX_VERSION:
+        return None
+    if fingerprint is not None and data.get('fingerprint') != fingerprint:
+        return None
+    return TaskIndex.from_dict(data)
+
+
+def load_current(features):
+    '''
+    returns a tuple (index, fingerprint): the stored index for ``features`` or
+    None if there is none or it is outdated, and the current fingerprint
+    (including the source files the stored index recorded).
+    '''
+    stored = load(features)
+    fingerprint = get_fingerprint(features, stored and get_module_files(stored.fingerprint))
+    if stored is not None and stored.fingerprint != fingerprint:
+        stored = None
+    return stored, fingerprint
+
+
+def store(task_index, features):
+    '''
+    store ``task_index`` as index for ``features``.
+    The file is replaced atomically; failures are ignored as
+    the index is only an optimization.
+    '''
+    filename = get_index_filename(features)
+    if not filename:
+        return
+    cache_dir = os.path.dirname(filename)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        import tempfile
+        fd, tmpname = tempfile.mkstemp(dir=cache_dir, prefix='.tasks-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(task_index.to_dict(), f)
+        os.rename(tmpname, filename)
+    except (IOError, OSError):
+        pass
@@ -2,6 +2,9 @@ import os, sys, shutil, json
 from subprocess import call, PIPE
 from .venv import VirtualEnv
 from .pool import FeaturePool 
+from .fetch import fetch_pools, FetchResult
+from .manifest import install
+from . import template
 
 
 
@@ -22,9 +25,14 @@ def cleanup():
     os.mkdir(lib_dir)
     
     
-def create_project_venv():
+def create_project_venv(requirements=(), wheelhouse=None):
     '''
     Creates a project-level virtualenv and returns a ``VirtualEnv`` object.
+
+    The ``requirements`` files (relative to ``CONTAINER_DIR``) are installed
+    into it. If another container installed the same requirements before, the
+    virtualenv is cloned from its template instead (see ``template``).
+    With a ``wheelhouse`` packages are installed from it (see ``VirtualEnv``).
     '''
     print '... creating project-level virtualenv'
     venv_dir = os.path.join(os.environ['CONTAINER_DIR'], '_lib/venv')
@@ -32,6 +40,15 @@ def create_project_venv():
     if os.path.exists(venv_dir):
         print 'ERROR: virtualenv already exists!'
         sys.exit()
+
+    template_path = None
+    template_dir = template.get_template_dir()
+    if requirements and template_dir:
+        template_path = template.get_template_path(requirements, template_dir)
+        if template_path and os.path.isdir(template_path):
+            template.clone(template_path, venv_dir)
+            print '... virtualenv cloned from %s' % template_path
+            return VirtualEnv(venv_dir, wheelhouse)
     
     try:
         r = call(['virtualenv', venv_dir, '--no-site-packages'])
@@ -43,39 +60,26 @@ def create_project_venv():
         raise Exception('ERROR: please install virtualenv in your current env.')
     
     print '... virtualenv successfully created'
-    return VirtualEnv(venv_dir)
+    venv = VirtualEnv(venv_dir, wheelhouse)
+    if requirements:
+        with venv.batch():
+            for file_path in requirements:
+                venv.pip_install_requirements(file_path)
+        if template_path:
+            template.save(venv_dir, template_path)
+    return venv
 
 
 def fetch_pool(repo_url, branch='master'):
     '''
     Fetches a git repository from ``repo_url`` and returns a ``FeaturePool`` object.
+    Exits on errors - use ``fetch_pools`` to fetch several pools concurrently.
     '''
-    repo_name = repo_url.split('.git')[0].split('/')[-1]
-    lib_dir = os.path.join(os.environ['CONTAINER_DIR'], '_lib')
-    print '... fetching %s ' % repo_name
-    
-    if os.path.exists(os.path.join(lib_dir, repo_name)):
-        print 'ERROR: repository already exists' 
-        sys.exit()
-        
-    try:
-        a = call(['git', 'clone', repo_url], cwd=lib_dir)
-    except OSError:
-        print 'ERROR: You probably dont have git installed: sudo apt-get install git'
+    result = fetch_pools([(repo_url, branch)], jobs=1)[0]
+    if not result.ok:
         sys.exit()
-    
-    if a != 0:
-        print 'ERROR: check your repository url and credentials!'
-        sys.exit()
-
-    try:
-        call(['git', 'checkout', branch], cwd=os.path.join(lib_dir, repo_name))
-    except OSError:
-        print 'ERROR: cannot switch branches'
-        sys.exit()
-
     print '... repository successfully cloned'
-    return FeaturePool(os.path.join(lib_dir, repo_name))
+    return result.pool
     
         
 
@@ -0,0 +1,253 @@
+'''
+concurrent cloning of feature pools - see ``fetch_pools``
+'''
+import os
+import time
+import shutil
+import threading
+import subprocess
+from multiprocessing.pool import ThreadPool
+from .pool import FeaturePool
+from . import mirror
+
+DEFAULT_JOBS = 4
+
+
+class FetchResult(object):
+    '''
+    outcome of fetching a single pool: ``error`` is None on success,
+    otherwise a message; ``output`` is what git printed.
+    '''
+
+    def __init__(self, repo_url, branch, path):
+        self.repo_url = repo_url
+        self.branch = branch
+        self.path = path
+        self.seconds = 0.0
+        self.error = None
+        self.output = ''
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def pool(self):
+        '''the fetched ``FeaturePool`` or None if fetching failed'''
+        return FeaturePool(self.path) if self.ok else None
+
+    def __str__(self):
+        if self.ok:
+            return '%s (%s) in %.1fs' % (get_repo_name(self.repo_url), self.branch, self.seconds)
+        return '%s (%s): %s' % (get_repo_name(self.repo_url), self.branch, self.error)
+
+
+def get_repo_name(repo_url):
+    return repo_url.split('.git')[0].split('/')[-1]
+
+
+def get_clone_command(repo_url, branch, path, depth=None, single_branch=False):
+    '''returns the git command cloning ``branch`` of ``repo_url`` into ``path``'''
+    command = ['git', 'clone', '--quiet', '--branch', branch]
+    if depth:
+        command.extend(['--depth', str(depth)])
+    if single_branch:
+        command.append('--single-branch')
+    return command + [repo_url, path]
+
+
+def clone(source, branch, path, result, depth=None, single_branch=False):
+    '''
+    clone ``branch`` of ``source`` into ``path``. If ``branch`` is neither a
+    branch nor a tag - e.g. a commit - the whole repository is cloned and
+    ``branch`` is checked out. Returns False (with ``result.error`` set) if that failed.
+    '''
+    if run_git(get_clone_command(source, branch, path, depth, single_branch), result):
+        return True
+    if os.path.exists(path):
+        return False
+    result.error = None
+    if not run_git(['git', 'clone', '--quiet', source, path], result):
+        return False
+    if not run_git(['git', 'checkout', '--quiet', branch], result, cwd=path):
+        #never leave a clone of the wrong revision behind
+        shutil.rmtree(path, ignore_errors=True)
+        return False
+    return True
+
+
+def run_git(command, result, cwd=None):
+    '''run the git ``command``, returns False (with ``result.error`` set) if it failed'''
+    try:
+        process = subprocess.Popen(
+            command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        )
+    except OSError:
+        result.error = 'you probably dont have git installed: sudo apt-get install git'
+        return False
+    result.output += process.communicate()[0]
+    if process.returncode != 0:
+        result.error = 'git %s failed - check your repository url, branch and credentials' % command[1]
+        return False
+    return True
+
+
+def git_output(command, cwd):
+    '''returns the output of the git ``command`` or None if it failed'''
+    try:
+        process = subprocess.Popen(command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError:
+        return None
+    output = process.communicate()[0]
+    if process.returncode != 0:
+        return None
+    return output
+
+
+def get_origin_url(path):
+    '''returns the url of the origin of the clone at ``path`` or None'''
+    if not os.path.isdir(os.path.join(path, '.git')):
+        return None
+    output = git_output(['git', 'config', 'remote.origin.url'], path)
+    return output.strip() if output is not None else None
+
+
+def get_local_changes(path):
+    '''
+    returns a description of the work in the clone at ``path`` that would be
+    lost by removing or resetting it (uncommitted changes, untracked files or
+    commits not on any remote branch or tag) or None
+    '''
+    status = git_output(['git', 'status', '--porcelain'], path)
+    if status is None:
+        return 'an unknown state'
+    if status.strip():
+        return 'uncommitted changes'
+    unpushed = git_output(['git', 'rev-list', 'HEAD', '--branches', '--not', '--remotes', '--tags'], path)
+    if unpushed is None or unpushed.strip():
+        return 'unpushed commits'
+    return None
+
+
+def get_commit(path, rev):
+    '''returns the commit ``rev`` refers to in the clone at ``path`` or None'''
+    output = git_output(['git', 'rev-parse', '--verify', '--quiet', rev + '^{commit}'], path)
+    return output.strip() if output else None
+
+
+def is_checked_out(path, rev):
+    '''
+    check if the clone at ``path`` has ``rev`` checked out: a branch at the head
+    of ``origin/<rev>``, a tag or commit at the commit it refers to
+    '''
+    head = get_commit(path, 'HEAD')
+    target = get_commit(path, 'refs/remotes/origin/' + rev)
+    if target is None:
+        return head is not None and head == get_commit(path, rev)
+    current = git_output(['git', 'symbolic-ref', '--quiet', 'HEAD'], path)
+    return current is not None and current.strip() == 'refs/heads/' + rev and head == target
+
+
+def check_out(path, rev, result):
+    '''
+    check out ``rev`` in the fetched clone at ``path``: a branch is reset to
+    ``origin/<rev>``, tags and commits are checked out detached. Returns False
+    (with ``result.error`` set) if that failed or would lose local work.
+    '''
+    if is_checked_out(path, rev):
+        return True
+    changes = get_local_changes(path)
+    if changes:
+        result.error = 'the pool has %s - not updated' % changes
+        return False
+    if get_commit(path, 'refs/remotes/origin/' + rev):
+        return run_git(['git', 'checkout', '--quiet', '-B', rev, 'origin/' + rev], result, cwd=path)
+    commit = get_commit(path, rev)
+    if commit is None:
+        result.error = 'unknown revision %s' % rev
+        return False
+    return run_git(['git', 'checkout', '--quiet', '--detach', commit], result, cwd=path)
+
+
+def fetch(repo_url, branch, lib_dir, depth=None, single_branch=False, mirror_dir=None, update=False):
+    '''
+    clone a single pool into ``lib_dir``, returns a ``FetchResult``.
+    With ``mirror_dir`` the pool is cloned from its updated mirror (``depth``
+    is ignored then), or from ``repo_url`` if the mirror cannot be updated.
+    With ``update`` an existing clone fetches the repository and checks out
+    ``branch`` - a branch, tag or commit - unless that would lose local work
+    (see ``check_out``).
+    '''
+    result = FetchResult(repo_url, branch, os.path.join(lib_dir, get_repo_name(repo_url)))
+    start = time.time()
+    exists = os.path.exists(result.path)
+    if exists and not update:
+        result.error = 'repository already exists'
+    else:
+        mirror_path = None
+        if mirror_dir:
+            mirror_path, output = mirror.update(repo_url, mirror_dir)
+            result.output += output
+        if exists:
+            #branches, tags and the commits on them - the revision may be any of these
+            refspecs = ['+refs/heads/*:refs/remotes/origin/*', '+refs/tags/*:refs/tags/*']
+            if run_git(['git', 'fetch', '--quiet', mirror_path or repo_url] + refspecs, result, cwd=result.path):
+                check_out(result.path, branch, result)
+        elif mirror_path is None:
+            clone(repo_url, branch, result.path, result, depth, single_branch)
+        elif clone(mirror_path, branch, result.path, result, None, single_branch):
+            run_git(['git', 'remote', 'set-url', 'origin', repo_url], result, cwd=result.path)
+    result.seconds = time.time() - start
+    return result
+
+
+def normalize(pools):
+    '''returns ``pools`` - repository urls or (url, branch) tuples - as (url, branch) tuples'''
+    normalized = []
+    for pool in pools:
+        if isinstance(pool, basestring):
+            pool = (pool, 'master')
+        normalized.append(tuple(pool))
+    return normalized
+
+
+def fetch_pools(pools, jobs=DEFAULT_JOBS, depth=None, single_branch=False, lib_dir=None, mirror_dir=None,
+        update=False):
+    '''
+    clone ``pools`` (repository urls or (url, branch) tuples) into the ``_lib``
+    directory of the container, at most ``jobs`` at a time. The branch (or tag)
+    is checked out by the clone itself; with ``depth`` the clones are shallow,
+    with ``single_branch`` only the branch is fetched. Other revisions, such as
+    commits, are checked out after cloning the whole repository.
+
+    Pools are cloned from mirrors in ``mirror_dir`` (default: see
+    ``mirror.get_mirror_dir``) which are created or updated first. With
+    ``update``, pools cloned before are updated to the head of their branch
+    or checked out at their tag or commit.
+
+    A failing pool does not stop the others: returns a list of ``FetchResult``
+    in the order of ``pools``.
+    '''
+    lib_dir = lib_dir or os.path.join(os.environ['CONTAINER_DIR'], '_lib')
+    mirror_dir = mirror_dir or mirror.get_mirror_dir()
+    pools = normalize(pools)
+    lock = threading.Lock()
+    print '... fetching %d pools' % len(pools)
+
+    def fetch_and_report(pool):
+        result = fetch(pool[0], pool[1], lib_dir, depth, single_branch, mirror_dir, update)
+        with lock:
+            if result.ok:
+                print '... fetched %s' % result
+            else:
+                print 'ERROR: %s' % result
+                if result.output:
+                    print result.output.rstrip()
+        return result
+
+    thread_pool = ThreadPool(max(1, min(jobs, len(pools))))
+    try:
+        return thread_pool.map(fetch_and_report, pools)
+    finally:
+        thread_pool.close()
+        thread_pool.join()
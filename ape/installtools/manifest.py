@@ -0,0 +1,198 @@
+'''
+incremental container installation - see ``install``
+
+The installed state (pools with their branches, hashes of the requirements
+files and the paths written to ``paths.json``) is recorded in
+``_lib/install.json``. Installing again compares the desired state to it and
+only fetches, checks out, reinstalls or rewrites what changed.
+'''
+import os
+import sys
+import json
+import shutil
+import hashlib
+from .venv import VirtualEnv, get_wheelhouse
+from .fetch import fetch_pools, normalize, get_repo_name, get_origin_url, get_local_changes, DEFAULT_JOBS
+
+MANIFEST_FILENAME = 'install.json'
+
+#bump this whenever the format of the manifest changes
+MANIFEST_VERSION = 1
+
+
+def get_lib_dir():
+    return os.path.join(os.environ['CONTAINER_DIR'], '_lib')
+
+
+def read_manifest(lib_dir):
+    '''returns the recorded install state, empty if nothing was recorded'''
+    try:
+        with open(os.path.join(lib_dir, MANIFEST_FILENAME)) as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        manifest = dict()
+    if manifest.get('version') != MANIFEST_VERSION:
+        manifest = dict(version=MANIFEST_VERSION)
+    manifest.setdefault('pools', dict())
+    manifest.setdefault('requirements', dict())
+    manifest.setdefault('paths', None)
+    return manifest
+
+
+def write_manifest(lib_dir, manifest):
+    '''replace the manifest atomically'''
+    import tempfile
+    fd, tmpname = tempfile.mkstemp(dir=lib_dir, prefix='.install-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.rename(tmpname, os.path.join(lib_dir, MANIFEST_FILENAME))
+
+
+def hash_file(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def get_requirement_hashes(requirements):
+    return dict([
+        (file_path, hash_file(os.path.join(os.environ['CONTAINER_DIR'], file_path)))
+        for file_path in requirements
+    ])
+
+
+def get_venv(lib_dir, manifest, requirements, wheelhouse=None):
+    '''
+    returns the ``VirtualEnv`` of the container; if it is created, the
+    ``requirements`` are installed and recorded in the ``manifest``
+    '''
+    venv_dir = os.path.join(lib_dir, 'venv')
+    if os.path.exists(os.path.join(venv_dir, 'bin', 'python')):
+        return VirtualEnv(venv_dir, wheelhouse)
+    from . import create_project_venv
+    venv = create_project_venv(requirements, wheelhouse)
+    manifest['requirements'] = get_requirement_hashes(requirements)
+    return venv
+
+
+def sync_pools(lib_dir, manifest, pools, jobs, update):
+    '''
+    fetch the pools that are missing or changed and remove the pools that
+    are no longer wanted. Existing clones of the wanted repositories are
+    adopted; pools with local work are never removed or reset.
+
+    returns a list of problems, one per pool that could not be installed
+    '''
+    failed = []
+    wanted = dict([(get_repo_name(url), (url, branch)) for url, branch in pools])
+    for name in sorted(manifest['pools']):
+        if name in wanted:
+            continue
+        path = os.path.join(lib_dir, name)
+        changes = os.path.isdir(path) and get_local_changes(path)
+        if changes:
+            failed.append('%s has %s - not removed' % (name, changes))
+            continue
+        print '... removing pool %s' % name
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        del manifest['pools'][name]
+
+    to_fetch = []
+    for name, (url, branch) in sorted(wanted.items()):
+        path = os.path.join(lib_dir, name)
+        if os.path.exists(path):
+            if get_origin_url(path) != url:
+                failed.append('%s exists and is not a clone of %s' % (path, url))
+                continue
+            if manifest['pools'].get(name) == dict(url=url, branch=branch) and not update:
+                continue
+        to_fetch.append((url, branch))
+
+    if to_fetch:
+        for result in fetch_pools(to_fetch, jobs=jobs, lib_dir=lib_dir, update=True):
+            name = get_repo_name(result.repo_url)
+            if result.ok:
+                manifest['pools'][name] = dict(url=result.repo_url, branch=result.branch)
+            else:
+                failed.append('%s: %s' % (name, result.error))
+    return failed
+
+
+def sync_requirements(venv, manifest, requirements):
+    '''install the requirements files that changed in a single pip run'''
+    hashes = get_requirement_hashes(requirements)
+    changed = dict()
+    with venv.batch():
+        for file_path in requirements:
+            digest = hashes[file_path]
+            if manifest['requirements'].get(file_path) != digest:
+                venv.pip_install_requirements(file_path)
+                changed[file_path] = digest
+    manifest['requirements'].update(changed)
+
+
+def sync_paths(lib_dir, manifest, paths):
+    '''rewrite ``paths.json`` if ``paths`` changed'''
+    target = os.path.join(lib_dir, 'paths.json')
+    if manifest['paths'] == paths and os.path.exists(target):
+        return
+    print '... writing paths.json'
+    with open(target, 'w') as f:
+        json.dump(paths, f)
+    manifest['paths'] = paths
+
+
+def install(pools=(), requirements=(), paths=(), venv=True, jobs=DEFAULT_JOBS, update=False, wheelhouse=False):
+    '''
+    install the container incrementally:
+
+    ``pools``
+        repository urls or (url, revision) tuples - the revision being a branch, tag
+        or commit - fetched concurrently into ``_lib`` (see ``fetch_pools``). Existing
+        clones of the repositories are adopted, pools pinned to another revision are
+        checked out in place, recorded pools no longer listed are removed - unless they
+        have local work.
+    ``requirements``
+        requirements files (relative to ``CONTAINER_DIR``) installed into the
+        virtualenv whenever their content changed.
+    ``paths``
+        paths written to ``paths.json`` after the paths of the virtualenv (or
+        ``_lib/venv`` without one) - relative paths are relative to ``_lib``,
+        e.g. ``mypool/features``.
+    ``venv``
+        True to use ``_lib/venv`` (created if missing - see ``create_project_venv``),
+        False for no virtualenv or a ``VirtualEnv``.
+    ``wheelhouse``
+        True to install the requirements into ``_lib/venv`` from the wheelhouse
+        shared by all containers (see ``get_wheelhouse``) or a wheelhouse directory.
+    ``update``
+        fetch the heads of the branches of all pools, not only of changed ones.
+
+    Exits if a pool cannot be installed or removed; what was installed is recorded anyway.
+    '''
+    lib_dir = get_lib_dir()
+    if not os.path.isdir(lib_dir):
+        os.mkdir(lib_dir)
+    manifest = read_manifest(lib_dir)
+
+    failed = sync_pools(lib_dir, manifest, normalize(pools), jobs, update)
+    write_manifest(lib_dir, manifest)
+    if failed:
+        for problem in failed:
+            print 'ERROR: %s' % problem
+        sys.exit(1)
+
+    #readers of paths.json skip the first entry - the virtualenv
+    venv_paths = [os.path.join(lib_dir, 'venv')]
+    if venv:
+        if venv is True:
+            if wheelhouse is True:
+                wheelhouse = get_wheelhouse()
+            venv = get_venv(lib_dir, manifest, list(requirements), wheelhouse or None)
+        sync_requirements(venv, manifest, list(requirements))
+        write_manifest(lib_dir, manifest)
+        venv_paths = venv.get_paths()
+
+    sync_paths(lib_dir, manifest, venv_paths + [os.path.join(lib_dir, path) for path in paths])
+    write_manifest(lib_dir, manifest)
+    print '... container installed'
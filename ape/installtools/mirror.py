@@ -0,0 +1,73 @@
+'''
+shared cache of bare git mirrors - used by ``fetch_pools``
+
+Every repository fetched is mirrored once into ``APE_GLOBAL_DIR/mirrors``
+and updated with ``git fetch`` afterwards. Pools are cloned from the mirror
+(a local clone hardlinks the objects) and their ``origin`` is pointed back to
+the repository, so installing a container again or installing sibling
+containers only costs a fetch. Set ``APE_NO_MIRRORS`` to clone directly.
+'''
+import os
+import fcntl
+import shutil
+import hashlib
+import subprocess
+
+
+def get_mirror_dir():
+    '''returns the directory of the mirrors or None if mirroring is disabled'''
+    if os.environ.get('APE_NO_MIRRORS') or not os.environ.get('APE_GLOBAL_DIR'):
+        return None
+    return os.path.join(os.environ['APE_GLOBAL_DIR'], 'mirrors')
+
+
+def get_mirror_path(repo_url, mirror_dir):
+    name = repo_url.rstrip('/').split('/')[-1]
+    if name.endswith('.git'):
+        name = name[:-len('.git')]
+    return os.path.join(mirror_dir, '%s-%s.git' % (name, hashlib.sha1(repo_url).hexdigest()[:10]))
+
+
+def git(command, cwd=None):
+    '''run git with ``command``, returns a (succeeded, output) tuple'''
+    try:
+        process = subprocess.Popen(
+            ['git'] + command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        )
+    except OSError as e:
+        return False, str(e)
+    output = process.communicate()[0]
+    return process.returncode == 0, output
+
+
+def update(repo_url, mirror_dir):
+    '''
+    create or update the mirror of ``repo_url``; returns a (mirror path or None, output)
+    tuple. Concurrent updates of the same mirror (by any process) are serialized.
+    '''
+    path = get_mirror_path(repo_url, mirror_dir)
+    try:
+        if not os.path.isdir(mirror_dir):
+            try:
+                os.makedirs(mirror_dir)
+            except OSError:
+                #created concurrently
+                if not os.path.isdir(mirror_dir):
+                    raise
+        with open(path + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if os.path.isdir(path):
+                succeeded, output = git(['--git-dir', path, 'fetch', '--quiet', '--prune', 'origin'])
+            else:
+                #clone next to the mirror first: an interrupted clone is never used
+                tmp_path = path + '.tmp'
+                if os.path.exists(tmp_path):
+                    shutil.rmtree(tmp_path)
+                succeeded, output = git(['clone', '--quiet', '--mirror', repo_url, tmp_path])
+                if succeeded:
+                    os.rename(tmp_path, path)
+    except (IOError, OSError) as e:
+        return None, 'unable to update the mirror %s: %s\n' % (path, e)
+    if not succeeded:
+        return None, output
+    return path, output
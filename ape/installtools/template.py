@@ -0,0 +1,183 @@
+'''
+virtualenv templates - see ``create_project_venv``
+
+A virtualenv with its requirements installed is saved as template in
+``APE_GLOBAL_DIR/venv-templates``, keyed by the hash of the requirements
+files, the python and the virtualenv version. Containers with the same
+requirements get a clone of the template: files are reflinked (copy-on-write)
+where the filesystem supports it, hardlinked otherwise - requirements with
+editable packages are never templated. Files referring to the location of the virtualenv
+(scripts in ``bin``, ``.pth`` and ``.egg-link`` files) are rewritten for
+the clone - never modified in place, as they may share their data with the
+template. Set ``APE_NO_VENV_TEMPLATES`` to always create virtualenvs from
+scratch.
+'''
+import os
+import re
+import sys
+import shutil
+import hashlib
+import subprocess
+
+#bump this whenever the layout of templates changes
+TEMPLATE_VERSION = 1
+
+#files containing the location of the virtualenv are not larger than this
+MAX_FIXUP_SIZE = 1024 * 1024
+
+
+def get_template_dir():
+    '''returns the directory of the templates or None if templates are disabled'''
+    if os.environ.get('APE_NO_VENV_TEMPLATES') or not os.environ.get('APE_GLOBAL_DIR'):
+        return None
+    return os.path.join(os.environ['APE_GLOBAL_DIR'], 'venv-templates')
+
+
+def _parse_option(line, names):
+    '''returns the value of the option ``line`` if it is one of ``names`` or None'''
+    for name in names:
+        if line == name:
+            return ''
+        for separator in (' ', '\t', '='):
+            if line.startswith(name + separator):
+                return line[len(name) + 1:].strip()
+        if not name.startswith('--') and line.startswith(name):
+            return line[len(name):].strip()
+    return None
+
+
+def get_requirement_files(path, files=None):
+    '''
+    returns the requirements file ``path`` and the files it includes
+    (``-r``, ``-c``) recursively or None if one of them lists an editable
+    requirement (``-e``), which cannot be templated: its source is no
+    part of the requirements files or lives in the virtualenv as checkout.
+    '''
+    files = [] if files is None else files
+    if path in files:
+        return files
+    files.append(path)
+    with open(path) as f:
+        lines = f.read().splitlines()
+    for line in lines:
+        line = re.sub(r'(^|\s)#.*$', '', line).strip()
+        if _parse_option(line, ('-e', '--editable')) is not None:
+            return None
+        included = _parse_option(line, ('-r', '--requirement', '-c', '--constraint'))
+        if included and '://' not in included:
+            if get_requirement_files(os.path.join(os.path.dirname(path), included), files) is None:
+                return None
+    return files
+
+
+def get_virtualenv_version():
+    try:
+        process = subprocess.Popen(['virtualenv', '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError:
+        return None
+    return process.communicate()[0].strip()
+
+
+def get_template_path(requirements, template_dir):
+    '''
+    returns the template of the requirements files ``requirements`` (relative to ``CONTAINER_DIR``)
+    or None if they cannot be templated (see ``get_requirement_files``).
+
+    The template is keyed by the content of the files (and of the files they
+    include), the python and the virtualenv version.
+    '''
+    from .manifest import hash_file
+    key = hashlib.sha1(str(TEMPLATE_VERSION))
+    key.update('\0' + sys.version)
+    key.update('\0' + str(get_virtualenv_version()))
+    for file_path in requirements:
+        files = get_requirement_files(os.path.join(os.environ['CONTAINER_DIR'], file_path))
+        if files is None:
+            return None
+        for path in files:
+            key.update('\0' + hash_file(path))
+    return os.path.join(template_dir, key.hexdigest())
+
+
+def _link_tree(src, dst):
+    os.mkdir(dst)
+    shutil.copystat(src, dst)
+    for name in os.listdir(src):
+        src_path = os.path.join(src, name)
+        dst_path = os.path.join(dst, name)
+        if os.path.islink(src_path):
+            os.symlink(os.readlink(src_path), dst_path)
+        elif os.path.isdir(src_path):
+            _link_tree(src_path, dst_path)
+        else:
+            os.link(src_path, dst_path)
+
+
+def clone_tree(src, dst):
+    '''
+    clone the directory ``src`` to ``dst`` by reflinking its files if
+    supported, by hardlinking them otherwise
+    '''
+    try:
+        with open(os.devnull, 'w') as devnull:
+            status = subprocess.call(['cp', '-a', '--reflink=always', src, dst], stderr=devnull)
+    except OSError:
+        status = 1
+    if status == 0:
+        return
+    if os.path.exists(dst):
+        shutil.rmtree(dst)
+    _link_tree(src, dst)
+
+
+def _rewrite(path, old, new):
+    '''replace ``old`` by ``new`` in the text file ``path`` by replacing the file'''
+    if os.path.getsize(path) > MAX_FIXUP_SIZE:
+        return
+    with open(path, 'rb') as f:
+        content = f.read()
+    if '\0' in content or old not in content:
+        return
+    tmpname = path + '.ape-tmp'
+    with open(tmpname, 'wb') as f:
+        f.write(content.replace(old, new))
+    shutil.copymode(path, tmpname)
+    os.rename(tmpname, path)
+
+
+def fix_paths(venv_dir, old, new=None):
+    '''
+    point the files of the virtualenv ``venv_dir`` cloned from ``old``
+    to ``new`` (default: ``venv_dir``)
+    '''
+    for dirpath, dirnames, filenames in os.walk(venv_dir):
+        in_bin = os.path.dirname(dirpath) == venv_dir and os.path.basename(dirpath) == 'bin'
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                continue
+            if in_bin or name.endswith('.pth') or name.endswith('.egg-link'):
+                _rewrite(path, old, new or venv_dir)
+
+
+def clone(template_path, venv_dir):
+    '''create the virtualenv ``venv_dir`` from the template'''
+    clone_tree(template_path, venv_dir)
+    fix_paths(venv_dir, template_path)
+
+
+def save(venv_dir, template_path):
+    '''save the virtualenv as template, an existing template is kept'''
+    if os.path.exists(template_path):
+        return
+    template_dir = os.path.dirname(template_path)
+    if not os.path.isdir(template_dir):
+        os.makedirs(template_dir)
+    tmp_path = '%s.tmp%d' % (template_path, os.getpid())
+    clone_tree(venv_dir, tmp_path)
+    fix_paths(tmp_path, venv_dir, template_path)
+    try:
+        os.rename(tmp_path, template_path)
+    except OSError:
+        #saved concurrently
+        shutil.rmtree(tmp_path)
@@ -1,25 +1,75 @@
-from subprocess import check_call
+from subprocess import check_call, call
+from contextlib import contextmanager
 import glob
 import os
 
 
+def get_wheelhouse():
+    '''returns the wheelhouse shared by all containers (``_ape/wheelhouse``)'''
+    return os.path.join(os.environ['APE_GLOBAL_DIR'], 'wheelhouse')
+
+
 class VirtualEnv(object):
+    '''
+    a virtualenv - with a ``wheelhouse`` packages are built into it as wheels
+    once and installed from it without accessing the package index.
+
+    Installs requested within ``batch()`` are made by a single pip run.
+    '''
 
-    def __init__(self, venv_dir):
+    def __init__(self, venv_dir, wheelhouse=None):
         self.venv_dir = venv_dir
         self.bin_dir = os.path.join(venv_dir, 'bin')
+        self.wheelhouse = wheelhouse
+        self._batch = None
 
     def call_bin(self, script_name, args):
         check_call([os.path.join(self.bin_dir, script_name)] + list(args))
 
    
     def pip_install(self, repo_url):
-        self.call_bin('pip', ['install', '-e', 'git+%s' % repo_url])
+        self.install(['-e', 'git+%s' % repo_url])
         
         
     def pip_install_requirements(self, file_path):
         file_path = os.path.join(os.environ['CONTAINER_DIR'], file_path)
-        self.call_bin('pip', ['install', '-r', file_path])
+        self.install(['-r', file_path])
+
+    def install(self, args):
+        '''install the pip arguments ``args`` now or at the end of the batch'''
+        if self._batch is not None:
+            self._batch.extend(args)
+        else:
+            self._install(args)
+
+    @contextmanager
+    def batch(self):
+        '''collect the installs made within and install them in a single pip run'''
+        if self._batch is not None:
+            #nested - the outermost batch installs
+            yield
+            return
+        self._batch = []
+        try:
+            yield
+            args = self._batch
+        finally:
+            self._batch = None
+        if args:
+            self._install(args)
+
+    def _install(self, args):
+        if not self.wheelhouse:
+            self.call_bin('pip', ['install'] + args)
+            return
+        if not os.path.isdir(self.wheelhouse):
+            os.makedirs(self.wheelhouse)
+        offline = ['install', '--no-index', '--find-links', self.wheelhouse] + args
+        if call([os.path.join(self.bin_dir, 'pip')] + offline) == 0:
+            return
+        print '... building missing wheels into %s' % self.wheelhouse
+        self.call_bin('pip', ['wheel', '--wheel-dir', self.wheelhouse, '--find-links', self.wheelhouse] + args)
+        self.call_bin('pip', offline)
 
     
     def get_paths(self):
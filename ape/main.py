@@ -1,11 +1,9 @@
-import argparse
-import inspect
 import importlib
 import sys
 import os
-import traceback
-from ape import tasks, TaskNotFound, FeatureNotFound, EnvironmentIncomplete
-from featuremonkey import get_features_from_equation_file
+from ape import (index, timing, trace, tasks, get_task_spec, unwrap, TaskNotFound,
+    FeatureNotFound, EnvironmentIncomplete)
+#argparse, inspect and featuremonkey are imported on demand - see ``ape.test.imports``
 
 def get_task_parser(task):
     '''
@@ -15,8 +13,10 @@ def get_task_parser(task):
     if task accepts only positional and explicit keyword args,
     proxy args is False.
     '''
+    import argparse
+    import inspect
 
-    args, varargs, keywords, defaults = inspect.getargspec(task)
+    args, varargs, keywords, defaults = inspect.getargspec(unwrap(task))
     defaults = defaults or []
     parser = argparse.ArgumentParser(
         prog='ape ' + task.__name__,
@@ -38,36 +38,243 @@ def get_task_parser(task):
     else:
         raise
 
-def invoke_task(task, args):
+def bind_args(spec, args):
+    '''
+    bind command line ``args`` to the arguments of a task described by
+    ``spec`` (see ``ape.get_task_spec``) without constructing a parser.
+
+    Only positional arguments and ``--kw value`` or ``--kw=value`` options
+    given by their full name are handled. Returns a dict of keyword arguments
+    or None if args need to be parsed by argparse (e.g. to render an error).
+    '''
+    names = spec['args']
+    posargslen = len(names) - len(spec['defaults'])
+    optional = names[posargslen:]
+    kws = dict(zip(optional, spec['defaults']))
+    positional = []
+    given = set()
+    args = list(args)
+    idx = 0
+    while idx < len(args):
+        arg = args[idx]
+        if arg.startswith('-'):
+            if not arg.startswith('--'):
+                return None
+            name, sep, value = arg[2:].partition('=')
+            if name not in optional or name in given:
+                return None
+            if not sep:
+                idx += 1
+                if idx == len(args) or args[idx].startswith('-'):
+                    return None
+                value = args[idx]
+            kws[name] = value
+            given.add(name)
+        else:
+            positional.append(arg)
+        idx += 1
+    if len(positional) != posargslen:
+        return None
+    kws.update(zip(names[:posargslen], positional))
+    return kws
+
+def invoke_task(task, args, spec=None, prepare=None):
     '''
     invoke task with args
+
+    ``spec`` describes the arguments of the task (see ``ape.get_task_spec``),
+    it is determined by inspecting the task if not given.
+    An ArgumentParser is only constructed if the arguments cannot be bound
+    directly.
+
+    ``prepare`` is called once the arguments have been parsed successfully,
+    right before the task is invoked.
     '''
-    parser, proxy_args = get_task_parser(task)
-    if proxy_args:
-        task(*args)
-    else:
-        pargs = parser.parse_args(args)
-        task(**vars(pargs))
+    with timing.phase('parse'):
+        spec = spec or get_task_spec(task)
+        if spec['proxy']:
+            kws = None
+        else:
+            kws = bind_args(spec, args)
+            if kws is None:
+                parser, proxy_args = get_task_parser(task)
+                kws = vars(parser.parse_args(args))
+    if prepare:
+        with timing.phase('requirements'):
+            prepare()
+    with timing.phase('execute'):
+        if kws is None:
+            task(*args)
+        else:
+            task(**kws)
 
-def run(args, features=None):
+def run_requirements(taskname):
     '''
-    composes task modules of the selected features and calls the
-    task given by args
+    execute the tasks required by task ``taskname`` (see ``ape.dag``).
+    ``APE_JOBS`` limits the number of tasks running concurrently.
     '''
+    requirements = tasks.get_requirements(taskname)
+    if requirements:
+        from ape import dag
+        dag.execute(tasks, requirements, jobs=int(os.environ.get('APE_JOBS', dag.DEFAULT_JOBS)))
 
-    features = features or []
+def load_features(features):
+    '''
+    imports the selected features and superimposes their task modules
+    '''
     for feature in features:
         try:
-            feature_module = importlib.import_module(feature)
+            with timing.phase('import ' + feature):
+                importlib.import_module(feature)
         except ImportError:
             raise FeatureNotFound(feature)
         try:
-            tasks_module = importlib.import_module(feature + '.tasks')
-            tasks.superimpose(tasks_module)
+            with timing.phase('import %s.tasks' % feature):
+                tasks_module = importlib.import_module(feature + '.tasks')
+            with timing.phase('compose ' + feature):
+                tasks.superimpose(tasks_module)
         except ImportError:
             #No tasks module in feature ... skip it
             pass
 
+class LazyComposer(object):
+    '''
+    task loader for lazy composition (see ``Tasks.set_loader``)
+
+    Only the features that introduce or refine the requested names
+    are imported and superimposed - based on the task index.
+    '''
+
+    def __init__(self, task_index, features):
+        self.task_index = task_index
+        self.features = features
+        self.loaded_features = set()
+        self.complete_names = set()
+        self.complete = False
+        #the selection is complete before its features are loaded
+        for feature, names in task_index.features:
+            module_name = feature + '.tasks'
+            if module_name not in tasks.FEATURE_SELECTION:
+                tasks.FEATURE_SELECTION.append(module_name)
+
+    def __call__(self, name):
+        if self.complete or name in self.complete_names:
+            return
+        if name is None:
+            required = self.features
+            self.complete = True
+        else:
+            required, names = self.task_index.get_required_features(name)
+            self.complete_names.update(names)
+        required = [f for f in required if f not in self.loaded_features]
+        self.loaded_features.update(required)
+        load_features(required)
+
+def store_index(task_index, features):
+    '''
+    store the task index of ``features`` and record whether the ``ape`` shell
+    function may answer container mode tasks itself (see ``ape.container_mode.index``)
+    '''
+    index.store(task_index, features)
+    from ape.container_mode import index as container_index
+    container_index.update_fast_path(task_index)
+
+def refresh_index(features, fingerprint):
+    '''
+    refresh the outdated task index of ``features`` (if any) by composing
+    only the changed features and those sharing task names with them.
+
+    Composition happens in a child process, so the registry of this process
+    stays untouched if the index cannot be refreshed.
+    Returns the refreshed index or None.
+    '''
+    outdated = index.load(features)
+    if outdated is None:
+        return None
+    changed = index.get_changed_features(outdated.fingerprint, fingerprint)
+    if not changed:
+        return None
+    names = set()
+    for feature, feature_names in outdated.features:
+        if feature in changed:
+            names.update(feature_names)
+    required = set(outdated.get_required_features(*names)[0]) | set(changed)
+    required = [feature for feature in features if feature in required]
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            load_features(required)
+            modules = index.get_module_files(fingerprint)
+            modules.update(index.get_loaded_modules(required))
+            task_index = outdated.refresh(tasks, required, index.get_fingerprint(features, modules))
+            if task_index is not None:
+                store_index(task_index, features)
+                status = 0
+        except Exception:
+            pass
+        finally:
+            os._exit(status)
+    if os.waitpid(pid, 0)[1] != 0:
+        return None
+    return index.load(features)
+
+def run(args, features=None):
+    '''
+    composes task modules of the selected features and calls the
+    task given by args
+
+    If a valid task index exists for the feature selection, help
+    and lookup of unknown tasks are answered from the index and
+    features are only composed if a task needs to be invoked.
+    Outdated indexes are refreshed incrementally (see ``refresh_index``).
+
+    If ``APE_LAZY_COMPOSITION`` is set, only the features that are needed
+    to compose the invoked task (and the tasks it calls) are imported.
+    '''
+
+    features = features or []
+    with timing.phase('load index'):
+        task_index, fingerprint = index.load_current(features)
+        if task_index is None:
+            task_index = refresh_index(features, fingerprint)
+    if task_index is not None:
+        if len(args) > 1 and args[1] in ('cd', 'switch', 'teleport', 'zap'):
+            #the shell function asked python: the fast path may be outdated
+            from ape.container_mode import index as container_index
+            container_index.update_fast_path(task_index)
+        if len(args) < 2 or (len(args) == 2 and args[1] == 'help'):
+            task_index.help()
+            return
+        elif len(args) == 3 and args[1] == 'help' and task_index.is_builtin('help'):
+            task_index.help(taskname=args[2])
+            return
+        elif not task_index.has_task(args[1], include_helpers=False):
+            print 'Task "%s" not found! Use "ape help" to get usage information.' % args[1]
+            return
+
+    if task_index is None:
+        with timing.phase('compose'):
+            load_features(features)
+        with timing.phase('store index'):
+            fingerprint = index.get_fingerprint(features, index.get_loaded_modules(features))
+            store_index(index.TaskIndex.from_registry(tasks, fingerprint), features)
+    elif os.environ.get('APE_LAZY_COMPOSITION'):
+        tasks.set_loader(LazyComposer(task_index, features))
+    else:
+        with timing.phase('compose'):
+            load_features(features)
+
+    dispatch(args, task_index)
+
+def dispatch(args, task_index=None):
+    '''
+    calls the task given by args on the composed tasks
+    argument specs are taken from ``task_index`` if given
+    '''
     if len(args) < 2 or (len(args) == 2 and args[1] == 'help'):
         tasks.help()
     else:
@@ -78,11 +285,31 @@ def run(args, features=None):
             print 'Task "%s" not found! Use "ape help" to get usage information.' % taskname
         else:
             remaining_args = args[2:] if len(args) > 2 else []
-            invoke_task(task, remaining_args)
+            spec = task_index.get_spec(taskname) if task_index else None
+            invoke_task(
+                task, remaining_args, spec,
+                prepare=lambda: run_requirements(taskname)
+            )
 
-def main():
+def get_features_from_equation_file(filename):
     '''
-    entry point when used via command line
+    returns the list of feature names read from the equation file
+    given by ``filename`` - one feature per line, comments start with ``#``.
+
+    Same as ``featuremonkey.get_features_from_equation_file``, without
+    importing featuremonkey on startup.
+    '''
+    features = []
+    with open(filename) as f:
+        for line in f:
+            line = line.split('#')[0].strip()
+            if line:
+                features.append(line)
+    return features
+
+def get_features():
+    '''
+    returns the list of selected features
 
     features are given using the environment variable ``PRODUCT_EQUATION``.
     If it is not set, ``PRODUCT_EQUATION_FILENAME`` is tried: if it points
@@ -114,13 +341,44 @@ def main():
                     'PRODUCT_EQUATION_FILENAME environment '
                     'variable needs to be set!'
                 )
+    return features
 
-    #run ape with features selected
-    run(sys.argv, features=features)
+def main():
+    '''
+    entry point when used via command line
+    see ``get_features`` on how features are selected
+
+    ``ape complete <line>`` is answered from the indexes before
+    anything is composed (see ``ape.complete``).
+
+    Set ``APE_PROFILE`` to see where the time is spent (see ``ape.timing``)
+    and ``APE_TRACE`` to record the calls of tasks (see ``ape.trace``).
+    '''
+    if len(sys.argv) > 1 and sys.argv[1] == 'complete':
+        from ape import complete
+        try:
+            features = get_features()
+        except EnvironmentIncomplete:
+            return
+        complete.main(sys.argv[2:], features)
+        return
+    profiling = timing.start()
+    trace_filename = trace.start()
+    try:
+        with timing.phase('select features'):
+            features = get_features()
+        #run ape with features selected
+        timing.run(run, sys.argv, features=features)
+    finally:
+        if profiling:
+            timing.finish()
+        if trace_filename:
+            trace.finish(trace_filename)
 
 if __name__ == '__main__':
     try:
         main()
     except Exception as e:
+        import traceback
         traceback.print_exc()
         sys.exit(1)
@@ -0,0 +1,149 @@
+'''
+memoization of helper results - see ``Tasks.register_helper``
+
+Results are cached per helper and arguments. The scope determines how long:
+
+invocation
+    for the lifetime of the ape invocation.
+product
+    like invocation, but only as long as the same product is selected.
+a number of seconds
+    for that many seconds per product. Results that can be stored as json
+    and read back with the same types (e.g. ``str``, never ``unicode``) are
+    also kept in the cache directory (``memo.json``) and are therefore
+    shared by subsequent invocations.
+
+Exceptions are never cached. Cached results are shared by all callers:
+do not modify them.
+'''
+import os
+import json
+import time
+from thread import allocate_lock
+from functools import wraps
+from ape import InvalidTask
+
+SCOPES = ('invocation', 'product')
+
+#environment variables that determine the selected product
+PRODUCT_VARIABLES = (
+    'PRODUCT_DIR',
+    'PRODUCT_EQUATION',
+    'PRODUCT_EQUATION_FILENAME',
+    'APE_PREPEND_FEATURES',
+)
+
+#bump this whenever the format of the stored results changes
+MEMO_VERSION = 1
+
+#key -> (expiry timestamp or None, result)
+_results = dict()
+_lock = allocate_lock()
+
+
+def check_scope(scope):
+    '''raises InvalidTask if ``scope`` is not a valid memoization scope'''
+    if scope in SCOPES:
+        return
+    if isinstance(scope, (int, long, float)) and not isinstance(scope, bool) and scope > 0:
+        return
+    raise InvalidTask('invalid memoization scope: %r' % (scope,))
+
+
+def clear():
+    '''forget all results cached in memory'''
+    _results.clear()
+
+
+def get_key(name, args, kws):
+    '''returns the key of task ``name`` invoked with ``args`` and ``kws``'''
+    return name + json.dumps([list(args), kws], sort_keys=True, default=repr)
+
+
+def get_product_key():
+    return '\n'.join([os.environ.get(name, '') for name in PRODUCT_VARIABLES])
+
+
+def get_memo_filename():
+    from ape.index import get_cache_dir
+    cache_dir = get_cache_dir()
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, 'memo.json')
+
+
+def _read(filename):
+    try:
+        with open(filename) as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return dict()
+    if data.get('version') != MEMO_VERSION:
+        return dict()
+    return data.get('results', dict())
+
+
+def load(key):
+    '''returns the (expires, result) tuple stored for ``key`` or None'''
+    filename = get_memo_filename()
+    if not filename:
+        return None
+    from ape.index import _from_json
+    entry = _read(filename).get(key)
+    if entry is None or entry[0] <= time.time():
+        return None
+    return entry[0], _from_json(entry[1])
+
+
+def store(key, expires, result):
+    '''store ``result`` until ``expires``, failures are ignored'''
+    from ape.index import _is_storable
+    filename = get_memo_filename()
+    if not filename or not _is_storable(result):
+        return
+    with _lock:
+        now = time.time()
+        results = dict([
+            (other_key, entry) for other_key, entry in _read(filename).items()
+            if entry[0] > now
+        ])
+        results[key] = [expires, result]
+        cache_dir = os.path.dirname(filename)
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            import tempfile
+            fd, tmpname = tempfile.mkstemp(dir=cache_dir, prefix='.memo-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dict(version=MEMO_VERSION, results=results), f)
+            os.rename(tmpname, filename)
+        except (IOError, OSError):
+            pass
+
+
+def make_memoized(name, task, scope):
+    '''wrap ``task`` so its results are cached for ``scope``'''
+    ttl = None if scope in SCOPES else scope
+
+    @wraps(task)
+    def memoized_task(*args, **kws):
+        key = get_key(name, args, kws)
+        if scope != 'invocation':
+            key = get_product_key() + '\n' + key
+        entry = _results.get(key)
+        if entry is None and ttl is not None:
+            entry = load(key)
+            if entry is not None:
+                _results[key] = entry
+        if entry is not None and (entry[0] is None or entry[0] > time.time()):
+            return entry[1]
+        result = task(*args, **kws)
+        expires = None
+        if ttl is not None:
+            expires = time.time() + ttl
+            store(key, expires, result)
+        _results[key] = (expires, result)
+        return result
+
+    memoized_task.__wrapped__ = task
+    return memoized_task
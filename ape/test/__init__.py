@@ -1,12 +1,48 @@
 from __future__ import absolute_import
 import unittest
-from ape.test.argparser import TestArgParser
+from ape.test.argparser import TestArgParser, TestArgBinder
 from ape.test.invokation import TestTaskInvokation
+from ape.test.index import TestTaskIndex
+from ape.test.daemon import TestDaemon, TestServedDaemon
+from ape.test.batch import TestBatch
+from ape.test.gitinfo import TestGitInfo
+from ape.test.containerindex import TestContainerIndex
+from ape.test.complete import TestCompletion
+from ape.test.dag import TestDag
+from ape.test.incremental import TestIncremental
+from ape.test.memo import TestMemo
+from ape.test.timing import TestTiming
+from ape.test.trace import TestTrace
+from ape.test.benchmarks import TestBenchmarks
+from ape.test.imports import TestImports
+from ape.test.productenv import TestProductEnv
+from ape.test.installtools import TestFetch, TestMirror, TestInstall, TestVirtualEnv, TestTemplate
 
 def suite():
     return unittest.TestSuite([
         unittest.TestLoader().loadTestsFromTestCase(TestArgParser),
+        unittest.TestLoader().loadTestsFromTestCase(TestArgBinder),
         unittest.TestLoader().loadTestsFromTestCase(TestTaskInvokation),
+        unittest.TestLoader().loadTestsFromTestCase(TestTaskIndex),
+        unittest.TestLoader().loadTestsFromTestCase(TestDaemon),
+        unittest.TestLoader().loadTestsFromTestCase(TestServedDaemon),
+        unittest.TestLoader().loadTestsFromTestCase(TestBatch),
+        unittest.TestLoader().loadTestsFromTestCase(TestGitInfo),
+        unittest.TestLoader().loadTestsFromTestCase(TestContainerIndex),
+        unittest.TestLoader().loadTestsFromTestCase(TestCompletion),
+        unittest.TestLoader().loadTestsFromTestCase(TestDag),
+        unittest.TestLoader().loadTestsFromTestCase(TestIncremental),
+        unittest.TestLoader().loadTestsFromTestCase(TestMemo),
+        unittest.TestLoader().loadTestsFromTestCase(TestTiming),
+        unittest.TestLoader().loadTestsFromTestCase(TestTrace),
+        unittest.TestLoader().loadTestsFromTestCase(TestBenchmarks),
+        unittest.TestLoader().loadTestsFromTestCase(TestImports),
+        unittest.TestLoader().loadTestsFromTestCase(TestProductEnv),
+        unittest.TestLoader().loadTestsFromTestCase(TestFetch),
+        unittest.TestLoader().loadTestsFromTestCase(TestMirror),
+        unittest.TestLoader().loadTestsFromTestCase(TestInstall),
+        unittest.TestLoader().loadTestsFromTestCase(TestVirtualEnv),
+        unittest.TestLoader().loadTestsFromTestCase(TestTemplate),
     ])
 
 
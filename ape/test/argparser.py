@@ -1,7 +1,8 @@
 from __future__ import absolute_import
 import unittest
 import sys
-from ape.main import get_task_parser, invoke_task
+from ape import get_task_spec, InvalidTask
+from ape.main import get_task_parser, invoke_task, bind_args
 import sys
 from .base import SilencedTest
 
@@ -79,3 +80,56 @@ class TestArgParser(SilencedTest, unittest.TestCase):
         )
 
         self.assertRaises(SystemExit, parser.parse_args, '1'.split())
+
+
+class TestArgBinder(SilencedTest, unittest.TestCase):
+
+    def assertBindsLikeParser(self, task, args):
+        '''the binder either agrees with argparse or defers to it'''
+        spec = get_task_spec(task)
+        bound = bind_args(spec, args.split())
+        parser, proxy_args = get_task_parser(task)
+        try:
+            parsed = vars(parser.parse_args(args.split()))
+        except SystemExit:
+            self.assertEqual(None, bound)
+        else:
+            if bound is not None:
+                self.assertEqual(parsed, bound)
+        return bound
+
+    def test_spec(self):
+
+        def posoptparams(x, y, kw1='1', kw2=None): pass
+        def proxyparam(*args): pass
+        def kwparams(**kws): pass
+
+        self.assertEqual(
+            dict(args=['x', 'y', 'kw1', 'kw2'], defaults=['1', None], proxy=False),
+            get_task_spec(posoptparams)
+        )
+        self.assertEqual(dict(args=[], defaults=[], proxy=True), get_task_spec(proxyparam))
+        self.assertRaises(InvalidTask, get_task_spec, kwparams)
+
+    def test_bind(self):
+
+        def posoptparams(x, y, kw1='1', kw2='2'): pass
+
+        self.assertEqual(
+            {'x': 'f', 'y': 'g', 'kw1': 'a', 'kw2': '2'},
+            self.assertBindsLikeParser(posoptparams, 'f --kw1 a g')
+        )
+        self.assertEqual(
+            {'x': 'f', 'y': 'g', 'kw1': '1', 'kw2': 'b'},
+            self.assertBindsLikeParser(posoptparams, 'f g --kw2=b')
+        )
+        for args in ('f', 'f g h', 'f g --kw3 a', 'f g --kw1', 'f g --kw1 a --kw1 b',
+                '-f g', 'f g --kw1 -1', 'f g --kw', 'f -- g'):
+            self.assertBindsLikeParser(posoptparams, args)
+
+    def test_bind_noparam(self):
+
+        def noparam(): pass
+
+        self.assertEqual({}, self.assertBindsLikeParser(noparam, ''))
+        self.assertEqual(None, self.assertBindsLikeParser(noparam, 'arg1'))
@@ -1,4 +1,7 @@
+import os
 import sys
+import shutil
+import tempfile
 from cStringIO import StringIO
 
 class SilencedTest(object):
@@ -16,3 +19,24 @@ class SilencedTest(object):
         sys.stdout = self.out
         sys.stderr = self.err
 
+
+class CacheTest(object):
+    '''mixin for unittest.TestCase
+    runs the test in the temporary directory ``self.tmpdir`` with the cache
+    in its subdirectory ``cache_dir``; the environment is restored afterwards
+    '''
+
+    cache_dir = 'cache'
+
+    def setUp(self):
+        super(CacheTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.old_environ = dict(os.environ)
+        os.environ['APE_CACHE_DIR'] = os.path.join(self.tmpdir, self.cache_dir)
+        os.environ.pop('APE_NO_CACHE', None)
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.old_environ)
+        shutil.rmtree(self.tmpdir)
+        super(CacheTest, self).tearDown()
@@ -0,0 +1,37 @@
+from __future__ import absolute_import
+import unittest
+import threading
+from cStringIO import StringIO
+from ape import batch
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_parse_manifest(self):
+        jobs = batch.parse_manifest([
+            '# deploy everything\n',
+            'herbert:website deploy --force 1\n',
+            '\n',
+            'herbert:shop "say hello" \'a b\'  # greet\n',
+        ])
+        self.assertEqual(
+            [(1, 'herbert:website', ['deploy', '--force', '1']),
+             (2, 'herbert:shop', ['say hello', 'a b'])],
+            [(job.number, job.poi, job.argv) for job in jobs]
+        )
+        self.assertEqual('2 herbert:shop say hello', str(jobs[1]))
+        self.assertRaises(ValueError, batch.parse_manifest, ['herbert:website\n'])
+
+    def test_prefixed_output(self):
+        out = StringIO()
+        output = batch.PrefixedOutput('1 c:p task', threading.Lock(), out)
+        output.write('first line\nsecond ')
+        self.assertEqual('[1 c:p task] first line\n', out.getvalue())
+        output.write('line\nincomplete')
+        output.close()
+        self.assertEqual(
+            '[1 c:p task] first line\n'
+            '[1 c:p task] second line\n'
+            '[1 c:p task] incomplete\n',
+            out.getvalue()
+        )
@@ -0,0 +1,274 @@
+'''
+benchmarks of ape - run ``python -m ape.test.bench --help`` for usage
+
+A synthetic ape root is generated: ``--containers`` containers with
+``--products`` products each and ``--features`` features (the first one
+introduces ``--tasks`` tasks, all others refine every one of them) selected
+by every product.
+
+Every scenario is measured in fresh ape processes (cold start) after a warm
+up run, so caches like the task index are populated as in daily use.
+Results can be saved and compared to a baseline: the benchmark fails if the
+median of a scenario regressed by more than ``--tolerance``. It also fails if
+importing ``ape.main`` takes longer than ``--import-budget`` milliseconds.
+'''
+from __future__ import absolute_import
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+FEATURE_PREFIX = 'benchfeature'
+
+#measures the composition of the features in a fresh process
+SUPERIMPOSE_SCRIPT = '''
+import sys, time
+from ape.main import load_features
+start = time.time()
+load_features(sys.argv[1:])
+sys.stdout.write(repr(time.time() - start))
+'''
+
+#measures the import of ape's entry point in a fresh process
+IMPORT_SCRIPT = '''
+import sys, time
+start = time.time()
+import ape.main
+sys.stdout.write(repr(time.time() - start))
+'''
+
+#name, command line or script, additional environment
+SCENARIOS = [
+    ('import', IMPORT_SCRIPT, {}),
+    ('superimpose', SUPERIMPOSE_SCRIPT, {}),
+    ('help', ['help'], {}),
+    ('help (no cache)', ['help'], {'APE_NO_CACHE': '1'}),
+    ('run task', ['task0'], {}),
+    ('info', ['info'], {}),
+    ('switch', ['switch', 'c0:p0'], {}),
+    ('explain_features', ['explain_features'], {}),
+]
+
+INTRODUCE_TEMPLATE = '''
+@tasks.register
+def task%(idx)d(value='1'):
+    \'\'\'synthetic task %(idx)d\'\'\'
+    return value
+'''
+
+REFINE_TEMPLATE = '''
+def refine_task%(idx)d(original):
+    def task%(idx)d(value='1'):
+        \'\'\'synthetic task %(idx)d refined by %(feature)s\'\'\'
+        return original(value)
+    return task%(idx)d
+'''
+
+
+def get_feature_names(features):
+    return ['%s%d' % (FEATURE_PREFIX, idx) for idx in range(features)]
+
+
+def create_aperoot(root, containers, products, features, tasks):
+    '''generate the synthetic ape root'''
+    os.makedirs(os.path.join(root, '_ape'))
+    feature_names = get_feature_names(features)
+    for container_idx in range(containers):
+        container_dir = os.path.join(root, 'c%d' % container_idx)
+        os.makedirs(os.path.join(container_dir, 'features'))
+        for product_idx in range(products):
+            product_dir = os.path.join(container_dir, 'products', 'p%d' % product_idx)
+            os.makedirs(product_dir)
+            with open(os.path.join(product_dir, 'product.equation'), 'w') as f:
+                f.write('\n'.join(feature_names) + '\n')
+
+    features_dir = os.path.join(root, 'c0', 'features')
+    for feature_idx, feature in enumerate(feature_names):
+        os.mkdir(os.path.join(features_dir, feature))
+        with open(os.path.join(features_dir, feature, '__init__.py'), 'w') as f:
+            f.write('__version__ = "1.0"\n')
+        with open(os.path.join(features_dir, feature, 'tasks.py'), 'w') as f:
+            f.write('from ape import tasks\n')
+            template = REFINE_TEMPLATE if feature_idx else INTRODUCE_TEMPLATE
+            for task_idx in range(tasks):
+                f.write(template % dict(idx=task_idx, feature=feature))
+
+
+def get_environment(root):
+    '''returns the environment of product c0:p0 in container mode'''
+    product_dir = os.path.join(root, 'c0', 'products', 'p0')
+    env = dict(os.environ)
+    for name in ('PRODUCT_EQUATION', 'APE_NO_CACHE', 'APE_CACHE_DIR', 'APE_PROFILE',
+            'APE_TRACE', 'APE_USE_DAEMON', 'APE_LAZY_COMPOSITION'):
+        env.pop(name, None)
+    ape_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env.update(
+        APE_ROOT_DIR=root,
+        APE_GLOBAL_DIR=os.path.join(root, '_ape'),
+        APE_PREPEND_FEATURES='ape.container_mode',
+        CONTAINER_NAME='c0',
+        PRODUCT_NAME='p0',
+        CONTAINER_DIR=os.path.join(root, 'c0'),
+        PRODUCT_DIR=product_dir,
+        PRODUCT_EQUATION_FILENAME=os.path.join(product_dir, 'product.equation'),
+        PYTHONPATH=os.pathsep.join([
+            ape_dir,
+            os.path.join(root, 'c0', 'features'),
+            os.path.join(root, 'c0', 'products'),
+        ]),
+    )
+    return env
+
+
+def measure(argv, env, repeat, features=None):
+    '''
+    returns the wall times of ``repeat`` runs of ape with ``argv``;
+    if ``argv`` is a script, the time it reports when run with ``features``
+    '''
+    times = []
+    devnull = open(os.devnull, 'w')
+    try:
+        for _ in range(repeat + 1):
+            start = time.time()
+            if isinstance(argv, basestring):
+                output = subprocess.Popen(
+                    [sys.executable, '-c', argv] + features,
+                    env=env, stdout=subprocess.PIPE
+                ).communicate()[0]
+                elapsed = float(output)
+            else:
+                status = subprocess.call(
+                    [sys.executable, '-m', 'ape.main'] + argv,
+                    env=env, stdout=devnull, stderr=devnull
+                )
+                if status != 0:
+                    raise RuntimeError('ape %s failed' % ' '.join(argv))
+                elapsed = time.time() - start
+            times.append(elapsed)
+    finally:
+        devnull.close()
+    #the first run is a warm up
+    return times[1:]
+
+
+def summarize(times):
+    times = sorted(times)
+    return dict(min=times[0], median=times[len(times) // 2], runs=len(times))
+
+
+def run_benchmarks(parameters, repeat, scenarios=None):
+    '''
+    run the benchmarks on a synthetic ape root described by ``parameters``
+    returns a dict with the parameters and the results per scenario
+    '''
+    root = tempfile.mkdtemp(prefix='ape-bench-')
+    try:
+        create_aperoot(root, **parameters)
+        results = dict()
+        for name, argv, extra_env in SCENARIOS:
+            if scenarios and name not in scenarios:
+                continue
+            env = get_environment(root)
+            env.update(extra_env)
+            features = ['ape.container_mode'] + get_feature_names(parameters['features'])
+            times = measure(argv, env, repeat, features)
+            results[name] = summarize(times)
+    finally:
+        shutil.rmtree(root)
+    return dict(
+        parameters=parameters,
+        python=sys.version.split()[0],
+        results=results,
+    )
+
+
+def compare(results, baseline, tolerance):
+    '''
+    returns a list of (scenario, baseline median, median) tuples
+    of the scenarios that regressed by more than ``tolerance``
+    '''
+    regressions = []
+    for name, result in sorted(results['results'].items()):
+        reference = baseline['results'].get(name)
+        if reference is None:
+            continue
+        if result['median'] > reference['median'] * (1 + tolerance):
+            regressions.append((name, reference['median'], result['median']))
+    return regressions
+
+
+def print_results(results, baseline=None, out=None):
+    out = out or sys.stdout
+    out.write('%-20s %10s %10s %10s\n' % ('scenario', 'min ms', 'median ms', 'baseline'))
+    for name, _, _ in SCENARIOS:
+        if name not in results['results']:
+            continue
+        result = results['results'][name]
+        reference = ''
+        if baseline and name in baseline['results']:
+            reference = '%.1f' % (baseline['results'][name]['median'] * 1000)
+        out.write('%-20s %10.1f %10.1f %10s\n' % (
+            name, result['min'] * 1000, result['median'] * 1000, reference
+        ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m ape.test.bench',
+        description='benchmark ape on a synthetic ape root',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument('--containers', type=int, default=10)
+    parser.add_argument('--products', type=int, default=10, help='products per container')
+    parser.add_argument('--features', type=int, default=10, help='features per product')
+    parser.add_argument('--tasks', type=int, default=20, help='tasks refined by every feature')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per scenario')
+    parser.add_argument('--scenario', action='append', help='only run the given scenario(s)')
+    parser.add_argument('--save', help='store the results as json')
+    parser.add_argument('--baseline', help='compare to results stored using --save')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+        help='allowed relative slowdown of the median compared to the baseline')
+    parser.add_argument('--import-budget', type=float,
+        help='maximum median time (ms) to import ape.main')
+    args = parser.parse_args(argv)
+
+    parameters = dict(
+        containers=args.containers,
+        products=args.products,
+        features=args.features,
+        tasks=args.tasks,
+    )
+    results = run_benchmarks(parameters, args.repeat, args.scenario)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['parameters'] != parameters:
+            print 'warning: the baseline was measured with %s' % baseline['parameters']
+    print_results(results, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    status = 0
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for name, reference, median in regressions:
+            print 'regression: %s %.1f ms -> %.1f ms' % (name, reference * 1000, median * 1000)
+        if regressions:
+            status = 1
+    if args.import_budget is not None and 'import' in results['results']:
+        median = results['results']['import']['median'] * 1000
+        if median > args.import_budget:
+            print 'import of ape.main took %.1f ms, budget is %.1f ms' % (median, args.import_budget)
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,26 @@
+from __future__ import absolute_import
+import unittest
+from ape.test import bench
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_run(self):
+        results = bench.run_benchmarks(
+            dict(containers=2, products=2, features=2, tasks=2),
+            repeat=1, scenarios=['superimpose', 'switch']
+        )
+        self.assertEqual(['superimpose', 'switch'], sorted(results['results']))
+        self.assertEqual(1, results['results']['switch']['runs'])
+
+    def test_compare(self):
+        baseline = dict(results=dict(
+            help=dict(median=0.1),
+            info=dict(median=0.1),
+        ))
+        results = dict(results=dict(
+            help=dict(median=0.11),
+            info=dict(median=0.2),
+            switch=dict(median=1.0),
+        ))
+        self.assertEqual([('info', 0.1, 0.2)], bench.compare(results, baseline, 0.2))
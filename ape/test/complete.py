@@ -0,0 +1,65 @@
+from __future__ import absolute_import
+import unittest
+import os
+import shutil
+import tempfile
+from ape import index
+from ape.complete import complete
+
+
+class TestCompletion(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.old_environ = dict(os.environ)
+        os.environ['APE_ROOT_DIR'] = self.root
+        os.environ['APE_CACHE_DIR'] = os.path.join(self.root, '_ape', 'cache')
+        os.environ.pop('APE_NO_CACHE', None)
+        for path in ('_ape', 'herbert/products/website', 'herbert/products/shop', 'zoo/products/web'):
+            os.makedirs(os.path.join(self.root, path))
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            os.utime(dirpath, (0, 1000000))
+
+        def task(signature, args=(), defaults=(), helper=False):
+            spec = dict(args=list(args), defaults=list(defaults), proxy=False)
+            return dict(signature=signature, spec=spec, doc=None, file='tasks.py', helper=helper)
+
+        self.features = ['nonexistingfeature']
+        index.store(index.TaskIndex(index.get_fingerprint(self.features), 'docs', {
+            'help': task('help(taskname=None)', ['taskname'], [None]),
+            'switch': task('switch(poi)', ['poi']),
+            'cd': task('cd(doi)', ['doi']),
+            'info': task('info(format=text, depth=2)', ['format', 'depth'], ['text', 2]),
+            'install_container': task('install_container(container_name)', ['container_name']),
+            'get_products': task('get_products(container_name)', ['container_name'], helper=True),
+        }), self.features)
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.old_environ)
+        shutil.rmtree(self.root)
+
+    def complete(self, line):
+        return complete(line, self.features)
+
+    def test_tasks(self):
+        self.assertEqual(['cd', 'help', 'info', 'install_container', 'switch'], self.complete('ape '))
+        self.assertEqual(['info', 'install_container'], self.complete('ape i'))
+        self.assertEqual(['switch'], self.complete('ape help sw'))
+        self.assertEqual([], self.complete('ape get_'))
+        self.assertEqual([], self.complete('ape unknown '))
+
+    def test_parameters(self):
+        self.assertEqual(['--format', '--depth'], self.complete('ape info -'))
+        self.assertEqual(['--depth'], self.complete('ape info --format json --'))
+        self.assertEqual([], self.complete('ape info --format '))
+        self.assertEqual([], self.complete('ape switch herbert:website '))
+
+    def test_pois(self):
+        self.assertEqual(['herbert:shop', 'herbert:website', 'zoo:web'], self.complete('ape switch '))
+        self.assertEqual(['herbert', 'herbert:shop', 'herbert:website'], self.complete('ape cd he'))
+        #bash splits the current word at the colon
+        self.assertEqual(['shop'], self.complete('ape switch herbert:s'))
+
+    def test_no_index(self):
+        self.assertEqual([], complete('ape ', ['otherfeature']))
@@ -0,0 +1,152 @@
+from __future__ import absolute_import
+import unittest
+import os
+import sys
+import json
+import subprocess
+from ape.container_mode import index
+from .base import CacheTest
+
+
+class TestContainerIndex(CacheTest, unittest.TestCase):
+
+    cache_dir = os.path.join('_ape', 'cache')
+
+    def setUp(self):
+        super(TestContainerIndex, self).setUp()
+        for path in ('_ape', 'herbert/products/website', 'herbert/products/_hidden',
+                'herbert/features', 'notacontainer'):
+            os.makedirs(os.path.join(self.tmpdir, path))
+        self.age()
+
+    def age(self):
+        '''move all mtimes to the past, so the index is not racy'''
+        for dirpath, dirnames, filenames in os.walk(self.tmpdir):
+            os.utime(dirpath, (0, 1000000))
+
+    def test_build(self):
+        container_index = index.ContainerIndex.build(self.tmpdir)
+        self.assertEqual(['herbert'], container_index.get_containers())
+        self.assertEqual(['website'], container_index.get_products('herbert'))
+        self.assertTrue(container_index.is_valid())
+
+    def test_invalidation(self):
+        container_index = index.ContainerIndex.build(self.tmpdir)
+        os.mkdir(os.path.join(self.tmpdir, 'herbert', 'products', 'shop'))
+        self.assertFalse(container_index.is_valid())
+        self.age()
+        container_index = index.ContainerIndex.build(self.tmpdir)
+        os.mkdir(os.path.join(self.tmpdir, 'notacontainer', 'products'))
+        self.assertFalse(container_index.is_valid())
+
+    def test_racy(self):
+        os.mkdir(os.path.join(self.tmpdir, 'herbert', 'products', 'shop'))
+        self.assertFalse(index.ContainerIndex.build(self.tmpdir).is_valid())
+
+    def test_load(self):
+        index.load(self.tmpdir)
+        #creating the cache directory touched _ape
+        self.age()
+        container_index = index.load(self.tmpdir)
+        self.assertTrue(os.path.exists(index.get_index_filename()))
+        loaded = index.load(self.tmpdir)
+        self.assertEqual(container_index.built_at, loaded.built_at)
+        os.makedirs(os.path.join(self.tmpdir, 'otto', 'products', 'blog'))
+        #in the order of the directory listing, as before the index
+        self.assertEqual(
+            [name for name in os.listdir(self.tmpdir) if name in ('herbert', 'otto')],
+            index.load(self.tmpdir).get_containers()
+        )
+
+    def test_shell_table(self):
+        os.makedirs(os.path.join(self.tmpdir, "o'brien", 'products', 'blog'))
+        container_index = index.ContainerIndex.build(self.tmpdir)
+        script = container_index.get_shell_table() + '\n'.join([
+            'for poi in herbert herbert:website herbert:_hidden herbert:shop "o\'brien:blog"',
+            'do',
+            '    _ape_lookup_poi "$poi" && echo "$poi $_APE_POI_DIR" || echo "$poi -"',
+            'done',
+        ])
+        output = subprocess.Popen(['bash', '-c', script], stdout=subprocess.PIPE).communicate()[0]
+        self.assertEqual([
+            'herbert %s/herbert' % self.tmpdir,
+            'herbert:website %s/herbert/products/website' % self.tmpdir,
+            'herbert:_hidden -',
+            'herbert:shop -',
+            "o'brien:blog -",
+        ], output.splitlines())
+
+    def test_refresh(self):
+        index.load(self.tmpdir)
+        table = os.path.join(os.environ['APE_CACHE_DIR'], 'pois.sh')
+        self.assertTrue(os.path.exists(table))
+        os.makedirs(os.path.join(self.tmpdir, 'herbert', 'products', 'shop'))
+        index.refresh(self.tmpdir)
+        with open(table) as f:
+            self.assertTrue("'herbert:shop')" in f.read())
+        self.assertEqual(['shop', 'website'], sorted(index.get(self.tmpdir).get_products('herbert')))
+
+    def fast_selection(self, *equations):
+        '''returns whether ``fastpath.sh`` allows the fast path for each of the ``equations``'''
+        fastpath = os.path.join(os.environ['APE_CACHE_DIR'], 'fastpath.sh')
+        with open(fastpath) as f:
+            script = f.read() + '\n'.join([
+                'for PRODUCT_EQUATION_FILENAME in %s' % ' '.join(equations),
+                'do',
+                '    _ape_fast_selection %s && echo yes || echo no' % fastpath,
+                'done',
+            ])
+        output = subprocess.Popen(['bash', '-c', script], stdout=subprocess.PIPE).communicate()[0]
+        return [line == 'yes' for line in output.splitlines()]
+
+    def test_fast_path(self):
+        from ape.index import TaskIndex
+        os.environ.update(APE_PREPEND_FEATURES='ape.container_mode', PRODUCT_EQUATION='', PRODUCT_EQUATION_FILENAME='/a')
+        index.update_fast_path(TaskIndex(None, 'docs', {}, [('ape.container_mode', ['cd', 'switch']), ('a', ['foo'])]))
+        os.environ['PRODUCT_EQUATION_FILENAME'] = '/b'
+        index.update_fast_path(TaskIndex(None, 'docs', {}, [('ape.container_mode', ['cd', 'switch']), ('b', ['cd'])]))
+        os.environ['PRODUCT_EQUATION_FILENAME'] = '/c'
+        index.update_fast_path(TaskIndex(None, 'docs', {}, [('c', ['foo'])]))
+        self.assertEqual([True, False, False, False], self.fast_selection('/a', '/b', '/c', '/d'))
+
+    def test_fast_path_changes(self):
+        #changing the equation or a module of the selection disables the fast path
+        from ape.index import TaskIndex
+        tasks_file = os.path.join(self.tmpdir, 'tasks.py')
+        equations = [os.path.join(self.tmpdir, name) for name in ('a.equation', 'b.equation')]
+        for filename in [tasks_file] + equations:
+            open(filename, 'w').close()
+            os.utime(filename, (0, 1000000))
+        fingerprint = [['ape', '0.5', tasks_file, 1000000.0, 0, []]]
+        os.environ.update(APE_PREPEND_FEATURES='ape.container_mode', PRODUCT_EQUATION='')
+        for equation in equations:
+            os.environ['PRODUCT_EQUATION_FILENAME'] = equation
+            index.update_fast_path(TaskIndex(fingerprint, 'docs', {}, [('ape.container_mode', ['cd'])]))
+        self.assertEqual([True, True], self.fast_selection(*equations))
+
+        os.utime(equations[0], (0, 2000000))
+        self.assertEqual([False, True], self.fast_selection(*equations))
+        #storing another selection does not enable the changed one again
+        index.update_fast_path(TaskIndex(fingerprint, 'docs', {}, [('ape.container_mode', ['cd'])]))
+        self.assertEqual([False, True], self.fast_selection(*equations))
+
+        os.utime(tasks_file, (0, 2000000))
+        self.assertEqual([False, False], self.fast_selection(*equations))
+
+    def test_refined_layout(self):
+        #the index is bypassed if features move containers elsewhere
+        from ape.test import bench
+        bench.create_aperoot(os.path.join(self.tmpdir, 'bench'), containers=1, products=1, features=1, tasks=1)
+        env = bench.get_environment(os.path.join(self.tmpdir, 'bench'))
+        os.makedirs(os.path.join(self.tmpdir, 'bench', 'moved', 'products', 'px'))
+        with open(os.path.join(self.tmpdir, 'bench', 'c0', 'features', 'benchfeature0', 'tasks.py'), 'a') as f:
+            f.write(
+                'def refine_get_container_dir(original):\n'
+                '    def get_container_dir(container_name):\n'
+                '        return original("moved" if container_name == "c0" else container_name)\n'
+                '    return get_container_dir\n'
+            )
+        output = subprocess.Popen([sys.executable, '-m', 'ape.main', 'info', '--format', 'json'],
+            env=env, stdout=subprocess.PIPE).communicate()[0]
+        containers = dict([(c['name'], c['products']) for c in json.loads(output)['containers']])
+        self.assertEqual(['px'], containers['c0'])
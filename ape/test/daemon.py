@@ -0,0 +1,118 @@
+from __future__ import absolute_import
+import unittest
+import os
+import sys
+import shutil
+import time
+import signal
+import socket
+import tempfile
+import subprocess
+from cStringIO import StringIO
+from ape import client, daemon
+from .base import SilencedTest, CacheTest
+
+
+class TestDaemon(SilencedTest, unittest.TestCase):
+
+    def test_socket_path(self):
+        environ = dict(PRODUCT_EQUATION_FILENAME='/a/product.equation')
+        path = client.get_socket_path(environ)
+        self.assertEqual(path, client.get_socket_path(dict(environ)))
+        environ['PRODUCT_EQUATION_FILENAME'] = '/b/product.equation'
+        self.assertNotEqual(path, client.get_socket_path(environ))
+        self.assertEqual(None, client.get_socket_path({}))
+
+    def test_private_socket_dir(self):
+        root = tempfile.mkdtemp()
+        try:
+            socket_dir = os.path.join(root, 'serve')
+            path = os.path.join(socket_dir, 'test.sock')
+            self.assertTrue(daemon._make_socket_dir(socket_dir))
+            listener = daemon._bind(path)
+            self.assertEqual(0600, os.stat(path).st_mode & 0777)
+            self.assertEqual(None, daemon._bind(path))
+            os.chmod(socket_dir, 0755)
+            self.assertFalse(daemon._make_socket_dir(socket_dir))
+            #the environment is not sent to a socket others could have bound
+            self.assertEqual(None, client.request(path, ['ape', 'help'], sys.stdout))
+            listener.close()
+        finally:
+            shutil.rmtree(root)
+
+    def test_frames(self):
+        left, right = socket.socketpair()
+        client.send_frame(left, client.OUTPUT, 'some output')
+        client.send_frame(left, client.EXIT, '0')
+        left.close()
+        self.assertEqual((client.OUTPUT, 'some output'), client.recv_frame(right))
+        self.assertEqual((client.EXIT, '0'), client.recv_frame(right))
+        self.assertEqual((None, None), client.recv_frame(right))
+
+    def test_exit_status(self):
+        pid = os.fork()
+        if pid == 0:
+            os._exit(3)
+        self.assertEqual(3, daemon.get_exit_status(os.waitpid(pid, 0)[1]))
+
+    def test_handle(self):
+        left, right = socket.socketpair()
+        client.send_frame(left, client.REQUEST, '{"argv": ["ape", "help", "help"], "env": {}, "cwd": "/"}')
+        self.assertEqual(0, daemon.handle(right))
+        right.close()
+        output = []
+        while True:
+            kind, payload = client.recv_frame(left)
+            if kind != client.OUTPUT:
+                break
+            output.append(payload)
+        self.assertEqual((client.EXIT, '0'), (kind, payload))
+        self.assertTrue('print help on specific task' in ''.join(output))
+
+
+class TestServedDaemon(CacheTest, unittest.TestCase):
+
+    def setUp(self):
+        super(TestServedDaemon, self).setUp()
+        feature_dir = os.path.join(self.tmpdir, 'servedfeature')
+        os.mkdir(feature_dir)
+        open(os.path.join(feature_dir, '__init__.py'), 'w').close()
+        self.tasks_file = os.path.join(feature_dir, 'tasks.py')
+        self.write_task('served')
+        os.environ['PRODUCT_EQUATION'] = 'servedfeature'
+        os.environ['PYTHONPATH'] = os.pathsep.join([self.tmpdir] + sys.path)
+        with open(os.devnull, 'w') as devnull:
+            self.daemon = subprocess.Popen([sys.executable, '-m', 'ape.daemon', '--timeout', '60'], stdout=devnull)
+
+    def tearDown(self):
+        os.kill(self.daemon.pid, signal.SIGTERM)
+        self.daemon.wait()
+        super(TestServedDaemon, self).tearDown()
+
+    def write_task(self, output):
+        with open(self.tasks_file, 'w') as f:
+            f.write('def introduce_hello():\n    def hello():\n        print "%s"\n    return hello\n' % output)
+
+    def request(self, retries=100):
+        '''returns (status, output) of ``ape hello`` once the daemon serves it'''
+        path = client.get_socket_path()
+        out = StringIO()
+        status = client.request(path, ['ape', 'hello'], out)
+        while status is None and retries:
+            time.sleep(0.1)
+            retries -= 1
+            status = client.request(path, ['ape', 'hello'], out)
+        return status, out.getvalue()
+
+    def test_source_change(self):
+        self.assertEqual((0, 'served\n'), self.request())
+        self.write_task('changed')
+        future = time.time() + 10
+        os.utime(self.tasks_file, (future, future))
+        #the stale daemon does not serve the request - ape runs directly
+        process = subprocess.Popen([sys.executable, '-m', 'ape.client', 'hello'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.assertEqual(('changed\n', ''), process.communicate())
+        self.assertEqual(0, process.returncode)
+        #and restarts serving the changed sources
+        self.assertEqual((0, 'changed\n'), self.request())
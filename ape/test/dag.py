@@ -0,0 +1,75 @@
+from __future__ import absolute_import
+import unittest
+import time
+import threading
+from ape import dag, TaskNotFound, CyclicRequirement
+
+
+class Registry(object):
+    '''minimal task registry recording the order tasks are called in'''
+
+    def __init__(self, requirements, delay=0, failing=()):
+        self.requirements = requirements
+        self.calls = []
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.delay = delay
+        self.failing = failing
+
+    def get_task(self, name):
+        if name not in self.requirements:
+            raise TaskNotFound(name)
+
+        def task():
+            with self.lock:
+                self.running += 1
+                self.max_running = max(self.max_running, self.running)
+            time.sleep(self.delay)
+            with self.lock:
+                self.running -= 1
+                self.calls.append(name)
+            if name in self.failing:
+                raise ValueError(name)
+        return task
+
+    def get_requirements(self, name):
+        return self.requirements[name]
+
+
+class TestDag(unittest.TestCase):
+
+    def test_order(self):
+        registry = Registry({
+            'deploy': ['build', 'migrate'],
+            'build': ['fetch'],
+            'migrate': ['fetch'],
+            'fetch': [],
+        })
+        dag.execute(registry, ['deploy'])
+        self.assertEqual(4, len(registry.calls))
+        self.assertEqual('fetch', registry.calls[0])
+        self.assertEqual('deploy', registry.calls[-1])
+
+    def test_concurrency(self):
+        requirements = dict([('step%d' % i, []) for i in range(4)])
+        requirements['all'] = sorted(requirements)
+        registry = Registry(requirements, delay=0.1)
+        dag.execute(registry, ['all'], jobs=4)
+        self.assertEqual(4, registry.max_running)
+
+        registry = Registry(requirements, delay=0.01)
+        dag.execute(registry, ['all'], jobs=1)
+        self.assertEqual(1, registry.max_running)
+
+    def test_failure(self):
+        registry = Registry({'deploy': ['build'], 'build': []}, failing=['build'])
+        self.assertRaises(ValueError, dag.execute, registry, ['deploy'])
+        self.assertEqual(['build'], registry.calls)
+
+    def test_invalid_graphs(self):
+        registry = Registry({'a': ['b'], 'b': ['c'], 'c': ['a']})
+        self.assertRaises(CyclicRequirement, dag.execute, registry, ['a'])
+        registry = Registry({'a': ['missing']})
+        self.assertRaises(TaskNotFound, dag.execute, registry, ['a'])
+        self.assertEqual([], registry.calls)
@@ -0,0 +1,145 @@
+from __future__ import absolute_import
+import unittest
+import os
+import time
+import shutil
+import tempfile
+import subprocess
+from ape import gitinfo
+
+
+def git(repo_dir, *args):
+    return subprocess.Popen(
+        ['git', '-c', 'user.name=ape', '-c', 'user.email=ape@example.com'] + list(args),
+        cwd=repo_dir,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    ).communicate()[0].strip()
+
+
+class TestGitInfo(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.repo_dir = os.path.join(self.tmpdir, 'pool')
+        for feature in ('feature_a', 'feature_b'):
+            os.makedirs(os.path.join(self.repo_dir, feature))
+            with open(os.path.join(self.repo_dir, feature, '__init__.py'), 'w') as f:
+                f.write('#%s\n' % feature)
+        git(self.repo_dir, 'init', '-q')
+        git(self.repo_dir, 'add', '.')
+        git(self.repo_dir, 'commit', '-q', '-m', 'initial')
+        self.rev = git(self.repo_dir, 'rev-parse', 'HEAD')
+        gitinfo._cache.clear()
+
+    def tearDown(self):
+        gitinfo._cache.clear()
+        shutil.rmtree(self.tmpdir)
+
+    def test_find_repository(self):
+        self.assertEqual(self.repo_dir, gitinfo.find_repository(os.path.join(self.repo_dir, 'feature_a')))
+        self.assertEqual(None, gitinfo.find_repository(self.tmpdir))
+
+    def test_describe(self):
+        with open(os.path.join(self.repo_dir, 'feature_b', '__init__.py'), 'a') as f:
+            f.write('#changed\n')
+        self.assertEqual((self.rev, 'feature_b/__init__.py'), gitinfo.describe(os.path.join(self.repo_dir, 'feature_a')))
+        self.assertEqual(gitinfo.NO_REPOSITORY, gitinfo.describe(self.tmpdir))
+
+    def assertReaderMatchesGit(self):
+        self.assertEqual(git(self.repo_dir, 'rev-parse', 'HEAD'), gitinfo.read_rev(self.repo_dir))
+        self.assertEqual(
+            git(self.repo_dir, 'diff', '--name-only').split(),
+            gitinfo.read_changes(self.repo_dir)
+        )
+
+    def test_reader(self):
+        self.assertReaderMatchesGit()
+        self.assertEqual([], gitinfo.read_changes(self.repo_dir))
+
+        feature_a = os.path.join(self.repo_dir, 'feature_a', '__init__.py')
+        feature_b = os.path.join(self.repo_dir, 'feature_b', '__init__.py')
+        #entries modified after the index are racy: git and the reader
+        #compare their content, whatever the resolution of the timestamps
+        future = int(time.time()) + 100
+        os.utime(feature_a, (future, future))
+        git(self.repo_dir, 'update-index', '--refresh')
+        self.assertReaderMatchesGit()
+        self.assertEqual([], gitinfo.read_changes(self.repo_dir))
+        #same size and mtime - only the content differs
+        with open(feature_a, 'w') as f:
+            f.write('#feature_x\n')
+        os.utime(feature_a, (future, future))
+        os.remove(feature_b)
+        self.assertReaderMatchesGit()
+        self.assertEqual(['feature_a/__init__.py', 'feature_b/__init__.py'], gitinfo.read_changes(self.repo_dir))
+
+        git(self.repo_dir, 'checkout', '.')
+        os.chmod(feature_a, 0755)
+        self.assertReaderMatchesGit()
+
+    def test_subsecond_change(self):
+        feature_a = os.path.join(self.repo_dir, 'feature_a', '__init__.py')
+        past = int(time.time()) - 10
+        os.utime(feature_a, (past, past))
+        git(self.repo_dir, 'update-index', '--refresh')
+        self.assertEqual([], gitinfo.read_changes(self.repo_dir))
+        #same size, same second
+        with open(feature_a, 'w') as f:
+            f.write('#feature_x\n')
+        os.utime(feature_a, (past, past + 0.5))
+        self.assertEqual(['feature_a/__init__.py'], gitinfo.read_changes(self.repo_dir))
+
+    def test_unsupported_flags(self):
+        #assume-unchanged and intent-to-add entries are left to git
+        feature_a = os.path.join(self.repo_dir, 'feature_a', '__init__.py')
+        with open(feature_a, 'a') as f:
+            f.write('#changed\n')
+        git(self.repo_dir, 'update-index', '--assume-unchanged', 'feature_a/__init__.py')
+        self.assertEqual(None, gitinfo.read_changes(self.repo_dir))
+        self.assertEqual((self.rev, git(self.repo_dir, 'diff', '--name-only') or '-'), gitinfo.probe(self.repo_dir))
+
+        git(self.repo_dir, 'update-index', '--no-assume-unchanged', 'feature_a/__init__.py')
+        with open(os.path.join(self.repo_dir, 'feature_a', 'new.py'), 'w') as f:
+            f.write('#new\n')
+        git(self.repo_dir, 'add', '-N', 'feature_a/new.py')
+        self.assertEqual(None, gitinfo.read_changes(self.repo_dir))
+
+    def test_nested_attributes(self):
+        #content changes are left to git if a .gitattributes may convert them
+        feature_b = os.path.join(self.repo_dir, 'feature_b', '__init__.py')
+        future = int(time.time()) + 100
+        with open(feature_b, 'w') as f:
+            f.write('#feature_x\n')
+        os.utime(feature_b, (future, future))
+        self.assertEqual(['feature_b/__init__.py'], gitinfo.read_changes(self.repo_dir))
+        with open(os.path.join(self.repo_dir, 'feature_a', '.gitattributes'), 'w') as f:
+            f.write('* text\n')
+        self.assertEqual(['feature_b/__init__.py'], gitinfo.read_changes(self.repo_dir))
+        with open(os.path.join(self.repo_dir, 'feature_b', '.gitattributes'), 'w') as f:
+            f.write('* text\n')
+        self.assertEqual(None, gitinfo.read_changes(self.repo_dir))
+
+    def test_refs(self):
+        git(self.repo_dir, 'checkout', '-q', '-b', 'other')
+        git(self.repo_dir, 'commit', '-q', '--allow-empty', '-m', 'second')
+        self.assertReaderMatchesGit()
+        git(self.repo_dir, 'pack-refs', '--all')
+        self.assertFalse(os.path.exists(os.path.join(self.repo_dir, '.git', 'refs', 'heads', 'other')))
+        self.assertReaderMatchesGit()
+        git(self.repo_dir, 'checkout', '-q', self.rev)
+        self.assertEqual(self.rev, gitinfo.read_rev(self.repo_dir))
+
+    def test_worktree(self):
+        worktree_dir = os.path.join(self.tmpdir, 'worktree')
+        git(self.repo_dir, 'worktree', 'add', '-q', '-b', 'wt', worktree_dir)
+        self.assertEqual(self.rev, gitinfo.read_rev(worktree_dir))
+        self.assertEqual([], gitinfo.read_changes(worktree_dir))
+
+    def test_prefetch(self):
+        gitinfo.prefetch([
+            os.path.join(self.repo_dir, 'feature_a'),
+            os.path.join(self.repo_dir, 'feature_b'),
+            self.tmpdir,
+        ])
+        self.assertEqual({self.repo_dir: (self.rev, '-')}, gitinfo._cache)
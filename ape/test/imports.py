@@ -0,0 +1,64 @@
+from __future__ import absolute_import
+import sys
+import json
+import shutil
+import unittest
+import tempfile
+import subprocess
+from ape.test import bench
+
+#modules ape must not import before they are needed
+DEFERRED_MODULES = ('argparse', 'inspect', 'featuremonkey', 'tempfile', 'threading', 'subprocess')
+
+#runs ape with the given arguments, the loaded modules are written to stderr
+SCRIPT = '''
+import sys, json
+sys.argv = ['ape'] + sys.argv[1:]
+from ape import main
+main.main()
+sys.stderr.write(json.dumps(sorted(sys.modules)))
+'''
+
+
+def get_loaded_modules(argv, env=None):
+    process = subprocess.Popen(
+        [sys.executable, '-c', SCRIPT] + argv,
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(stderr)
+    return json.loads(stderr)
+
+
+class TestImports(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='ape-imports-')
+        bench.create_aperoot(self.root, containers=1, products=1, features=2, tasks=2)
+        self.env = bench.get_environment(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_import(self):
+        process = subprocess.Popen(
+            [sys.executable, '-c', 'import sys, ape.main; print sorted(sys.modules)'],
+            env=self.env, stdout=subprocess.PIPE
+        )
+        modules = process.communicate()[0]
+        for name in DEFERRED_MODULES:
+            self.assertFalse("'%s'" % name in modules, name)
+
+    def test_help_from_index(self):
+        #populate the task index
+        get_loaded_modules(['help'], self.env)
+        modules = get_loaded_modules(['help'], self.env)
+        for name in DEFERRED_MODULES:
+            self.assertFalse(name in modules, name)
+        self.assertFalse('benchfeature0' in modules)
+
+    def test_task(self):
+        modules = get_loaded_modules(['task0'], self.env)
+        self.assertTrue('featuremonkey' in modules)
+        self.assertTrue('benchfeature1.tasks' in modules)
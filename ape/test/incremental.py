@@ -0,0 +1,117 @@
+from __future__ import absolute_import
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from ape import incremental
+from .base import SilencedTest
+
+
+class TestIncremental(SilencedTest, unittest.TestCase):
+
+    def setUp(self):
+        super(TestIncremental, self).setUp()
+        self.product_dir = tempfile.mkdtemp()
+        self.old_environ = dict(os.environ)
+        os.environ['PRODUCT_DIR'] = self.product_dir
+        os.environ.pop('APE_FORCE', None)
+        os.mkdir(os.path.join(self.product_dir, 'src'))
+        self.write('src/a.txt', 'a')
+        self.write('src/b.txt', 'b')
+        self.calls = []
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.old_environ)
+        shutil.rmtree(self.product_dir)
+        super(TestIncremental, self).tearDown()
+
+    def write(self, path, content, mtime=1000000):
+        path = os.path.join(self.product_dir, path)
+        with open(path, 'w') as f:
+            f.write(content)
+        os.utime(path, (mtime, mtime))
+
+    def build(self, target='out.txt'):
+        '''concatenates the sources'''
+        self.calls.append(target)
+        self.write(target, 'ab')
+
+    def make_task(self, **options):
+        options.setdefault('inputs', ['src'])
+        options.setdefault('outputs', ['out.txt'])
+        return incremental.make_incremental('build', self.build, **options)
+
+    def test_skip_unchanged(self):
+        task = self.make_task()
+        task()
+        task()
+        self.assertEqual(['out.txt'], self.calls)
+        self.assertTrue('Task "build" is up to date - skipped' in sys.stdout.getvalue())
+
+    def test_changed_inputs_and_outputs(self):
+        task = self.make_task()
+        task()
+        self.write('src/a.txt', 'changed', mtime=2000000)
+        task()
+        self.assertEqual(2, len(self.calls))
+        os.remove(os.path.join(self.product_dir, 'out.txt'))
+        task()
+        self.assertEqual(3, len(self.calls))
+        self.write('src/c.txt', 'new')
+        task()
+        self.assertEqual(4, len(self.calls))
+
+    def test_arguments(self):
+        task = self.make_task(outputs=['*.txt'])
+        task()
+        task(target='other.txt')
+        task()
+        self.assertEqual(['out.txt', 'other.txt', 'out.txt'], self.calls)
+
+    def test_content(self):
+        task = self.make_task(content=True)
+        task()
+        #touched but unchanged
+        self.write('src/a.txt', 'a', mtime=2000000)
+        task()
+        self.assertEqual(1, len(self.calls))
+
+    def test_failure_and_force(self):
+        task = self.make_task(inputs=['missing/*'])
+        task()
+        task()
+        self.assertEqual(2, len(self.calls))
+
+        task = self.make_task()
+        task()
+        os.environ['APE_FORCE'] = '1'
+        task()
+        self.assertEqual(4, len(self.calls))
+
+    def test_wrapped(self):
+        task = self.make_task()
+        self.assertEqual(self.build.__doc__, task.__doc__)
+        self.assertEqual(self.build, task.__wrapped__)
+
+    def test_decorator_order(self):
+        from ape import Tasks
+        registry = Tasks()
+        try:
+
+            @registry.incremental(inputs=['src'])
+            @registry.register
+            def incremental_above():
+                pass
+
+            @registry.register
+            @registry.incremental(inputs=['src'])
+            def incremental_below():
+                pass
+
+            self.assertEqual(['incremental_above', 'incremental_below'], sorted(registry._incremental))
+        finally:
+            for name in ('incremental_above', 'incremental_below'):
+                if hasattr(registry._tasks, name):
+                    delattr(registry._tasks, name)
@@ -0,0 +1,240 @@
+from __future__ import absolute_import
+import unittest
+import os
+import sys
+import time
+import subprocess
+from ape import index
+from ape.main import run
+from .base import SilencedTest, CacheTest
+
+
+class TestTaskIndex(CacheTest, SilencedTest, unittest.TestCase):
+
+    def setUp(self):
+        super(TestTaskIndex, self).setUp()
+        feature_dir = os.path.join(self.tmpdir, 'indexedfeature')
+        os.mkdir(feature_dir)
+        open(os.path.join(feature_dir, '__init__.py'), 'w').close()
+        self.tasks_file = os.path.join(feature_dir, 'tasks.py')
+        with open(self.tasks_file, 'w') as f:
+            f.write('from ape import tasks\n')
+        sys.path.insert(0, self.tmpdir)
+
+    def tearDown(self):
+        sys.path.remove(self.tmpdir)
+        super(TestTaskIndex, self).tearDown()
+
+    def make_index(self, features):
+        return index.TaskIndex(
+            index.get_fingerprint(features),
+            'docs',
+            {
+                'foo': dict(signature='foo(a, b=1)', spec=None, doc='foo task\n\nmore', file='foo.py', helper=False),
+                'bar': dict(signature='bar()', spec=None, doc=None, file='bar.py', helper=True),
+            }
+        )
+
+    def test_find_module_file(self):
+        self.assertEqual(self.tasks_file, index.find_module_file('indexedfeature.tasks'))
+        self.assertEqual(
+            os.path.join(self.tmpdir, 'indexedfeature', '__init__.py'),
+            index.find_module_file('indexedfeature')
+        )
+        self.assertEqual(None, index.find_module_file('indexedfeature.missing'))
+        self.assertEqual(None, index.find_module_file('indexedfeature.tasks.sub'))
+        self.assertFalse('indexedfeature' in sys.modules)
+
+    def test_store_and_load(self):
+        features = ['indexedfeature']
+        fingerprint = index.get_fingerprint(features)
+        self.assertEqual(None, index.load(features, fingerprint))
+        index.store(self.make_index(features), features)
+        loaded = index.load(features, fingerprint)
+        self.assertTrue(loaded.has_task('foo'))
+        self.assertTrue(loaded.has_task('bar'))
+        self.assertFalse(loaded.has_task('bar', include_helpers=False))
+        self.assertFalse(loaded.has_task('baz'))
+        self.assertEqual(None, index.load(['otherfeature'], fingerprint))
+
+    def test_invalidation(self):
+        features = ['indexedfeature']
+        index.store(self.make_index(features), features)
+        with open(self.tasks_file, 'a') as f:
+            f.write('#changed\n')
+        future = time.time() + 10
+        os.utime(self.tasks_file, (future, future))
+        self.assertEqual(None, index.load(features, index.get_fingerprint(features)))
+
+    def test_disabled(self):
+        os.environ['APE_NO_CACHE'] = '1'
+        self.assertEqual(None, index.get_cache_dir())
+        features = ['indexedfeature']
+        index.store(self.make_index(features), features)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'cache')))
+
+    def test_help_from_index(self):
+        self.make_index([]).help()
+        output = sys.stdout.getvalue()
+        self.assertTrue('foo(a, b=1)\n    foo task\n' in output)
+        self.assertFalse('bar()' in output)
+
+    def test_required_features(self):
+        task_index = index.TaskIndex(None, 'docs', {}, [
+            ('base', ['foo', 'conf']),
+            ('other', ['bar']),
+            ('refining', ['baz', 'foo']),
+            ('configuring', ['conf']),
+        ])
+        features, names = task_index.get_required_features('baz')
+        self.assertEqual(['base', 'refining', 'configuring'], features)
+        self.assertEqual(set(['baz', 'foo', 'conf']), names)
+        self.assertEqual((['other'], set(['bar'])), task_index.get_required_features('bar'))
+        self.assertEqual(([], set(['help'])), task_index.get_required_features('help'))
+
+    def test_run_without_composition(self):
+        #the index answers help and lookup - the feature is never imported
+        features = ['nonexistingfeature']
+        index.store(self.make_index(features), features)
+        run(['ape', 'help'], features=features)
+        self.assertTrue('foo(a, b=1)' in sys.stdout.getvalue())
+        run(['ape', 'baz'], features=features)
+        self.assertTrue('Task "baz" not found!' in sys.stdout.getvalue())
+
+    def test_changed_features(self):
+        old = [['ape', '0.5', 'a', 1, 1], ['f1', None, 'b', 1, 1], ['f2', None, 'c', 1, 1]]
+        new = [['ape', '0.5', 'a', 1, 1], ['f1', None, 'b', 2, 1], ['f2', None, 'c', 1, 1]]
+        self.assertEqual(['f1'], index.get_changed_features(old, new))
+        self.assertEqual([], index.get_changed_features(old, old))
+        self.assertEqual(None, index.get_changed_features(old, new[:2]))
+        self.assertEqual(None, index.get_changed_features(old, [['ape', '0.6', 'a', 1, 1]] + new[1:]))
+
+    def test_refresh_rejects_foreign_names(self):
+
+        class Registry(object):
+            _tasks = None
+            def get_tasks(self, include_helpers=False):
+                return []
+            def is_helper(self, name):
+                return False
+            def get_composition(self):
+                return [('changed.tasks', ['foo', 'bar'])]
+
+        task_index = index.TaskIndex([['ape'], ['changed'], ['other']], 'docs', {}, [
+            ('changed', ['foo']),
+            ('other', ['bar']),
+        ])
+        self.assertEqual(None, task_index.refresh(Registry(), ['changed']))
+
+    def test_run_refreshes_outdated_index(self):
+        #only the changed feature is composed - in a child process
+        features = ['indexedfeature', 'nonexistingfeature']
+        task_index = self.make_index(features)
+        task_index.fingerprint[1][3] -= 10
+        task_index.features = [('indexedfeature', ['foo']), ('nonexistingfeature', ['bar'])]
+        index.store(task_index, features)
+        with open(self.tasks_file, 'a') as f:
+            f.write(
+                'def introduce_foo():\n'
+                '    def foo(x):\n'
+                '        """refreshed foo"""\n'
+                '    return foo\n'
+                '@tasks.register\n'
+                'def baz():\n'
+                '    """new baz"""\n'
+            )
+
+        run(['ape', 'help'], features=features)
+        output = sys.stdout.getvalue()
+        self.assertTrue('foo(x)\n    refreshed foo\n' in output)
+        self.assertTrue('baz()\n    new baz\n' in output)
+        self.assertFalse('indexedfeature' in sys.modules)
+
+        refreshed, fingerprint = index.load_current(features)
+        self.assertEqual(
+            [['indexedfeature', ['baz', 'foo']], ['nonexistingfeature', ['bar']]],
+            refreshed.features
+        )
+        self.assertTrue(refreshed.has_task('bar'))
+
+    def test_helper_modules(self):
+        #tasks introduced by modules tasks imports invalidate the index as well
+        features = ['indexedfeature']
+        helper_file = os.path.join(self.tmpdir, 'indexedfeature', 'helpers.py')
+        with open(helper_file, 'w') as f:
+            f.write('def introduce_old():\n    def old():\n        """old task"""\n    return old\n')
+        with open(self.tasks_file, 'a') as f:
+            f.write('from indexedfeature.helpers import *\n')
+        env = dict(os.environ, PRODUCT_EQUATION='indexedfeature', PYTHONPATH=os.pathsep.join(sys.path))
+        process = subprocess.Popen([sys.executable, '-m', 'ape.main', 'help'], env=env, stdout=subprocess.PIPE)
+        self.assertTrue('old()' in process.communicate()[0])
+        task_index, fingerprint = index.load_current(features)
+        self.assertTrue(task_index.has_task('old'))
+        self.assertTrue(helper_file in [entry[0] for entry in fingerprint[1][5]])
+
+        with open(helper_file, 'w') as f:
+            f.write('def introduce_newtask():\n    def newtask():\n        """new task"""\n    return newtask\n')
+        past = time.time() - 10
+        os.utime(helper_file, (past, past))
+        self.assertEqual(None, index.load_current(features)[0])
+
+    def test_lazy_feature_selection(self):
+        #lazily composed tasks see the whole selection
+        other_dir = os.path.join(self.tmpdir, 'otherfeature')
+        os.mkdir(other_dir)
+        open(os.path.join(other_dir, '__init__.py'), 'w').close()
+        with open(os.path.join(other_dir, 'tasks.py'), 'w') as f:
+            f.write('def introduce_other():\n    def other():\n        pass\n    return other\n')
+        with open(self.tasks_file, 'a') as f:
+            f.write(
+                'def introduce_show():\n'
+                '    def show():\n'
+                '        print tasks.FEATURE_SELECTION\n'
+                '    return show\n'
+            )
+        env = dict(os.environ, PRODUCT_EQUATION='indexedfeature otherfeature', PYTHONPATH=os.pathsep.join(sys.path))
+        subprocess.Popen([sys.executable, '-m', 'ape.main', 'help'], env=env, stdout=subprocess.PIPE).communicate()
+        env['APE_LAZY_COMPOSITION'] = '1'
+        process = subprocess.Popen([sys.executable, '-m', 'ape.main', 'show'], env=env, stdout=subprocess.PIPE)
+        self.assertEqual("['indexedfeature.tasks', 'otherfeature.tasks']\n", process.communicate()[0])
+
+    def test_str_defaults(self):
+        #defaults bound from the index are the str defaults of the task
+        with open(self.tasks_file, 'w') as f:
+            f.write(
+                '# -*- coding: utf-8 -*-\n'
+                'def introduce_greet():\n'
+                '    def greet(name="world"):\n'
+                '        print type(name).__name__, "Gr\\xc3\\xbc\\xc3\\x9fe " + name\n'
+                '    return greet\n'
+            )
+        env = dict(os.environ, PRODUCT_EQUATION='indexedfeature', PYTHONPATH=os.pathsep.join(sys.path))
+        for attempt in range(2):
+            process = subprocess.Popen([sys.executable, '-m', 'ape.main', 'greet'], env=env, stdout=subprocess.PIPE)
+            self.assertEqual('str Gr\xc3\xbc\xc3\x9fe world\n', process.communicate()[0])
+            self.assertEqual(0, process.returncode)
+        task_index, fingerprint = index.load_current(['indexedfeature'])
+        self.assertEqual(['world'], task_index.get_spec('greet')['defaults'])
+
+    def test_storable(self):
+        self.assertTrue(index._is_storable(['a', 1, 1.5, None, True, {'b': ['c']}]))
+        self.assertTrue(index._is_storable(['Gr\xc3\xbc\xc3\x9fe']))
+        self.assertFalse(index._is_storable([u'a']))
+        self.assertFalse(index._is_storable([('a',)]))
+        self.assertFalse(index._is_storable([{1: 'a'}]))
+        self.assertFalse(index._is_storable(['\xff']))
+        self.assertFalse(index._is_storable([object()]))
+
+    def test_non_ascii_help(self):
+        #docs read back from the index are printed as the utf-8 str they were
+        features = ['indexedfeature']
+        task_index = self.make_index(features)
+        task_index.tasks['foo']['doc'] = 'Gr\xc3\xbc\xc3\x9fe task'
+        task_index.tasks['foo']['file'] = '/f\xc3\xbc\xc3\x9fe/tasks.py'
+        index.store(task_index, features)
+        loaded = index.load(features)
+        loaded.help()
+        loaded.help('foo')
+        output = sys.stdout.getvalue()
+        self.assertTrue('foo(a, b=1)\n    Gr\xc3\xbc\xc3\x9fe task\n' in output)
+        self.assertTrue('defined in: /f\xc3\xbc\xc3\x9fe/tasks.py\n' in output)
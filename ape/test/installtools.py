@@ -0,0 +1,390 @@
+from __future__ import absolute_import
+import unittest
+import os
+import sys
+import json
+import shutil
+import tempfile
+from StringIO import StringIO
+from ape import installtools
+from ape.installtools import fetch, mirror, manifest, venv, template
+from ape.test.gitinfo import git
+
+
+def create_remote(root, name, branches=('master',)):
+    '''create a bare repository ``name`` with a commit per branch, returns its url'''
+    work_dir = os.path.join(root, 'work', name)
+    os.makedirs(work_dir)
+    git(work_dir, 'init', '-q')
+    for branch in branches:
+        git(work_dir, 'checkout', '-q', '-B', branch)
+        with open(os.path.join(work_dir, 'branch.txt'), 'w') as f:
+            f.write(branch)
+        git(work_dir, 'add', '.')
+        git(work_dir, 'commit', '-q', '-m', branch)
+    remote_dir = os.path.join(root, 'remotes', name + '.git')
+    git(root, 'clone', '-q', '--bare', work_dir, remote_dir)
+    return 'file://' + remote_dir
+
+
+class InstallToolsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.lib_dir = os.path.join(self.root, 'container', '_lib')
+        os.makedirs(self.lib_dir)
+        self.old_environ = dict(os.environ)
+        os.environ.pop('APE_GLOBAL_DIR', None)
+        os.environ.pop('APE_NO_MIRRORS', None)
+        self.old_stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.old_stdout
+        os.environ.clear()
+        os.environ.update(self.old_environ)
+        shutil.rmtree(self.root)
+
+    def read(self, *path):
+        with open(os.path.join(self.lib_dir, *path)) as f:
+            return f.read()
+
+
+class TestFetch(InstallToolsTestCase):
+
+    def test_fetch_pools(self):
+        pool_a = create_remote(self.root, 'pool_a', ('master', 'dev'))
+        pool_b = create_remote(self.root, 'pool_b')
+        results = fetch.fetch_pools(
+            [(pool_a, 'dev'), pool_b, (self.root + '/missing.git', 'master')],
+            jobs=2, lib_dir=self.lib_dir
+        )
+        self.assertEqual([True, True, False], [result.ok for result in results])
+        self.assertEqual('dev', self.read('pool_a', 'branch.txt'))
+        self.assertEqual('master', self.read('pool_b', 'branch.txt'))
+        self.assertEqual(os.path.join(self.lib_dir, 'pool_b'), results[1].pool.pool_dir)
+        self.assertEqual(None, results[2].pool)
+        self.assertTrue('ERROR: missing (master)' in sys.stdout.getvalue())
+
+        #existing repositories are reported, not overwritten
+        result = fetch.fetch_pools([pool_b], lib_dir=self.lib_dir)[0]
+        self.assertEqual('repository already exists', result.error)
+
+    def test_shallow(self):
+        pool_a = create_remote(self.root, 'pool_a', ('master', 'dev'))
+        result = fetch.fetch_pools([(pool_a, 'dev')], depth=1, lib_dir=self.lib_dir)[0]
+        self.assertTrue(result.ok)
+        pool_dir = os.path.join(self.lib_dir, 'pool_a')
+        self.assertEqual('1', git(pool_dir, 'rev-list', '--count', 'HEAD'))
+        self.assertEqual('origin/dev', git(pool_dir, 'branch', '-r').split()[-1])
+
+    def test_commit(self):
+        pool_a = create_remote(self.root, 'pool_a', ('master', 'dev'))
+        rev = git(os.path.join(self.root, 'work', 'pool_a'), 'rev-parse', 'master')
+        result = fetch.fetch_pools([(pool_a, rev)], depth=1, single_branch=True, lib_dir=self.lib_dir)[0]
+        self.assertTrue(result.ok)
+        self.assertEqual(rev, git(os.path.join(self.lib_dir, 'pool_a'), 'rev-parse', 'HEAD'))
+        self.assertEqual('master', self.read('pool_a', 'branch.txt'))
+
+        result = fetch.fetch_pools([(pool_a, 'missing')], lib_dir=os.path.join(self.root, 'other'))[0]
+        self.assertFalse(result.ok)
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'other', 'pool_a')))
+
+
+    def test_update_revisions(self):
+        #pools pinned to tags or commits are updated as well as branches
+        pool_a = create_remote(self.root, 'pool_a', ('master', 'dev'))
+        work_dir = os.path.join(self.root, 'work', 'pool_a')
+        git(work_dir, 'tag', 'v1', 'master')
+        git(work_dir, 'push', '-q', pool_a, 'v1')
+        pool_dir = os.path.join(self.lib_dir, 'pool_a')
+        self.assertTrue(fetch.fetch_pools([(pool_a, 'dev')], single_branch=True, lib_dir=self.lib_dir)[0].ok)
+
+        self.assertTrue(fetch.fetch_pools([(pool_a, 'v1')], lib_dir=self.lib_dir, update=True)[0].ok)
+        self.assertEqual('master', self.read('pool_a', 'branch.txt'))
+        rev = git(work_dir, 'rev-parse', 'dev')
+        self.assertTrue(fetch.fetch_pools([(pool_a, rev)], lib_dir=self.lib_dir, update=True)[0].ok)
+        self.assertEqual(rev, git(pool_dir, 'rev-parse', 'HEAD'))
+        self.assertTrue(fetch.fetch_pools([(pool_a, 'master')], lib_dir=self.lib_dir, update=True)[0].ok)
+        self.assertEqual('refs/heads/master', git(pool_dir, 'symbolic-ref', 'HEAD'))
+        self.assertEqual('master', self.read('pool_a', 'branch.txt'))
+
+        result = fetch.fetch_pools([(pool_a, 'missing')], lib_dir=self.lib_dir, update=True)[0]
+        self.assertEqual('unknown revision missing', result.error)
+
+
+class TestMirror(InstallToolsTestCase):
+
+    def test_mirror(self):
+        os.environ['APE_GLOBAL_DIR'] = os.path.join(self.root, '_ape')
+        mirror_dir = mirror.get_mirror_dir()
+        pool_a = create_remote(self.root, 'pool_a', ('master', 'dev'))
+        result = fetch.fetch_pools([(pool_a, 'dev')], lib_dir=self.lib_dir)[0]
+        self.assertTrue(result.ok)
+        mirror_path = mirror.get_mirror_path(pool_a, mirror_dir)
+        self.assertTrue(os.path.isdir(mirror_path))
+        pool_dir = os.path.join(self.lib_dir, 'pool_a')
+        self.assertEqual(pool_a, git(pool_dir, 'config', 'remote.origin.url'))
+        self.assertEqual('dev', self.read('pool_a', 'branch.txt'))
+
+        #a sibling container gets the commits pushed meanwhile
+        work_dir = os.path.join(self.root, 'work', 'pool_a')
+        with open(os.path.join(work_dir, 'branch.txt'), 'w') as f:
+            f.write('dev 2')
+        git(work_dir, 'commit', '-q', '-a', '-m', 'second')
+        git(work_dir, 'push', '-q', pool_a, 'dev')
+        self.lib_dir = os.path.join(self.root, 'sibling', '_lib')
+        os.makedirs(self.lib_dir)
+        self.assertTrue(fetch.fetch_pools([(pool_a, 'dev')], lib_dir=self.lib_dir)[0].ok)
+        self.assertEqual('dev 2', self.read('pool_a', 'branch.txt'))
+        self.assertEqual(git(work_dir, 'rev-parse', 'HEAD'), git(mirror_path, 'rev-parse', 'dev'))
+
+        os.environ['APE_NO_MIRRORS'] = '1'
+        self.assertEqual(None, mirror.get_mirror_dir())
+
+    def test_unreachable(self):
+        mirror_dir = os.path.join(self.root, 'mirrors')
+        path, output = mirror.update(self.root + '/missing.git', mirror_dir)
+        self.assertEqual(None, path)
+        self.assertEqual([], [name for name in os.listdir(mirror_dir) if not name.endswith('.lock')])
+
+
+class FakeVirtualEnv(venv.VirtualEnv):
+
+    def __init__(self):
+        venv.VirtualEnv.__init__(self, '/venv')
+        self.installed = []
+
+    def _install(self, args):
+        self.installed.append(args)
+
+    def get_paths(self):
+        return ['/venv', '/venv/site-packages']
+
+
+class TestInstall(InstallToolsTestCase):
+
+    def setUp(self):
+        super(TestInstall, self).setUp()
+        os.environ['CONTAINER_DIR'] = os.path.dirname(self.lib_dir)
+        self.pool_a = create_remote(self.root, 'pool_a', ('master', 'dev'))
+        self.pool_b = create_remote(self.root, 'pool_b')
+        with open(os.path.join(self.root, 'container', 'requirements.txt'), 'w') as f:
+            f.write('six\n')
+        self.venv = FakeVirtualEnv()
+        self.requirements = ['-r', os.path.join(self.root, 'container', 'requirements.txt')]
+
+    def install(self, pools, **kws):
+        manifest.install(pools, ['requirements.txt'], ['pool_a/features'], venv=self.venv, **kws)
+        with open(os.path.join(self.lib_dir, 'paths.json')) as f:
+            return json.load(f)
+
+    def test_install(self):
+        paths = self.install([self.pool_a, self.pool_b])
+        self.assertEqual(['/venv', '/venv/site-packages', os.path.join(self.lib_dir, 'pool_a/features')], paths)
+        self.assertEqual([self.requirements], self.venv.installed)
+        self.assertEqual('master', self.read('pool_a', 'branch.txt'))
+
+        #nothing changed - nothing is done
+        os.utime(os.path.join(self.lib_dir, 'paths.json'), (0, 1000000))
+        sys.stdout = StringIO()
+        self.install([self.pool_a, self.pool_b])
+        self.assertEqual('... container installed\n', sys.stdout.getvalue())
+        self.assertEqual(1000000, os.stat(os.path.join(self.lib_dir, 'paths.json')).st_mtime)
+        self.assertEqual([self.requirements], self.venv.installed)
+
+        #changed branch and requirements, removed pool
+        with open(os.path.join(self.root, 'container', 'requirements.txt'), 'a') as f:
+            f.write('requests\n')
+        self.install([(self.pool_a, 'dev')])
+        self.assertEqual('dev', self.read('pool_a', 'branch.txt'))
+        self.assertFalse(os.path.exists(os.path.join(self.lib_dir, 'pool_b')))
+        self.assertEqual([self.requirements] * 2, self.venv.installed)
+        self.assertEqual(['pool_a'], sorted(manifest.read_manifest(self.lib_dir)['pools']))
+
+    def test_without_venv(self):
+        self.venv = False
+        paths = self.install([self.pool_a])
+        self.assertEqual([os.path.join(self.lib_dir, 'venv'), os.path.join(self.lib_dir, 'pool_a/features')], paths)
+
+    def test_adopt(self):
+        #cloned by an install script using fetch_pool
+        git(self.lib_dir, 'clone', '-q', '-b', 'master', self.pool_a)
+        with open(os.path.join(self.lib_dir, 'pool_a', 'local.txt'), 'w') as f:
+            f.write('local')
+        self.install([self.pool_a])
+        self.assertEqual('local', self.read('pool_a', 'local.txt'))
+        self.assertEqual(['pool_a'], sorted(manifest.read_manifest(self.lib_dir)['pools']))
+
+        #local work is neither reset nor removed
+        self.assertRaises(SystemExit, self.install, [(self.pool_a, 'dev')])
+        self.assertEqual('master', self.read('pool_a', 'branch.txt'))
+        self.assertRaises(SystemExit, self.install, [self.pool_b])
+        self.assertEqual('local', self.read('pool_a', 'local.txt'))
+        self.assertTrue('pool_a' in manifest.read_manifest(self.lib_dir)['pools'])
+
+        #unpushed commits are local work as well
+        pool_dir = os.path.join(self.lib_dir, 'pool_a')
+        git(pool_dir, 'add', 'local.txt')
+        git(pool_dir, 'commit', '-q', '-m', 'local')
+        self.assertRaises(SystemExit, self.install, [(self.pool_a, 'dev')])
+        self.assertEqual('master', self.read('pool_a', 'branch.txt'))
+
+    def test_repin(self):
+        #pools are pinned to other commits or tags in place
+        work_dir = os.path.join(self.root, 'work', 'pool_a')
+        git(work_dir, 'tag', 'v1', 'master')
+        git(work_dir, 'push', '-q', self.pool_a, 'v1')
+        self.install([(self.pool_a, git(work_dir, 'rev-parse', 'master'))])
+        self.assertEqual('master', self.read('pool_a', 'branch.txt'))
+        rev = git(work_dir, 'rev-parse', 'dev')
+        self.install([(self.pool_a, rev)])
+        self.assertEqual('dev', self.read('pool_a', 'branch.txt'))
+        self.install([(self.pool_a, 'v1')])
+        self.assertEqual('master', self.read('pool_a', 'branch.txt'))
+        self.assertEqual(dict(url=self.pool_a, branch='v1'), manifest.read_manifest(self.lib_dir)['pools']['pool_a'])
+        self.install([(self.pool_a, 'v1')], update=True)
+        self.assertEqual('master', self.read('pool_a', 'branch.txt'))
+
+    def test_foreign_directory(self):
+        git(self.lib_dir, 'clone', '-q', self.pool_b, 'pool_a')
+        self.assertRaises(SystemExit, self.install, [self.pool_a])
+        self.assertTrue('is not a clone of %s' % self.pool_a in sys.stdout.getvalue())
+        self.assertEqual('master', self.read('pool_a', 'branch.txt'))
+        self.assertEqual(self.pool_b, git(os.path.join(self.lib_dir, 'pool_a'), 'config', 'remote.origin.url'))
+
+    def test_failure(self):
+        self.assertRaises(SystemExit, self.install, [self.pool_a, self.root + '/missing.git'])
+        recorded = manifest.read_manifest(self.lib_dir)
+        self.assertEqual(dict(pool_a=dict(url=self.pool_a, branch='master')), recorded['pools'])
+        self.assertEqual([], self.venv.installed)
+
+
+#logs its arguments, installs with --no-index fail until "pip wheel" ran
+FAKE_PIP = """#!/bin/sh
+echo "$@" >> "$PIP_LOG"
+if [ "$1" = "wheel" ]; then touch "$3/built.whl"; fi
+if [ "$1" = "install" -a "$2" = "--no-index" -a ! -f "$4/built.whl" ]; then exit 1; fi
+exit 0
+"""
+
+
+class TestVirtualEnv(InstallToolsTestCase):
+
+    def setUp(self):
+        super(TestVirtualEnv, self).setUp()
+        os.environ['CONTAINER_DIR'] = os.path.dirname(self.lib_dir)
+        self.venv_dir = os.path.join(self.lib_dir, 'venv')
+        os.makedirs(os.path.join(self.venv_dir, 'bin'))
+        pip = os.path.join(self.venv_dir, 'bin', 'pip')
+        with open(pip, 'w') as f:
+            f.write(FAKE_PIP)
+        os.chmod(pip, 0755)
+        os.environ['PIP_LOG'] = os.path.join(self.root, 'pip.log')
+
+    def get_calls(self):
+        with open(os.environ['PIP_LOG']) as f:
+            calls = f.read().splitlines()
+        os.remove(os.environ['PIP_LOG'])
+        return calls
+
+    def test_batch(self):
+        virtualenv = venv.VirtualEnv(self.venv_dir)
+        with virtualenv.batch():
+            virtualenv.pip_install('https://example.com/pool.git')
+            with virtualenv.batch():
+                virtualenv.pip_install_requirements('requirements.txt')
+        requirements = os.path.join(self.root, 'container', 'requirements.txt')
+        self.assertEqual(
+            ['install -e git+https://example.com/pool.git -r %s' % requirements],
+            self.get_calls()
+        )
+        virtualenv.pip_install_requirements('requirements.txt')
+        self.assertEqual(['install -r %s' % requirements], self.get_calls())
+
+    def test_wheelhouse(self):
+        os.environ['APE_GLOBAL_DIR'] = os.path.join(self.root, '_ape')
+        wheelhouse = venv.get_wheelhouse()
+        virtualenv = venv.VirtualEnv(self.venv_dir, wheelhouse)
+        virtualenv.pip_install_requirements('requirements.txt')
+        requirements = os.path.join(self.root, 'container', 'requirements.txt')
+        offline = 'install --no-index --find-links %s -r %s' % (wheelhouse, requirements)
+        self.assertEqual([
+            offline,
+            'wheel --wheel-dir %s --find-links %s -r %s' % (wheelhouse, wheelhouse, requirements),
+            offline,
+        ], self.get_calls())
+        #the wheels are built once
+        virtualenv.pip_install_requirements('requirements.txt')
+        self.assertEqual([offline], self.get_calls())
+
+
+class TestTemplate(InstallToolsTestCase):
+
+    def setUp(self):
+        super(TestTemplate, self).setUp()
+        os.environ['CONTAINER_DIR'] = os.path.dirname(self.lib_dir)
+        os.environ['APE_GLOBAL_DIR'] = os.path.join(self.root, '_ape')
+        with open(os.path.join(self.root, 'container', 'requirements.txt'), 'w') as f:
+            f.write('six\n')
+        #a populated virtualenv of another container
+        self.other_venv = os.path.join(self.root, 'other', '_lib', 'venv')
+        site_packages = os.path.join(self.other_venv, 'lib', 'python2.7', 'site-packages')
+        os.makedirs(os.path.join(self.other_venv, 'bin'))
+        os.makedirs(site_packages)
+        self.write(os.path.join(self.other_venv, 'bin', 'activate'), 'VIRTUAL_ENV="%s"\n' % self.other_venv)
+        self.write(os.path.join(self.other_venv, 'bin', 'python'), '\0binary %s' % self.other_venv)
+        self.write(os.path.join(site_packages, 'easy-install.pth'), self.other_venv + '/src/pool\n')
+        self.write(os.path.join(site_packages, 'six.py'), '#six\n')
+        os.symlink('lib', os.path.join(self.other_venv, 'lib64'))
+
+    def write(self, path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_clone(self):
+        template_path = template.get_template_path(['requirements.txt'], template.get_template_dir())
+        template.save(self.other_venv, template_path)
+        venv_dir = os.path.join(self.lib_dir, 'venv')
+        virtualenv = installtools.create_project_venv(['requirements.txt'])
+        self.assertEqual(venv_dir, virtualenv.venv_dir)
+        self.assertTrue('cloned from %s' % template_path in sys.stdout.getvalue())
+        #the shared wheelhouse is opt-in
+        self.assertEqual(None, virtualenv.wheelhouse)
+
+        self.assertEqual('VIRTUAL_ENV="%s"\n' % venv_dir, self.read('venv', 'bin', 'activate'))
+        self.assertEqual(venv_dir + '/src/pool\n', self.read('venv', 'lib', 'python2.7', 'site-packages', 'easy-install.pth'))
+        self.assertEqual('\0binary %s' % self.other_venv, self.read('venv', 'bin', 'python'))
+        self.assertEqual('lib', os.readlink(os.path.join(venv_dir, 'lib64')))
+        #the template is untouched
+        with open(os.path.join(template_path, 'bin', 'activate')) as f:
+            self.assertEqual('VIRTUAL_ENV="%s"\n' % template_path, f.read())
+        with open(os.path.join(self.other_venv, 'bin', 'activate')) as f:
+            self.assertEqual('VIRTUAL_ENV="%s"\n' % self.other_venv, f.read())
+
+        #other requirements have another template
+        with open(os.path.join(self.root, 'container', 'requirements.txt'), 'a') as f:
+            f.write('requests\n')
+        self.assertNotEqual(template_path, template.get_template_path(['requirements.txt'], template.get_template_dir()))
+
+    def test_key(self):
+        container_dir = os.path.join(self.root, 'container')
+        template_dir = template.get_template_dir()
+        self.write(os.path.join(container_dir, 'requirements.txt'), '-r base.txt  # shared\n--constraint=pins.txt\n')
+        self.write(os.path.join(container_dir, 'base.txt'), 'six\n')
+        self.write(os.path.join(container_dir, 'pins.txt'), 'six==1.10\n')
+        self.assertEqual(
+            [os.path.join(container_dir, name) for name in ('requirements.txt', 'base.txt', 'pins.txt')],
+            template.get_requirement_files(os.path.join(container_dir, 'requirements.txt'))
+        )
+        template_path = template.get_template_path(['requirements.txt'], template_dir)
+        self.write(os.path.join(container_dir, 'pins.txt'), 'six==1.11\n')
+        self.assertNotEqual(template_path, template.get_template_path(['requirements.txt'], template_dir))
+
+        #editable packages are never templated
+        self.write(os.path.join(container_dir, 'base.txt'), 'six\n-e ./mypackage\n')
+        self.assertEqual(None, template.get_template_path(['requirements.txt'], template_dir))
+
+    def test_disabled(self):
+        os.environ['APE_NO_VENV_TEMPLATES'] = '1'
+        self.assertEqual(None, template.get_template_dir())
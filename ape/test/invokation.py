@@ -119,3 +119,16 @@ class TestTaskInvokation(SilencedTest, unittest.TestCase):
         self.assertRaises(SystemExit, invoke_task,
             posoptparams, 'posarg1 posarg2 posarg3'.split()
         )
+
+    def test_prepare(self):
+
+        calls = []
+        def posparam(x):
+            calls.append('task')
+
+        invoke_task(posparam, 'a'.split(), prepare=lambda: calls.append('prepare'))
+        self.assertEqual(['prepare', 'task'], calls)
+
+        #requirements are not executed for invalid arguments
+        self.assertRaises(SystemExit, invoke_task, posparam, ''.split(), prepare=lambda: calls.append('prepare'))
+        self.assertEqual(['prepare', 'task'], calls)
@@ -0,0 +1,86 @@
+from __future__ import absolute_import
+import unittest
+import os
+from ape import memo, InvalidTask
+from .base import CacheTest
+
+
+class TestMemo(CacheTest, unittest.TestCase):
+
+    def setUp(self):
+        super(TestMemo, self).setUp()
+        os.environ['PRODUCT_DIR'] = '/products/a'
+        memo.clear()
+        self.calls = []
+
+    def tearDown(self):
+        memo.clear()
+        super(TestMemo, self).tearDown()
+
+    def helper(self, x=1):
+        '''records its calls'''
+        self.calls.append(x)
+        return [x]
+
+    def test_scopes(self):
+        memo.check_scope('invocation')
+        memo.check_scope('product')
+        memo.check_scope(60)
+        for scope in ('forever', 0, -1, True, None):
+            self.assertRaises(InvalidTask, memo.check_scope, scope)
+
+    def test_invocation(self):
+        helper = memo.make_memoized('helper', self.helper, 'invocation')
+        self.assertEqual([1], helper())
+        self.assertEqual([1], helper())
+        self.assertEqual([2], helper(x=2))
+        os.environ['PRODUCT_DIR'] = '/products/b'
+        helper()
+        self.assertEqual([1, 2], self.calls)
+        self.assertEqual(self.helper.__doc__, helper.__doc__)
+
+    def test_product(self):
+        helper = memo.make_memoized('helper', self.helper, 'product')
+        helper()
+        helper()
+        os.environ['PRODUCT_DIR'] = '/products/b'
+        helper()
+        self.assertEqual([1, 1], self.calls)
+
+    def test_ttl(self):
+        helper = memo.make_memoized('helper', self.helper, 3600)
+        helper()
+        #a subsequent invocation finds the stored result
+        memo.clear()
+        self.assertEqual([1], helper())
+        self.assertEqual([1], self.calls)
+
+        helper = memo.make_memoized('helper', self.helper, 0.000001)
+        helper(x=3)
+        memo.clear()
+        helper(x=3)
+        self.assertEqual([1, 3, 3], self.calls)
+
+    def test_ttl_types(self):
+        #stored results are read back with the types they were returned with
+        results = dict(text=['text', {'a': ['b', 1]}], unicode=u'text', tuple=('a', 'b'))
+        helper = memo.make_memoized('helper', lambda name: results[name], 3600)
+        for name in results:
+            helper(name)
+        memo.clear()
+        reloaded = helper('text')
+        self.assertEqual(['text', {'a': ['b', 1]}], reloaded)
+        self.assertEqual([str, str], [type(reloaded[0]), type(reloaded[1].keys()[0])])
+        self.assertEqual(None, memo.load(memo.get_product_key() + '\n' + memo.get_key('helper', ('unicode',), {})))
+        self.assertEqual(None, memo.load(memo.get_product_key() + '\n' + memo.get_key('helper', ('tuple',), {})))
+
+    def test_exceptions(self):
+
+        def failing():
+            self.calls.append(None)
+            raise ValueError()
+
+        helper = memo.make_memoized('failing', failing, 'invocation')
+        self.assertRaises(ValueError, helper)
+        self.assertRaises(ValueError, helper)
+        self.assertEqual([None, None], self.calls)
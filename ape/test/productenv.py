@@ -0,0 +1,57 @@
+from __future__ import absolute_import
+import unittest
+import os
+import json
+import subprocess
+from ape.container_mode import env
+from .base import CacheTest
+
+
+class TestProductEnv(CacheTest, unittest.TestCase):
+
+    cache_dir = os.path.join('_ape', 'cache')
+
+    def setUp(self):
+        super(TestProductEnv, self).setUp()
+        self.lib_dir = os.path.join(self.tmpdir, 'herbert', '_lib')
+        os.makedirs(os.path.join(self.tmpdir, 'herbert', 'products', 'website'))
+        os.makedirs(self.lib_dir)
+        with open(os.path.join(self.lib_dir, 'paths.json'), 'w') as f:
+            json.dump([os.path.join(self.lib_dir, 'venv'), '/site', '/pool/', '/site', '/global'], f)
+
+    def get_environment(self):
+        return dict(env.get_environment(self.tmpdir, 'herbert', 'website', '/global::/ape', '/venv'))
+
+    def test_unique_paths(self):
+        self.assertEqual(['/a', '/b/', 'c'], env.unique_paths(['/a', '', '/b/', '/a', '/b', 'c', 'c']))
+
+    def test_environment(self):
+        environment = self.get_environment()
+        container_dir = os.path.join(self.tmpdir, 'herbert')
+        self.assertEqual(
+            ['/global', '/ape', '/site', '/pool/', container_dir + '/products', container_dir + '/features'],
+            environment['_APE_ENV_PYTHONPATH'].split(':')
+        )
+        self.assertEqual('/venv', environment['_APE_ENV_VENV'])
+        self.assertEqual('', environment['_APE_ENV_CONTAINER_VENV'])
+        self.assertEqual(container_dir + '/products/website', environment['_APE_ENV_PRODUCT_DIR'])
+
+        os.makedirs(os.path.join(self.lib_dir, 'venv', 'bin'))
+        open(os.path.join(self.lib_dir, 'venv', 'bin', 'activate'), 'w').close()
+        environment = self.get_environment()
+        self.assertEqual(os.path.join(self.lib_dir, 'venv'), environment['_APE_ENV_VENV'])
+        self.assertEqual(environment['_APE_ENV_VENV'], environment['_APE_ENV_CONTAINER_VENV'])
+
+    def test_render(self):
+        environment = [('_APE_ENV_A', "it's"), ('_APE_ENV_B', '$HOME `x`')]
+        script = env.render(environment) + 'echo "$_APE_ENV_A"; echo "$_APE_ENV_B"'
+        output = subprocess.Popen(['bash', '-c', script], stdout=subprocess.PIPE).communicate()[0]
+        self.assertEqual(["it's", '$HOME `x`'], output.splitlines())
+
+    def test_store(self):
+        filename = env.get_env_filename('herbert', 'website')
+        env.store(env.render(env.get_environment(self.tmpdir, 'herbert', 'website', '', '')), filename)
+        with open(filename) as f:
+            self.assertTrue('_APE_ENV_VERSION=%d\n' % env.ENV_VERSION in f.read())
+        os.environ['APE_NO_CACHE'] = '1'
+        self.assertEqual(None, env.get_env_filename('herbert', 'website'))
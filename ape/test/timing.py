@@ -0,0 +1,63 @@
+from __future__ import absolute_import
+import unittest
+import os
+import time
+from cStringIO import StringIO
+from ape import timing
+
+
+class TestTiming(unittest.TestCase):
+
+    def setUp(self):
+        self.old_environ = dict(os.environ)
+
+    def tearDown(self):
+        timing.finish(StringIO())
+        os.environ.clear()
+        os.environ.update(self.old_environ)
+
+    def test_disabled(self):
+        os.environ.pop('APE_PROFILE', None)
+        self.assertEqual(None, timing.start())
+        self.assertFalse(timing.is_enabled())
+        with timing.phase('ignored'):
+            pass
+        out = StringIO()
+        timing.finish(out)
+        self.assertEqual('', out.getvalue())
+
+    def test_nested_phases(self):
+        os.environ['APE_PROFILE'] = '1'
+        self.assertEqual('summary', timing.start())
+
+        def deploy():
+            time.sleep(0.01)
+
+        deploy = timing.wrap_task('deploy', deploy, ['base.tasks', 'extension.tasks'])
+        with timing.phase('compose'):
+            with timing.phase('import base'):
+                pass
+        with timing.phase('execute'):
+            deploy()
+            deploy()
+
+        recorder = timing._recorder
+        self.assertEqual([
+            ('compose',),
+            ('compose', 'import base'),
+            ('execute',),
+            ('execute', 'ape.tasks.deploy (base.tasks > extension.tasks)'),
+        ], recorder.get_paths())
+        total, self_time, calls = recorder.totals[('execute',)]
+        self.assertEqual(1, calls)
+        self.assertTrue(self_time < total)
+        self.assertEqual(2, recorder.totals[recorder.get_paths()[-1]][2])
+
+        stacks = StringIO()
+        recorder.write_stacks(stacks)
+        self.assertTrue('\nexecute;ape.tasks.deploy (base.tasks > extension.tasks) ' in stacks.getvalue())
+
+        out = StringIO()
+        timing.finish(out)
+        self.assertTrue(' 1  execute\n' in out.getvalue())
+        self.assertFalse(timing.is_enabled())
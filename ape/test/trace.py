@@ -0,0 +1,71 @@
+from __future__ import absolute_import
+import unittest
+import os
+import json
+import shutil
+import tempfile
+import threading
+from ape import trace
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'trace.json')
+        self.old_environ = dict(os.environ)
+
+    def tearDown(self):
+        trace.finish(self.filename)
+        os.environ.clear()
+        os.environ.update(self.old_environ)
+        shutil.rmtree(self.tmpdir)
+
+    def test_disabled(self):
+        os.environ.pop('APE_TRACE', None)
+        self.assertEqual(None, trace.start())
+        self.assertFalse(trace.is_enabled())
+
+    def test_trace_events(self):
+        os.environ['APE_TRACE'] = self.filename
+        self.assertEqual(self.filename, trace.start())
+
+        def helper(x, y=None):
+            '''helper doc'''
+            if x == 'fail':
+                raise ValueError('failed')
+            return x
+
+        def deploy():
+            helper('a' * 500, y=1)
+            thread = threading.Thread(target=helper, args=('threaded',))
+            thread.start()
+            thread.join()
+            try:
+                helper('fail')
+            except ValueError:
+                pass
+
+        helper = trace.wrap_task('helper', helper, ['base.tasks'])
+        deploy = trace.wrap_task('deploy', deploy, ['base.tasks', 'other.tasks'])
+        self.assertEqual('helper doc', helper.__doc__)
+        deploy()
+        trace.finish(self.filename)
+
+        with open(self.filename) as f:
+            events = json.load(f)['traceEvents']
+        calls = [event for event in events if event['ph'] == 'X']
+        self.assertEqual(
+            ['ape.tasks.deploy', 'ape.tasks.helper', 'ape.tasks.helper', 'ape.tasks.helper'],
+            [event['name'] for event in calls]
+        )
+        deploy_event, first, threaded, failed = calls
+        self.assertEqual(['base.tasks', 'other.tasks'], deploy_event['args']['modules'])
+        self.assertTrue(first['ts'] >= deploy_event['ts'])
+        self.assertTrue(first['ts'] + first['dur'] <= deploy_event['ts'] + deploy_event['dur'])
+        self.assertEqual(trace.MAX_REPR_LENGTH, len(first['args']['args'][0]))
+        self.assertEqual({'y': '1'}, first['args']['kws'])
+        self.assertNotEqual(deploy_event['tid'], threaded['tid'])
+        self.assertEqual('ValueError: failed', failed['args']['exception'])
+        self.assertFalse('exception' in first['args'])
+        self.assertEqual(2, len([event for event in events if event['ph'] == 'M']))
@@ -0,0 +1,180 @@
+'''
+timing of ape invocations - enabled by ``APE_PROFILE``
+
+``APE_PROFILE=summary``
+    print the time spent in every phase to stderr.
+``APE_PROFILE=stacks``
+    additionally write the phases as collapsed stacks (one
+    ``phase;nested phase <microseconds>`` line per stack) to ``APE_PROFILE_FILE``
+    (default: ``ape-profile.folded``), as consumed by flamegraph.pl or speedscope.
+``APE_PROFILE=cprofile``
+    additionally write a cProfile dump of the invocation to ``APE_PROFILE_FILE``
+    (default: ``ape-profile.prof``), see the ``pstats`` module.
+
+Phases are the import and composition of every feature, loading the task
+index, parsing the arguments, executing requirements and the task and every
+nested call of ``ape.tasks.*`` (labelled with the task modules that introduce
+or refine the task).
+'''
+import os
+import sys
+import time
+from functools import wraps
+
+MODES = ('summary', 'stacks', 'cprofile')
+
+DEFAULT_FILENAMES = dict(
+    stacks='ape-profile.folded',
+    cprofile='ape-profile.prof',
+)
+
+
+class Recorder(object):
+    '''
+    records the duration of nested phases per thread
+
+    ``totals`` maps stacks of phase names to [total seconds, self seconds, calls],
+    where self seconds excludes the time spent in nested phases.
+    '''
+
+    def __init__(self):
+        import threading
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.totals = dict()
+        self.first_seen = dict()
+
+    def _get_stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def enter(self, name):
+        stack = self._get_stack()
+        path = tuple([frame[0] for frame in stack] + [name])
+        with self.lock:
+            self.first_seen.setdefault(path, len(self.first_seen))
+        #name, start, time spent in nested phases
+        stack.append([name, time.time(), 0.0])
+
+    def leave(self):
+        stack = self._get_stack()
+        name, start, nested = stack.pop()
+        duration = time.time() - start
+        path = tuple([frame[0] for frame in stack] + [name])
+        if stack:
+            stack[-1][2] += duration
+        with self.lock:
+            total = self.totals.setdefault(path, [0.0, 0.0, 0])
+            total[0] += duration
+            total[1] += duration - nested
+            total[2] += 1
+
+    def get_paths(self):
+        '''returns the recorded stacks, parents before their nested phases'''
+        def key(path):
+            return [self.first_seen[path[:idx + 1]] for idx in range(len(path))]
+        return sorted(self.totals, key=key)
+
+    def write_summary(self, out):
+        out.write('ape profile (ms, calls):\n')
+        for path in self.get_paths():
+            total, self_time, calls = self.totals[path]
+            out.write('%10.1f %6d  %s%s\n' % (
+                total * 1000, calls, '  ' * (len(path) - 1), path[-1]
+            ))
+
+    def write_stacks(self, out):
+        for path in self.get_paths():
+            microseconds = int(round(self.totals[path][1] * 1000000))
+            if microseconds > 0:
+                frames = [name.replace(';', ',') for name in path]
+                out.write('%s %d\n' % (';'.join(frames), microseconds))
+
+
+_recorder = None
+_mode = None
+
+
+def start():
+    '''start recording if ``APE_PROFILE`` is set, returns the mode or None'''
+    global _recorder, _mode
+    mode = os.environ.get('APE_PROFILE')
+    if not mode:
+        return None
+    if mode not in MODES:
+        mode = 'summary'
+    _recorder = Recorder()
+    _mode = mode
+    return mode
+
+
+def is_enabled():
+    return _recorder is not None
+
+
+class phase(object):
+    '''context manager recording a phase - a no-op unless profiling'''
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if _recorder is not None:
+            _recorder.enter(self.name)
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if _recorder is not None:
+            _recorder.leave()
+
+
+def wrap_task(name, task, modules):
+    '''
+    wrap ``task`` to record its calls as phase labelled with the
+    task ``modules`` that introduce or refine it
+    '''
+    label = 'ape.tasks.' + name
+    if modules:
+        label += ' (%s)' % ' > '.join(modules)
+
+    @wraps(task)
+    def timed_task(*args, **kws):
+        with phase(label):
+            return task(*args, **kws)
+
+    timed_task.__wrapped__ = task
+    return timed_task
+
+
+def run(func, *args, **kws):
+    '''call ``func`` - within cProfile if requested by ``APE_PROFILE``'''
+    if _mode != 'cprofile':
+        return func(*args, **kws)
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kws)
+    finally:
+        profiler.dump_stats(get_filename(_mode))
+
+
+def get_filename(mode):
+    '''returns the file the results of ``mode`` are written to'''
+    return os.environ.get('APE_PROFILE_FILE') or DEFAULT_FILENAMES[mode]
+
+
+def finish(out=None):
+    '''stop recording and write the results'''
+    global _recorder, _mode
+    recorder, mode = _recorder, _mode
+    _recorder = _mode = None
+    if recorder is None:
+        return
+    out = out or sys.stderr
+    recorder.write_summary(out)
+    if mode == 'stacks':
+        with open(get_filename(mode), 'w') as f:
+            recorder.write_stacks(f)
+    if mode in DEFAULT_FILENAMES:
+        out.write('ape profile written to %s\n' % get_filename(mode))
@@ -0,0 +1,120 @@
+'''
+tracing of task calls - enabled by ``APE_TRACE=<file>``
+
+Every task looked up through ``ape.tasks`` is wrapped to record its calls:
+start, duration, arguments, the task modules introducing or refining the task
+and the exception it raised (if any). Calls are written as Chrome trace events
+(https://github.com/catapult-project/catapult/blob/master/tracing/README.md)
+to ``<file>`` when ape exits; open it in chrome://tracing or Perfetto to see
+the call tree of each thread.
+'''
+import os
+import json
+import time
+from functools import wraps
+
+#arguments are recorded using repr, truncated to this length
+MAX_REPR_LENGTH = 200
+
+
+class Tracer(object):
+    '''collects trace events of task calls'''
+
+    def __init__(self):
+        import threading
+        self.events = []
+        self.lock = threading.Lock()
+        self.threads = dict()
+        self.started = time.time()
+
+    def get_thread_id(self):
+        import threading
+        ident = threading.current_thread().ident
+        with self.lock:
+            return self.threads.setdefault(ident, len(self.threads) + 1)
+
+    def add(self, name, start, end, args):
+        event = dict(
+            name=name,
+            cat='task',
+            ph='X',
+            ts=int((start - self.started) * 1000000),
+            dur=int((end - start) * 1000000),
+            pid=os.getpid(),
+            tid=self.get_thread_id(),
+            args=args,
+        )
+        with self.lock:
+            self.events.append(event)
+
+    def to_dict(self):
+        metadata = [
+            dict(name='thread_name', ph='M', pid=os.getpid(), tid=tid,
+                args=dict(name='main' if tid == 1 else 'thread %d' % tid))
+            for tid in sorted(self.threads.values())
+        ]
+        return dict(traceEvents=metadata + sorted(self.events, key=lambda e: e['ts']),
+            displayTimeUnit='ms')
+
+
+_tracer = None
+
+
+def _repr(value):
+    try:
+        text = repr(value)
+    except Exception:
+        text = '<unrepresentable %s>' % type(value).__name__
+    if len(text) > MAX_REPR_LENGTH:
+        text = text[:MAX_REPR_LENGTH - 3] + '...'
+    return text
+
+
+def start():
+    '''start tracing if ``APE_TRACE`` is set, returns the trace file or None'''
+    global _tracer
+    filename = os.environ.get('APE_TRACE')
+    if not filename:
+        return None
+    _tracer = Tracer()
+    return filename
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+def wrap_task(name, task, modules):
+    '''wrap ``task`` to record its calls'''
+
+    @wraps(task)
+    def traced_task(*args, **kws):
+        tracer = _tracer
+        if tracer is None:
+            return task(*args, **kws)
+        details = dict(modules=modules)
+        if args:
+            details['args'] = [_repr(arg) for arg in args]
+        if kws:
+            details['kws'] = dict([(key, _repr(value)) for key, value in kws.items()])
+        start = time.time()
+        try:
+            return task(*args, **kws)
+        except BaseException as e:
+            details['exception'] = '%s: %s' % (type(e).__name__, e)
+            raise
+        finally:
+            tracer.add('ape.tasks.' + name, start, time.time(), details)
+
+    traced_task.__wrapped__ = task
+    return traced_task
+
+
+def finish(filename):
+    '''stop tracing and write the trace events to ``filename``'''
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is None:
+        return
+    with open(filename, 'w') as f:
+        json.dump(tracer.to_dict(), f)